@@ -2,7 +2,14 @@ __version__ = "0.1.0"
 
 from flask import Flask
 
-from backend.controllers import parking
+from backend.controllers import (
+    init_archive,
+    init_events,
+    init_metrics,
+    lots,
+    parking,
+    restore_parking_system,
+)
 
 
 def create_app():
@@ -11,6 +18,12 @@ def create_app():
 
     # Register blueprints
     app.register_blueprint(parking, url_prefix="/parking")
+    app.register_blueprint(lots, url_prefix="/parking/<lot_id>")
+
+    init_metrics(app.config)
+    init_events(app.config)
+    init_archive(app.config)
+    restore_parking_system(app.config)
 
     return app
 
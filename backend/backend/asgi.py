@@ -0,0 +1,466 @@
+# asyncio-native serving of the parking routes, as an ASGI application:
+#
+#   uvicorn --factory backend.asgi:create_asgi_app
+#
+# Serves the same routes as the parking blueprint, through the route logic of
+# backend.controllers.routes. Mutations (init, park, unpark and their batches,
+# holds and slot updates) are queued to a single writer, which applies them
+# in order on one worker thread, a batch at a time, so the event loop never
+# waits on the parking system or on journal fsyncs. Reads run right on the
+# event loop, concurrently with the writer, so the system is thread safe, and
+# streamed listings yield to other requests between chunks.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+import backend.config
+from backend.controllers import encoding, routes
+from backend.controllers.parking import _open_journal, _system_options
+from backend.models.archive import LogArchive
+from backend.models.events import EventLog
+from backend.models.metrics import Metrics
+from backend.models.parking import ParkingSystem
+from backend.models.parkingerrs import EventsLostError, ParkingError
+
+# Same content type as the plain text responses of Flask
+TEXT_TYPE = "text/html; charset=utf-8"
+
+
+class Request:
+    __slots__ = ("method", "path", "args", "body", "content_type", "accept")
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        args: Dict[str, str],
+        body: bytes,
+        content_type: Optional[str] = None,
+        accept: Optional[str] = None,
+    ):
+        self.method = method
+        self.path = path
+        self.args = args
+        self.body = body
+        # Media type of the body, and the Accept header
+        self.content_type = content_type
+        self.accept = accept
+
+    def get_json(self):
+        # JSON body, or msgpack one, see routes.decode_body
+        return routes.decode_body(self.body, self.content_type)
+
+    @property
+    def response_type(self) -> str:
+        return encoding.negotiate(self.accept)
+
+
+def _headers(scope) -> tuple:
+    # (media type of the body, Accept header) of a request
+    content_type = accept = None
+    for name, value in scope.get("headers", ()):
+        if name == b"content-type":
+            content_type = value.decode("latin-1").split(";")[0].strip().lower()
+        elif name == b"accept":
+            accept = value.decode("latin-1")
+    return content_type, accept
+
+
+class Response:
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(self, body, status: int = 200, content_type: str = TEXT_TYPE):
+        # body is a str or bytes, or an iterator of bytes chunks to stream
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+    async def send(self, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": [(b"content-type", self.content_type.encode())],
+            }
+        )
+        if isinstance(self.body, (str, bytes)):
+            body = self.body if isinstance(self.body, bytes) else self.body.encode()
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        for chunk in self.body:
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                }
+            )
+            # Let other requests in between chunks of a large listing
+            await asyncio.sleep(0)
+        await send({"type": "http.response.body", "body": b""})
+
+
+def _data_response(request: Request, data, status: int = 200) -> Response:
+    # JSON, or msgpack for clients that accept it
+    content_type = request.response_type
+    return Response(encoding.encode(data, content_type), status, content_type)
+
+
+def _not_initialized() -> Response:
+    return Response("System not initialized", 405)
+
+
+def _error_response(exc: Exception) -> Response:
+    return Response(*routes.error_response(exc))
+
+
+def _run_batch(batch):
+    # Runs on the writer thread. Outcome of every mutation, in order.
+    outcomes = []
+    for function, args, _ in batch:
+        try:
+            outcomes.append((True, function(*args)))
+        except Exception as exc:
+            outcomes.append((False, exc))
+    return outcomes
+
+
+class ParkingApp:
+    def __init__(self, config: Optional[dict] = None):
+        self.config = {
+            name: value
+            for name, value in vars(backend.config).items()
+            if name.isupper()
+        }
+        self.config.update(config or {})
+
+        self.metrics = Metrics() if self.config.get("PARKING_METRICS") else None
+        self.events = None
+        if self.config.get("PARKING_EVENTS_CAPACITY"):
+            self.events = EventLog(self.config["PARKING_EVENTS_CAPACITY"])
+        self.archive = None
+        if self.config.get("PARKING_ARCHIVE_DIR"):
+            self.archive = LogArchive(self.config["PARKING_ARCHIVE_DIR"])
+        self.parking_system: Optional[ParkingSystem] = None
+        journal = _open_journal(self.config)
+        if journal is not None:
+            self.parking_system = journal.restore(**self._system_options())
+        if self.parking_system is not None and self.archive is not None:
+            self.archive.attach(self.parking_system)
+
+        # Created on the first mutation, in the running event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="parking-writer")
+
+        # (method, path): (handler, route name as in the blueprint)
+        self._routes = {}
+        for method, path, handler in [
+            ("POST", "/init", self.init_parking),
+            ("POST", "/slots/update", self.add_entry_points),
+            ("GET", "/", self.get_slots),
+            ("GET", "/slots", self.get_slots),
+            ("GET", "/vehicles", self.get_vehicles),
+            ("GET", "/availability", self.get_availability),
+            ("GET", "/metrics", self.get_metrics),
+            ("GET", "/events", self.get_events),
+            ("GET", "/revenue", self.get_revenue),
+            ("GET", "/history", self.get_history),
+            ("POST", "/park", self.park),
+            ("POST", "/hold", self.hold),
+            ("POST", "/hold/cancel", self.cancel_hold),
+            ("POST", "/unpark", self.unpark),
+            ("POST", "/park/batch", self.park_batch),
+            ("POST", "/unpark/batch", self.unpark_batch),
+        ]:
+            route = f"parking.{handler.__name__}"
+            self._routes[("/parking" + path, method)] = (handler, route)
+        self._paths = {path for path, _ in self._routes}
+
+    def _system_options(self) -> dict:
+        # Thread safe like for Flask: reads run on the event loop while the
+        # writer thread mutates the system
+        return dict(
+            _system_options(self.config),
+            metrics=self.metrics,
+            events=self.events,
+        )
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        if path != "/parking/" and path.endswith("/"):
+            path = path[:-1]
+        route = self._routes.get((path, scope["method"]))
+        if route is None:
+            if path in self._paths:
+                await Response("Method Not Allowed", 405).send(send)
+            else:
+                await Response("Not Found", 404).send(send)
+            return
+        handler, name = route
+
+        start = time.perf_counter()
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        # Blank arguments are kept, as Flask does
+        query = scope.get("query_string", b"").decode()
+        args = dict(parse_qsl(query, keep_blank_values=True))
+
+        try:
+            request = Request(scope["method"], path, args, body, *_headers(scope))
+            response = await handler(request)
+        except ParkingError as err:
+            # Invalid requests, see backend.controllers.routes
+            response = _error_response(err)
+        await response.send(send)
+
+        if self.metrics is not None:
+            self.metrics.observe(
+                "parking_request_seconds", time.perf_counter() - start, route=name
+            )
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def close(self) -> None:
+        # Waits for queued mutations, then stops the writer
+        if self._writer is not None:
+            await self._queue.join()
+            self._writer.cancel()
+            self._writer = None
+        if self.archive is not None:
+            self.archive.flush()
+
+    async def _write(self, function, *args):
+        # Queue a mutation to the writer and wait for its result
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._run_writer())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((function, args, future))
+        return await future
+
+    async def _run_writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Everything queued so far goes to the worker thread at once
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                outcomes = await loop.run_in_executor(self._executor, _run_batch, batch)
+            except Exception as exc:
+                outcomes = [(False, exc)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, outcomes):
+                if not future.done():
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                self._queue.task_done()
+
+    def _init_system(self, entry_points: int, slots, sizes, tariff) -> bool:
+        # Runs on the writer thread. False if already initialized.
+        if self.parking_system is not None:
+            return False
+        parking_system = ParkingSystem(
+            entry_points, slots, sizes, tariff=tariff, **self._system_options()
+        )
+        journal = _open_journal(self.config)
+        if journal is not None:
+            journal.attach(parking_system)
+        if self.archive is not None:
+            self.archive.attach(parking_system)
+        self.parking_system = parking_system
+        return True
+
+    async def init_parking(self, request: Request) -> Response:
+        lot = routes.read_body(routes.lot_args, request.get_json())
+        try:
+            initialized = await self._write(self._init_system, *lot)
+        except Exception as exc:
+            return _error_response(exc)
+
+        if not initialized:
+            return Response("System already initialized", 400)
+        return Response("System initialized", 201)
+
+    async def _call(self, request: Request, call_of) -> Response:
+        # Queues the routes.Call of the request body to the writer
+        parking_system = self.parking_system
+        if parking_system is None:
+            return _not_initialized()
+
+        call = routes.read_body(call_of, request.get_json())
+        try:
+            result = await self._write(
+                getattr(parking_system, call.operation), *call.args
+            )
+        except Exception as exc:
+            return _error_response(exc)
+        if isinstance(call.result, str):
+            return Response(call.result, 200)
+        return _data_response(request, call.result(result))
+
+    async def _expire_holds(self, parking_system: ParkingSystem) -> None:
+        # Slots of expired holds are read as vacant. Expiring them is a
+        # mutation, queued to the writer only when there is one to make.
+        if parking_system.holds_expired():
+            await self._write(parking_system.expire_holds)
+
+    async def add_entry_points(self, request: Request) -> Response:
+        return await self._call(request, routes.update_call)
+
+    async def get_slots(self, request: Request) -> Response:
+        parking_system = self.parking_system
+        if parking_system is None:
+            return _not_initialized()
+
+        page = routes.page_args(request.args, routes.SLOT_FIELDS)
+        if page is None:
+            return Response("Invalid cursor, limit or fields", 400)
+        cursor, limit, fields = page
+
+        await self._expire_holds(parking_system)
+        slots = parking_system.iter_slots(cursor)
+        content_type = request.response_type
+        return Response(
+            routes.stream_page("slots", slots, fields, limit, content_type),
+            200,
+            content_type,
+        )
+
+    async def get_vehicles(self, request: Request) -> Response:
+        parking_system = self.parking_system
+        if parking_system is None:
+            return _not_initialized()
+
+        page = routes.page_args(request.args, routes.VEHICLE_FIELDS)
+        if page is None:
+            return Response("Invalid cursor, limit or fields", 400)
+        cursor, limit, fields = page
+
+        vehicles = parking_system.iter_vehicles(cursor)
+        content_type = request.response_type
+        return Response(
+            routes.stream_page("vehicles", vehicles, fields, limit, content_type),
+            200,
+            content_type,
+        )
+
+    async def get_availability(self, request: Request) -> Response:
+        parking_system = self.parking_system
+        if parking_system is None:
+            return _not_initialized()
+
+        size, entry_point = routes.availability_args(request.args)
+        await self._expire_holds(parking_system)
+        vacant = parking_system.count_vacant(size, entry_point)
+        vacant_by_size = parking_system.get_vacant_counts(entry_point)
+        data = routes.availability_data(size, entry_point, vacant, vacant_by_size)
+        return _data_response(request, data)
+
+    async def get_metrics(self, request: Request) -> Response:
+        if self.metrics is None:
+            return Response("Metrics not enabled", 404)
+        return Response(self.metrics.render(), 200, "text/plain; version=0.0.4")
+
+    async def get_events(self, request: Request) -> Response:
+        # See the parking blueprint. Waiting for events does not hold up the
+        # event loop.
+        if self.events is None:
+            return Response("Events not enabled", 404)
+
+        args = routes.event_args(request.args, self.config["PARKING_EVENTS_MAX_WAIT"])
+        if args is None:
+            return Response("Invalid since, limit or wait", 400)
+        since, limit, wait = args
+
+        new_events = []
+        try:
+            if since is not None:
+                new_events = await self.events.wait_async(since, wait, limit)
+        except EventsLostError as err:
+            return _data_response(
+                request, dict(error=err.message, seq=self.events.seq), 410
+            )
+
+        return _data_response(
+            request, routes.events_page(self.events, since, new_events)
+        )
+
+    async def get_revenue(self, request: Request) -> Response:
+        # Queries reading chunk files run off the event loop
+        if self.archive is None:
+            return Response("Archive not enabled", 404)
+
+        args = routes.revenue_args(request.args)
+        if args is None:
+            return Response("Invalid start, end or size", 400)
+        start, end, size = args
+        revenue = await asyncio.get_running_loop().run_in_executor(
+            None, self.archive.revenue, *args
+        )
+        return _data_response(
+            request, dict(start=start, end=end, size=size, revenue=revenue)
+        )
+
+    async def get_history(self, request: Request) -> Response:
+        if self.archive is None:
+            return Response("Archive not enabled", 404)
+
+        plate_number = request.args.get("plate_number")
+        if not plate_number:
+            return Response("Invalid plate number", 400)
+        parking_logs = await asyncio.get_running_loop().run_in_executor(
+            None, self.archive.history, plate_number
+        )
+        return _data_response(
+            request, dict(plate_number=plate_number, parking_logs=parking_logs)
+        )
+
+    async def park(self, request: Request) -> Response:
+        return await self._call(request, routes.park_call)
+
+    async def hold(self, request: Request) -> Response:
+        return await self._call(request, routes.hold_call)
+
+    async def cancel_hold(self, request: Request) -> Response:
+        return await self._call(request, routes.cancel_hold_call)
+
+    async def unpark(self, request: Request) -> Response:
+        return await self._call(request, routes.unpark_call)
+
+    async def park_batch(self, request: Request) -> Response:
+        return await self._call(request, routes.park_batch_call)
+
+    async def unpark_batch(self, request: Request) -> Response:
+        return await self._call(request, routes.unpark_batch_call)
+
+
+def create_asgi_app(config: Optional[dict] = None) -> ParkingApp:
+    # config overrides settings of backend.config, like app.config in Flask
+    return ParkingApp(config)
@@ -3,3 +3,73 @@ DEBUG = True
 
 # Secret key for signing cookies
 SECRET_KEY = "secret"
+
+# Store slots in typed arrays (ArraySlotStore) instead of one Slot each, for
+# large lots
+PARKING_COMPACT_SLOTS = False
+
+# Directory of the parking journal (write-ahead log and snapshots). The
+# parking state is only kept in memory when None.
+PARKING_DATA_DIR = None
+
+# When the write-ahead log is fsynced: "always", "batch" or "os"
+PARKING_FSYNC_POLICY = "batch"
+
+# Number of operations between two snapshots
+PARKING_SNAPSHOT_EVERY = 10000
+
+# Record latencies, slots scanned, log chain lengths and errors, served in the
+# Prometheus text format at /parking/metrics. Only for the default lot, the
+# lots of /parking/<lot_id> run in worker processes.
+PARKING_METRICS = False
+
+# Worker processes the lots of /parking/<lot_id>/... are sharded across, one
+# per CPU when None. Workers start on the first request to a lot. Lots are
+# journaled under PARKING_DATA_DIR/lots, and take the slot store, eviction and
+# allocation settings of the default lot.
+PARKING_LOT_WORKERS = None
+
+# Name of a shared memory segment holding the parking state, for serving one
+# lot from several worker processes. Takes the place of the journal. Shared
+# lots have no holds, and their slots cannot be moved; setting it along with
+# PARKING_DATA_DIR, PARKING_LAYOUT_FILE, PARKING_EVENTS_CAPACITY,
+# PARKING_ARCHIVE_DIR, PARKING_EVICT_IDLE or the zone_balance strategy is an
+# error, see backend.models.sharedstate.
+PARKING_SHARED_MEMORY = None
+
+# Vehicles the shared memory segment has room for
+PARKING_SHARED_VEHICLES = 100000
+
+# Directory of the .npz lot files /parking/init may load by name, with a
+# {"file": ...} body. Loading lots by name is disabled when None.
+PARKING_BULK_LOAD_DIR = None
+
+# Lot layout file (see backend.models.layout) to serve when nothing was
+# journaled, in place of /parking/init. Processes serving the lot share its
+# pages. Journals of the lot only hold its vacancy, vehicles and holds, and
+# map the layout file again on restore, which must not change meanwhile.
+PARKING_LAYOUT_FILE = None
+
+# Slot state changes kept for /parking/events, which is disabled when None.
+# Consumers falling further behind have to list the slots again. Only for the
+# default lot.
+PARKING_EVENTS_CAPACITY = None
+
+# Longest a /parking/events request waits for new events, in seconds
+PARKING_EVENTS_MAX_WAIT = 30
+
+# Directory of the archive of closed parking sessions, which serves
+# /parking/revenue and /parking/history. Vehicles only keep their last
+# parking log in memory while archiving. Disabled when None. Only for the
+# default lot.
+PARKING_ARCHIVE_DIR = None
+
+# Evict vehicles once they have been unparked for longer than the continuous
+# rate window, so that the vehicles kept in memory are bounded by the traffic
+# of the last hour. Evicted vehicles no longer show in /parking/vehicles.
+PARKING_EVICT_IDLE = False
+
+# How slots are picked for parks and holds: "nearest", "best_fit" or
+# "zone_balance", see backend.models.allocation. A journaled lot switches to
+# it once restored.
+PARKING_ALLOCATION_STRATEGY = "nearest"
@@ -1 +1,8 @@
-from .parking import parking
+from .lots import lots
+from .parking import (
+    init_archive,
+    init_events,
+    init_metrics,
+    parking,
+    restore_parking_system,
+)
@@ -0,0 +1,122 @@
+# Encoding of the bodies of the parking routes, shared by the Flask and ASGI
+# apps. Dataclasses are encoded by functions compiled once per class, which
+# read the fields off the instance instead of deep-copying it like
+# dataclasses.asdict; nested dataclasses are encoded as the encoder reaches
+# them. JSON goes through orjson when it is installed, and clients may ask
+# for msgpack with an Accept header when msgpack is installed.
+import dataclasses
+import json
+from typing import Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack")
+
+# {type: function of an instance to a dict of its fields}
+_encoders: Dict[type, Callable] = {}
+
+
+def compile_encoder(cls) -> Callable:
+    # Encoder of a dataclass, as if written out by hand:
+    #   def encode(o): return {"name": o.name, ...}
+    names = [field.name for field in dataclasses.fields(cls)]
+    items = ", ".join(f"{name!r}: o.{name}" for name in names)
+    namespace = {}
+    exec(f"def encode(o): return {{{items}}}", namespace)
+    encode = namespace["encode"]
+    encode.__qualname__ = f"encode_{cls.__name__}"
+    return encode
+
+
+def register(cls, encoder: Callable) -> None:
+    # Encoder of a type that is not a dataclass, e.g. a view onto a store
+    _encoders[cls] = encoder
+
+
+def to_plain(o):
+    # default hook of the encoders, called for the objects they do not know
+    encoder = _encoders.get(type(o))
+    if encoder is None:
+        if not dataclasses.is_dataclass(o) or isinstance(o, type):
+            raise TypeError(f"Object of type {type(o).__name__} is not serializable")
+        encoder = _encoders[type(o)] = compile_encoder(type(o))
+    return encoder(o)
+
+
+# Same output as json.dumps, minus building an encoder on every call
+_json_encoder = json.JSONEncoder(default=to_plain)
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=to_plain, option=orjson.OPT_NON_STR_KEYS)
+    return _json_encoder.encode(data).encode()
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def packb(data) -> bytes:
+    return msgpack.packb(data, default=to_plain, use_bin_type=True)
+
+
+def unpackb(body):
+    return msgpack.unpackb(body, raw=False)
+
+
+def encode(data, content_type: str = JSON_TYPE) -> bytes:
+    if content_type == MSGPACK_TYPE:
+        return packb(data)
+    return dumps(data)
+
+
+def decode(body: bytes, content_type: Optional[str] = None):
+    # Request body of the given Content-Type, JSON unless msgpack. Raises
+    # ValueError when malformed.
+    if content_type in MSGPACK_TYPES and msgpack is not None:
+        try:
+            return unpackb(body)
+        except Exception as exc:
+            raise ValueError("Malformed msgpack body") from exc
+    return loads(body)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    # Content type of a response for an Accept header: msgpack when it is
+    # preferred to JSON and installed, JSON otherwise
+    if not accept or msgpack is None or "msgpack" not in accept:
+        return JSON_TYPE
+
+    qualities = {}
+    for item in accept.split(","):
+        media_type, *params = item.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[media_type.strip().lower()] = quality
+
+    msgpack_quality = max(qualities.get(name, 0.0) for name in MSGPACK_TYPES)
+    json_quality = max(
+        qualities.get(name, 0.0) for name in (JSON_TYPE, "application/*", "*/*")
+    )
+    if msgpack_quality > 0 and msgpack_quality >= json_quality:
+        return MSGPACK_TYPE
+    return JSON_TYPE
@@ -0,0 +1,220 @@
+import atexit
+import re
+import threading
+from types import SimpleNamespace
+from typing import Optional
+
+from flask import Blueprint, Response, current_app, request
+
+from backend.models.journal import FsyncPolicy
+from backend.models.lots import LotRegistry
+from backend.models.parking import Listing
+from backend.models.parkingerrs import LotNotExistsError, ParkingError
+
+from . import routes
+from .parking import (
+    _call_response,
+    _data_response,
+    _error_response,
+    _page_response,
+    _request_body,
+    _system_options,
+)
+from .routes import SLOT_FIELDS, STREAM_CHUNK_SIZE, VEHICLE_FIELDS
+
+# Routes of every lot, served under /parking/<lot_id>
+lots = Blueprint("lots", __name__)
+
+# Lot ids double as journal directory names, and must not shadow the routes
+# of the default lot
+LOT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+RESERVED_LOT_IDS = {
+    "init",
+    "slots",
+    "vehicles",
+    "availability",
+    "metrics",
+    "events",
+    "revenue",
+    "history",
+    "park",
+    "hold",
+    "unpark",
+}
+
+lot_registry: Optional[LotRegistry] = None
+# Guards the start of lot_registry across request threads
+lot_registry_lock = threading.Lock()
+
+
+def _lot_options(config) -> dict:
+    # LotRegistry options, the same as the default lot's but for what stays
+    # in this process: the metrics and events of the lots would be recorded
+    # in their workers, out of reach of /parking/metrics and /parking/events
+    options = _system_options(config)
+    for name in ("thread_safe", "metrics", "events"):
+        del options[name]
+    data_dir = config.get("PARKING_DATA_DIR")
+    return dict(
+        options,
+        data_dir=data_dir and f"{data_dir}/lots",
+        fsync_policy=FsyncPolicy(config["PARKING_FSYNC_POLICY"]),
+        snapshot_every=config["PARKING_SNAPSHOT_EVERY"],
+    )
+
+
+def _lot_registry(config) -> LotRegistry:
+    # Worker processes are started on first use of a lot
+    global lot_registry
+    with lot_registry_lock:
+        if lot_registry is None:
+            lot_registry = LotRegistry(
+                config.get("PARKING_LOT_WORKERS"), **_lot_options(config)
+            )
+            atexit.register(lot_registry.close)
+        return lot_registry
+
+
+def _call(lot_id: str, call_of) -> Response:
+    # Runs the routes.Call of the request body in the worker of the lot
+    call = routes.read_body(call_of, _request_body())
+    registry = _lot_registry(current_app.config)
+    try:
+        result = registry.call(lot_id, call.operation, *call.args)
+    except Exception as exc:
+        return _error_response(exc)
+    return _call_response(call, result)
+
+
+def _iter_items(rows, fields):
+    # Rows from the lot's worker, as items _stream_page can read fields off
+    for position, row in rows:
+        yield position, SimpleNamespace(**dict(zip(fields, row)))
+
+
+@lots.url_value_preprocessor
+def _check_lot_id(endpoint, values):
+    lot_id = values.get("lot_id")
+    if lot_id in RESERVED_LOT_IDS or not LOT_ID_PATTERN.fullmatch(lot_id or ""):
+        # Handled as an unknown route
+        values["lot_id"] = None
+
+
+@lots.errorhandler(ParkingError)
+def _parking_error(err: ParkingError) -> Response:
+    # Invalid requests and lots not initialized, see routes
+    return _error_response(err)
+
+
+@lots.before_request
+def _reject_invalid_lot_id():
+    if request.view_args.get("lot_id") is None:
+        return Response(response="Invalid lot id", status=404)
+
+
+@lots.route("/init", methods=(["POST"]))
+def init_lot(lot_id):
+    lot = routes.read_body(routes.lot_args, _request_body())
+    try:
+        registry = _lot_registry(current_app.config)
+        initialized = registry.init_lot(lot_id, *lot)
+    except Exception as exc:
+        return _error_response(exc)
+
+    if not initialized:
+        return Response(response="Lot already initialized", status=400)
+    return Response(response="Lot initialized", status=201)
+
+
+def _listing(lot_id: str, kind: str, all_fields):
+    page = routes.page_args(request.args, all_fields)
+    if page is None:
+        return Response(response="Invalid cursor, limit or fields", status=400)
+    cursor, limit, fields = page
+
+    registry = _lot_registry(current_app.config)
+    if kind == "slots":
+        # Slots of expired holds are listed as vacant. The worker of the lot
+        # runs requests in order, so there is no need to wait.
+        registry.submit(lot_id, "expire_holds")
+    # One more row than the page holds, see _page_rows
+    rows = registry.iter_rows(
+        lot_id,
+        kind,
+        fields,
+        cursor,
+        None if limit is None else limit + 1,
+        page_size=STREAM_CHUNK_SIZE,
+    )
+    try:
+        # Fetch the first page here, to answer unknown lots with an error
+        first = next(rows, None)
+    except LotNotExistsError as err:
+        return _error_response(err)
+
+    def all_rows():
+        if first is not None:
+            yield first
+            yield from rows
+
+    items = Listing(_iter_items(all_rows(), fields), cursor)
+    return _page_response(kind, items, fields, limit)
+
+
+@lots.route("/slots/update", methods=(["POST"]))
+def add_entry_points(lot_id):
+    return _call(lot_id, routes.update_call)
+
+
+@lots.route("/", methods=(["GET"]))
+@lots.route("/slots", methods=(["GET"]))
+def get_slots(lot_id):
+    return _listing(lot_id, "slots", SLOT_FIELDS)
+
+
+@lots.route("/vehicles", methods=(["GET"]))
+def get_vehicles(lot_id):
+    return _listing(lot_id, "vehicles", VEHICLE_FIELDS)
+
+
+@lots.route("/availability", methods=(["GET"]))
+def get_availability(lot_id):
+    size, entry_point = routes.availability_args(request.args)
+    registry = _lot_registry(current_app.config)
+    registry.submit(lot_id, "expire_holds")
+    vacant = registry.submit(lot_id, "count_vacant", size, entry_point)
+    vacant_by_size = registry.submit(lot_id, "get_vacant_counts", entry_point)
+    data = routes.availability_data(
+        size, entry_point, vacant.result(), vacant_by_size.result()
+    )
+    return _data_response(data)
+
+
+@lots.route("/park", methods=(["POST"]))
+def park(lot_id):
+    return _call(lot_id, routes.park_call)
+
+
+@lots.route("/hold", methods=(["POST"]))
+def hold(lot_id):
+    return _call(lot_id, routes.hold_call)
+
+
+@lots.route("/hold/cancel", methods=(["POST"]))
+def cancel_hold(lot_id):
+    return _call(lot_id, routes.cancel_hold_call)
+
+
+@lots.route("/unpark", methods=(["POST"]))
+def unpark(lot_id):
+    return _call(lot_id, routes.unpark_call)
+
+
+@lots.route("/park/batch", methods=(["POST"]))
+def park_batch(lot_id):
+    return _call(lot_id, routes.park_batch_call)
+
+
+@lots.route("/unpark/batch", methods=(["POST"]))
+def unpark_batch(lot_id):
+    return _call(lot_id, routes.unpark_batch_call)
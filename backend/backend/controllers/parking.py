@@ -1,60 +1,468 @@
-import dataclasses
-import datetime
+import atexit
+import io
 import json
+import os
+import threading
+import time
+import zipfile
+from typing import Optional
 
-from flask import Blueprint, Response, request
-
-from backend.models.parking import ParkingSystem, Size, Vehicle
-from backend.models.parkingerrs import (
-    AlreadyParkedError,
-    InvalidEntryPointError,
-    InvalidSizeError,
-    NoSlotAvailableError,
-    VehicleNotExistsError,
-)
+from flask import Blueprint, Response, current_app, g, request
 
+from backend.models.allocation import NEAREST, STRATEGIES
+from backend.models.archive import LogArchive
+from backend.models.events import EventLog
+from backend.models.journal import FsyncPolicy, Journal
+from backend.models.layout import load_layout
+from backend.models.metrics import Metrics
+from backend.models.parking import Listing, ParkingSystem, Tariff
+from backend.models.parkingerrs import EventsLostError, ParkingError
+from backend.models.sharedstate import SharedParkingSystem
+from backend.models.slotstore import ArraySlotStore
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        return super().default(o)
+from . import encoding, routes
+from .routes import SLOT_FIELDS, VEHICLE_FIELDS
 
 
 parking = Blueprint("parking", __name__)
 
 parking_system = None
+# Guards the initialization of parking_system across request threads
+parking_system_lock = threading.Lock()
+# Set by init_metrics when PARKING_METRICS is enabled
+metrics: Optional[Metrics] = None
+# Set by init_events when PARKING_EVENTS_CAPACITY is set
+events: Optional[EventLog] = None
+# Set by init_archive when PARKING_ARCHIVE_DIR is set
+archive: Optional[LogArchive] = None
+
+
+def init_metrics(config) -> None:
+    global metrics
+    if config.get("PARKING_METRICS") and metrics is None:
+        metrics = Metrics()
+
+
+def init_events(config) -> None:
+    # Not for lots in shared memory, where each process would only see the
+    # changes it made
+    global events
+    if (
+        config.get("PARKING_EVENTS_CAPACITY")
+        and not config.get("PARKING_SHARED_MEMORY")
+        and events is None
+    ):
+        events = EventLog(config["PARKING_EVENTS_CAPACITY"])
+
+
+def init_archive(config) -> None:
+    # Not for lots in shared memory, whose vehicles keep their logs
+    global archive
+    if (
+        config.get("PARKING_ARCHIVE_DIR")
+        and not config.get("PARKING_SHARED_MEMORY")
+        and archive is None
+    ):
+        archive = LogArchive(config["PARKING_ARCHIVE_DIR"])
+        # Write out the sessions still buffered
+        atexit.register(archive.close)
+
+
+@parking.before_request
+def _start_timer():
+    if metrics is not None:
+        g.parking_request_start = time.perf_counter()
+
+
+@parking.after_request
+def _record_request(response):
+    if metrics is not None and "parking_request_start" in g:
+        metrics.observe(
+            "parking_request_seconds",
+            time.perf_counter() - g.parking_request_start,
+            route=request.endpoint,
+        )
+    return response
+
+
+def _response_type() -> str:
+    return encoding.negotiate(request.headers.get("Accept"))
+
+
+def _request_body():
+    # Body of a JSON or msgpack request, in place of request.get_json()
+    if "parking_body" in g:
+        return g.parking_body
+    if not request.is_json and request.mimetype not in encoding.MSGPACK_TYPES:
+        # Flask answers other content types with 415
+        return request.get_json()
+    body = routes.decode_body(request.get_data(), request.mimetype)
+    g.parking_body = body
+    return body
+
+
+def _data_response(data, status: int = 200) -> Response:
+    # JSON, or msgpack for clients that accept it
+    content_type = _response_type()
+    if metrics is None:
+        encoded = encoding.encode(data, content_type)
+    else:
+        start = time.perf_counter()
+        encoded = encoding.encode(data, content_type)
+        metrics.observe(
+            "parking_encode_seconds",
+            time.perf_counter() - start,
+            route=request.endpoint,
+        )
+    return Response(response=encoded, status=status, mimetype=content_type)
+
+
+def _page_response(name: str, items: Listing, fields, limit) -> Response:
+    content_type = _response_type()
+    return Response(
+        response=routes.stream_page(name, items, fields, limit, content_type),
+        status=200,
+        mimetype=content_type,
+    )
+
+
+def _error_response(exc: Exception) -> Response:
+    message, status = routes.error_response(exc)
+    return Response(response=message, status=status)
+
+
+def _call_response(call: routes.Call, result) -> Response:
+    if isinstance(call.result, str):
+        return Response(response=call.result, status=200)
+    return _data_response(call.result(result))
+
+
+def _call(call_of) -> Response:
+    # Runs the routes.Call of the request body on the parking system
+    if parking_system is None:
+        # Not initialized
+        return Response(response="System not initialized", status=405)
+
+    call = routes.read_body(call_of, _request_body())
+    try:
+        result = getattr(parking_system, call.operation)(*call.args)
+    except Exception as exc:
+        return _error_response(exc)
+    return _call_response(call, result)
+
+
+@parking.errorhandler(ParkingError)
+def _parking_error(err: ParkingError) -> Response:
+    # Invalid requests, see routes
+    return _error_response(err)
+
+
+def _open_journal(config) -> Optional[Journal]:
+    if not config.get("PARKING_DATA_DIR"):
+        return None
+    return Journal(
+        config["PARKING_DATA_DIR"],
+        FsyncPolicy(config["PARKING_FSYNC_POLICY"]),
+        snapshot_every=config["PARKING_SNAPSHOT_EVERY"],
+    )
+
+
+def _system_options(config) -> dict:
+    slot_store = None
+    if config.get("PARKING_COMPACT_SLOTS"):
+        slot_store = ArraySlotStore
+    return dict(
+        thread_safe=True,
+        slot_store=slot_store,
+        metrics=metrics,
+        events=events,
+        evict_idle=bool(config.get("PARKING_EVICT_IDLE")),
+        strategy=config.get("PARKING_ALLOCATION_STRATEGY") or NEAREST,
+    )
+
+
+# Settings a lot in shared memory cannot honor, see
+# backend.models.sharedstate
+SHARED_MEMORY_UNSUPPORTED = (
+    "PARKING_DATA_DIR",
+    "PARKING_LAYOUT_FILE",
+    "PARKING_EVENTS_CAPACITY",
+    "PARKING_ARCHIVE_DIR",
+    "PARKING_EVICT_IDLE",
+)
+
+
+def _check_shared_config(config) -> None:
+    # Rejected at startup, rather than ignored
+    unsupported = [name for name in SHARED_MEMORY_UNSUPPORTED if config.get(name)]
+    strategy = STRATEGIES.get(_system_options(config)["strategy"])
+    if strategy is not None and strategy.vacancy_changed is not None:
+        unsupported.append("PARKING_ALLOCATION_STRATEGY")
+    if unsupported:
+        raise ValueError(
+            "Not supported with PARKING_SHARED_MEMORY: " + ", ".join(unsupported)
+        )
+
+
+def _shared_system(parking_system, config):
+    # Applies the strategy of config, which processes do not share
+    if parking_system is not None:
+        parking_system.set_strategy(_system_options(config)["strategy"])
+    return parking_system
+
+
+def restore_parking_system(config) -> None:
+    # Reload the parking system journaled by a previous run, if any
+    global parking_system
+    with parking_system_lock:
+        if parking_system is not None:
+            return
+
+        if config.get("PARKING_SHARED_MEMORY"):
+            _check_shared_config(config)
+            # Attach to the lot another worker process initialized
+            parking_system = _shared_system(
+                SharedParkingSystem.attach(
+                    config["PARKING_SHARED_MEMORY"], metrics=metrics
+                ),
+                config,
+            )
+            return
+
+        journal = _open_journal(config)
+        if journal is not None:
+            parking_system = journal.restore(**_system_options(config))
+            if parking_system is not None and archive is not None:
+                # After the replay, which would archive sessions twice
+                archive.attach(parking_system)
+
+        if parking_system is None and config.get("PARKING_LAYOUT_FILE"):
+            # Map the lot geometry, every slot vacant
+            options = _system_options(config)
+            del options["slot_store"]
+            parking_system = _journaled(
+                config, load_layout(config["PARKING_LAYOUT_FILE"], **options)
+            )
+
+
+def _journaled(config, parking_system):
+    journal = _open_journal(config)
+    if journal is not None:
+        journal.attach(parking_system)
+    if archive is not None:
+        archive.attach(parking_system)
+    return parking_system
+
+
+def _create_parking_system(config, entry_points, slots, sizes, tariff):
+    if config.get("PARKING_SHARED_MEMORY"):
+        _check_shared_config(config)
+        parking_system = SharedParkingSystem.create(
+            config["PARKING_SHARED_MEMORY"],
+            entry_points,
+            slots,
+            sizes,
+            tariff=tariff,
+            vehicle_capacity=config["PARKING_SHARED_VEHICLES"],
+            metrics=metrics,
+        )
+        return _shared_system(parking_system, config)
+
+    parking_system = ParkingSystem(
+        entry_points, slots, sizes, tariff=tariff, **_system_options(config)
+    )
+    return _journaled(config, parking_system)
+
+
+def _load_parking_system(config, distances, sizes, tariff):
+    # Parking system of a binary lot, see _read_lot_arrays
+    from backend.models import bulkload
+
+    distances, sizes = bulkload.validate(distances, sizes)
+    if config.get("PARKING_SHARED_MEMORY"):
+        return _create_parking_system(
+            config,
+            distances.shape[1],
+            [tuple(slot) for slot in distances.tolist()],
+            sizes.tolist(),
+            tariff,
+        )
+
+    options = _system_options(config)
+    del options["slot_store"]
+    parking_system = bulkload.load_parking_system(
+        distances, sizes, tariff=tariff, **options
+    )
+    return _journaled(config, parking_system)
+
+
+def _read_lot_arrays(config) -> Optional[tuple]:
+    # (distances, sizes, tariff) of a binary lot, or None for a JSON body of
+    # lists. A binary lot is an .npz file with "distances" (slots x entry
+    # points) and "sizes" arrays, or a pair of .npy files. It is posted as
+    # multipart files ("lot", or "distances" and "sizes", plus an optional
+    # "tariff" JSON field), as an application/octet-stream .npz body, or
+    # named by a JSON {"file": ...} body, relative to PARKING_BULK_LOAD_DIR.
+    body = None
+    if request.mimetype not in ("multipart/form-data", "application/octet-stream"):
+        body = _request_body()
+        if body.get("file") is None:
+            return None
+
+    # numpy is only needed for binary lots
+    from backend.models import bulkload
+
+    if request.mimetype == "multipart/form-data":
+        tariff = request.form.get("tariff")
+        tariff = json.loads(tariff) if tariff else None
+        if "lot" in request.files:
+            return (*bulkload.read_npz(request.files["lot"].stream), tariff)
+        return (
+            *bulkload.read_npy(
+                request.files["distances"].stream, request.files["sizes"].stream
+            ),
+            tariff,
+        )
+
+    if body is None:
+        return (*bulkload.read_npz(io.BytesIO(request.get_data())), None)
+
+    bulk_load_dir = config.get("PARKING_BULK_LOAD_DIR")
+    if bulk_load_dir is None:
+        raise PermissionError("Bulk load files not enabled")
+    bulk_load_dir = os.path.realpath(bulk_load_dir)
+    path = os.path.realpath(os.path.join(bulk_load_dir, body["file"]))
+    if os.path.commonpath([bulk_load_dir, path]) != bulk_load_dir:
+        raise PermissionError("Bulk load file outside of the bulk load directory")
+    return (*bulkload.read_npz(path), body.get("tariff"))
+
+
+@parking.before_request
+def _attach_shared_system():
+    if parking_system is None and current_app.config.get("PARKING_SHARED_MEMORY"):
+        restore_parking_system(current_app.config)
 
 
 @parking.route("/init", methods=(["POST"]))
 def init_parking():
     global parking_system
-    if parking_system is not None:
-        # Already initialized
-        return Response(response="System already initialized", status=400)
-
-    body = request.get_json()
-    entry_points = body["entry_points"]
-    slots = [tuple(slot) for slot in body["slots"]]
-    sizes = body["sizes"]
+    try:
+        lot_arrays = _read_lot_arrays(current_app.config)
+    except ImportError:
+        return Response(response="Bulk load requires numpy", status=501)
+    except PermissionError as exc:
+        return Response(response=str(exc), status=403)
+    except (KeyError, ValueError, OSError, EOFError, zipfile.BadZipFile):
+        return Response(response="Invalid lot file", status=400)
 
     error = None
-    try:
-        parking_system = ParkingSystem(entry_points, slots, sizes)
-    except InvalidSizeError as err:
-        error = dict(response=err.message, status=400)
-    except Exception as exc:
-        error = dict(response=str(exc), status=500)
+    with parking_system_lock:
+        if parking_system is not None:
+            # Already initialized
+            return Response(response="System already initialized", status=400)
+
+        try:
+            if lot_arrays is None:
+                lot = routes.read_body(routes.lot_args, _request_body())
+                entry_points, slots, sizes, tariff = lot
+                parking_system = _create_parking_system(
+                    current_app.config, entry_points, slots, sizes, tariff
+                )
+            else:
+                distances, sizes, tariff_data = lot_arrays
+                tariff = None
+                if tariff_data is not None:
+                    tariff = Tariff.from_dict(tariff_data)
+                parking_system = _load_parking_system(
+                    current_app.config, distances, sizes, tariff
+                )
+        except FileExistsError:
+            # Initialized by another worker process in the meantime
+            parking_system = _shared_system(
+                SharedParkingSystem.attach(
+                    current_app.config["PARKING_SHARED_MEMORY"], metrics=metrics
+                ),
+                current_app.config,
+            )
+            error = Response(response="System already initialized", status=400)
+        except Exception as exc:
+            error = _error_response(exc)
 
     if error:
-        return Response(**error)
+        return error
 
     return Response(response="System initialized", status=201)
 
 
+@parking.route("/metrics", methods=(["GET"]))
+def get_metrics():
+    if metrics is None:
+        return Response(response="Metrics not enabled", status=404)
+
+    return Response(
+        response=metrics.render(),
+        status=200,
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
 @parking.route("/slots/update", methods=(["POST"]))
 def add_entry_points():
-    return Response(response="Method not implemented yet", status=501)
+    return _call(routes.update_call)
+
+
+@parking.route("/events", methods=(["GET"]))
+def get_events():
+    # Slot state changes after the since sequence number, waiting up to wait
+    # seconds for some. Consumers start without since, to get the current
+    # sequence number, and carry on with the seq of each response. 410 means
+    # events were lost; it gives the current seq to carry on from once the
+    # slots are listed again.
+    if events is None:
+        return Response(response="Events not enabled", status=404)
+
+    args = routes.event_args(
+        request.args, current_app.config["PARKING_EVENTS_MAX_WAIT"]
+    )
+    if args is None:
+        return Response(response="Invalid since, limit or wait", status=400)
+    since, limit, wait = args
+
+    new_events = []
+    try:
+        if since is not None:
+            new_events = events.wait(since, wait, limit)
+    except EventsLostError as err:
+        return _data_response(dict(error=err.message, seq=events.seq), status=410)
+
+    return _data_response(routes.events_page(events, since, new_events))
+
+
+@parking.route("/revenue", methods=(["GET"]))
+def get_revenue():
+    # Charges of the archived sessions unparked from start to before end
+    if archive is None:
+        return Response(response="Archive not enabled", status=404)
+
+    args = routes.revenue_args(request.args)
+    if args is None:
+        return Response(response="Invalid start, end or size", status=400)
+    start, end, size = args
+    data = dict(start=start, end=end, size=size, revenue=archive.revenue(*args))
+    return _data_response(data)
+
+
+@parking.route("/history", methods=(["GET"]))
+def get_history():
+    # Archived sessions of the plate_number vehicle, in the order parked
+    if archive is None:
+        return Response(response="Archive not enabled", status=404)
+
+    plate_number = request.args.get("plate_number")
+    if not plate_number:
+        return Response(response="Invalid plate number", status=400)
+    data = dict(plate_number=plate_number, parking_logs=archive.history(plate_number))
+    return _data_response(data)
 
 
 @parking.route("/", methods=(["GET"]))
@@ -64,14 +472,14 @@ def get_slots():
         # Not initialized
         return Response(response="System not initialized", status=405)
 
-    slots = parking_system.get_slots()
+    page = routes.page_args(request.args, SLOT_FIELDS)
+    if page is None:
+        return Response(response="Invalid cursor, limit or fields", status=400)
+    cursor, limit, fields = page
 
-    data = dict(slots=slots)
-    return Response(
-        response=json.dumps(data, cls=EnhancedJSONEncoder),
-        status=200,
-        mimetype="application/json",
-    )
+    # Slots of expired holds are listed as vacant
+    parking_system.expire_holds()
+    return _page_response("slots", parking_system.iter_slots(cursor), fields, limit)
 
 
 @parking.route("/vehicles", methods=(["GET"]))
@@ -80,86 +488,54 @@ def get_vehicles():
         # Not initialized
         return Response(response="System not initialized", status=405)
 
-    vehicles = parking_system.get_vehicles()
+    page = routes.page_args(request.args, VEHICLE_FIELDS)
+    if page is None:
+        return Response(response="Invalid cursor, limit or fields", status=400)
+    cursor, limit, fields = page
 
-    data = dict(vehicles=vehicles)
-    return Response(
-        response=json.dumps(data, cls=EnhancedJSONEncoder),
-        status=200,
-        mimetype="application/json",
-    )
+    vehicles = parking_system.iter_vehicles(cursor)
+    return _page_response("vehicles", vehicles, fields, limit)
 
 
-@parking.route("/park", methods=(["POST"]))
-def park():
+@parking.route("/availability", methods=(["GET"]))
+def get_availability():
     if parking_system is None:
         # Not initialized
         return Response(response="System not initialized", status=405)
 
-    body = request.get_json()
-    plate_number = body["plate_number"]
-    size = body["size"]
-    entry_point = body["entry_point"]
+    size, entry_point = routes.availability_args(request.args)
+    parking_system.expire_holds()
+    vacant = parking_system.count_vacant(size, entry_point)
+    vacant_by_size = parking_system.get_vacant_counts(entry_point)
+    data = routes.availability_data(size, entry_point, vacant, vacant_by_size)
+    return _data_response(data)
 
-    # TODO: Move handling to Vehicle class
-    if size not in {*Size}:
-        return Response(response="Invalid vehicle size", status=400)
-    vehicle = Vehicle(plate_number, size)
 
-    time_parked = body.get("time_parked")
-    time_parked_timestamp = None
-    if time_parked:
-        time_parked_timestamp = datetime.datetime(*time_parked).timestamp()
+@parking.route("/park", methods=(["POST"]))
+def park():
+    return _call(routes.park_call)
 
-    error = None
-    try:
-        location = parking_system.park(vehicle, entry_point, time_parked_timestamp)
-    except (AlreadyParkedError, InvalidEntryPointError) as err:
-        error = dict(response=err.message, status=400)
-    except NoSlotAvailableError as err:
-        error = dict(response=err.message, status=503)
-    except Exception as exc:
-        error = dict(response=str(exc), status=500)
 
-    if error:
-        return Response(**error)
+@parking.route("/hold", methods=(["POST"]))
+def hold():
+    return _call(routes.hold_call)
 
-    data = dict(location=location)
-    return Response(
-        response=json.dumps(data, cls=EnhancedJSONEncoder),
-        status=200,
-        mimetype="application/json",
-    )
+
+@parking.route("/hold/cancel", methods=(["POST"]))
+def cancel_hold():
+    return _call(routes.cancel_hold_call)
 
 
 @parking.route("/unpark", methods=(["POST"]))
 def unpark():
-    if parking_system is None:
-        # Not initialized
-        return Response(response="System not initialized", status=405)
+    return _call(routes.unpark_call)
 
-    body = request.get_json()
-    plate_number = body["plate_number"]
 
-    time_unparked = body.get("time_unparked")
-    time_unparked_timestamp = None
-    if time_unparked:
-        time_unparked_timestamp = datetime.datetime(*time_unparked).timestamp()
+@parking.route("/park/batch", methods=(["POST"]))
+def park_batch():
+    return _call(routes.park_batch_call)
 
-    error = None
-    try:
-        charge = parking_system.unpark(plate_number, time_unparked_timestamp)
-    except VehicleNotExistsError as err:
-        error = dict(response=err.message, status=400)
-    except Exception as exc:
-        error = dict(response=str(exc), status=500)
 
-    if error:
-        return Response(**error)
-
-    data = dict(charge=charge)
-    return Response(
-        response=json.dumps(data, cls=EnhancedJSONEncoder),
-        status=200,
-        mimetype="application/json",
-    )
+@parking.route("/unpark/batch", methods=(["POST"]))
+def unpark_batch():
+    return _call(routes.unpark_batch_call)
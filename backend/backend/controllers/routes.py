@@ -0,0 +1,394 @@
+# Route logic shared by the parking and lots blueprints and the ASGI app,
+# which only differ in how they reach the parking system. Mutating routes
+# read their body into a Call: the parking system operation to run and its
+# arguments, and what to answer with its result. Each frontend runs calls its
+# own way (right away, on the writer thread of the ASGI app, or in the worker
+# of a lot) and answers errors with error_response().
+import dataclasses
+import datetime
+from typing import Any, Callable, NamedTuple, Optional, Tuple, Union
+
+from backend.models.events import EventLog
+from backend.models.parking import Listing, Size, Slot, Tariff, Vehicle
+from backend.models.parkingerrs import (
+    AlreadyParkedError,
+    HoldNotExistsError,
+    InvalidBodyError,
+    InvalidEntryPointError,
+    InvalidHoldError,
+    InvalidPlateNumberError,
+    InvalidSizeError,
+    InvalidTariffError,
+    InvalidTimeError,
+    LotNotExistsError,
+    NoSlotAvailableError,
+    ParkingError,
+    SlotNotExistsError,
+    UnsupportedOperationError,
+    VehicleCapacityError,
+    VehicleNotExistsError,
+)
+from backend.models.slotstore import SlotView
+
+from . import encoding
+
+encoding.register(SlotView, SlotView.asdict)
+
+# Status codes of the errors, answered with their message. Other errors are
+# answered with 500, also for the items of the batch routes.
+ERROR_STATUSES = {
+    AlreadyParkedError: 400,
+    HoldNotExistsError: 400,
+    InvalidBodyError: 400,
+    InvalidEntryPointError: 400,
+    InvalidHoldError: 400,
+    InvalidPlateNumberError: 400,
+    InvalidSizeError: 400,
+    InvalidTariffError: 400,
+    InvalidTimeError: 400,
+    LotNotExistsError: 405,
+    NoSlotAvailableError: 503,
+    SlotNotExistsError: 400,
+    UnsupportedOperationError: 400,
+    VehicleCapacityError: 503,
+    VehicleNotExistsError: 400,
+}
+
+SLOT_FIELDS = tuple(field.name for field in dataclasses.fields(Slot))
+VEHICLE_FIELDS = tuple(field.name for field in dataclasses.fields(Vehicle))
+# Number of items encoded per chunk of a streamed response
+STREAM_CHUNK_SIZE = 256
+# Most events returned by one /parking/events request
+EVENTS_LIMIT = 1000
+
+
+class Call(NamedTuple):
+    operation: str
+    args: tuple
+    # Response data of the result of the operation, or a plain text message
+    result: Union[str, Callable[[Any], Any]]
+
+
+def error_response(exc: Exception) -> Tuple[str, int]:
+    # (message, status) of a failed call
+    if isinstance(exc, ParkingError):
+        return exc.message, ERROR_STATUSES.get(type(exc), 500)
+    return str(exc), 500
+
+
+def decode_body(body: bytes, content_type: Optional[str] = None):
+    # encoding.decode, for malformed bodies to be answered with 400
+    try:
+        return encoding.decode(body, content_type)
+    except ValueError:
+        raise InvalidBodyError("Failed to decode the request body")
+
+
+def read_body(parse, body):
+    # parse(body), e.g. park_call, for bodies missing fields or holding values
+    # of the wrong type to be answered with 400 rather than 500
+    try:
+        return parse(body)
+    except (KeyError, TypeError, ValueError):
+        raise InvalidBodyError("Invalid request body")
+
+
+def error_item(exc: Exception) -> dict:
+    # Result of a failed item of a batch
+    message, status = error_response(exc)
+    return dict(error=message, status=status)
+
+
+def timestamp(value):
+    if not value:
+        return None
+    return datetime.datetime(*value).timestamp()
+
+
+def int_arg(args, name: str, default=None):
+    # Like request.args.get(name, default, type=int) in Flask, but only a
+    # missing argument takes the default, a malformed one raises ValueError
+    value = args.get(name)
+    return default if value is None else int(value)
+
+
+def _size(size) -> int:
+    if isinstance(size, bool) or not isinstance(size, int) or size not in {*Size}:
+        raise InvalidSizeError("Invalid vehicle size")
+    return size
+
+
+def _plate_number(plate_number) -> str:
+    if not isinstance(plate_number, str) or not plate_number:
+        raise InvalidPlateNumberError("Invalid plate number.")
+    return plate_number
+
+
+def lot_args(body) -> tuple:
+    # (entry_points, slots, sizes, tariff) of an init body
+    tariff = None
+    if body.get("tariff") is not None:
+        tariff = Tariff.from_dict(body["tariff"])
+    slots = [tuple(slot) for slot in body["slots"]]
+    return body["entry_points"], slots, body["sizes"], tariff
+
+
+def slot_updates(body) -> dict:
+    # {slot id: location} of an update body, which keys slots by id strings
+    try:
+        return {int(slot_id): location for slot_id, location in body["updates"].items()}
+    except ValueError:
+        raise SlotNotExistsError("Slot does not exist.")
+
+
+def update_call(body) -> Call:
+    # Without entry_points, only moves slots
+    return Call(
+        "add_entry_points",
+        (body.get("entry_points"), slot_updates(body)),
+        "Slots updated",
+    )
+
+
+def _location_data(location) -> dict:
+    return dict(location=location)
+
+
+def park_call(body) -> Call:
+    vehicle = Vehicle(_plate_number(body["plate_number"]), _size(body["size"]))
+    time_parked = timestamp(body.get("time_parked"))
+    # Vehicles arriving for a hold park in the held slot
+    hold_id = body.get("hold_id")
+    if hold_id is None:
+        args = (vehicle, body["entry_point"], time_parked)
+        return Call("park", args, _location_data)
+    return Call("park_hold", (vehicle, hold_id, time_parked), _location_data)
+
+
+def hold_duration(body) -> float:
+    # Holds are asked for in minutes
+    minutes = body.get("minutes")
+    if isinstance(minutes, bool) or not isinstance(minutes, (int, float)):
+        raise InvalidHoldError("Invalid hold duration")
+    return minutes * 60
+
+
+def hold_data(hold) -> dict:
+    return dict(
+        hold_id=hold.id, location=hold.slot_location, expires_at=hold.expires_at
+    )
+
+
+def hold_call(body) -> Call:
+    args = (
+        body["size"],
+        body["entry_point"],
+        hold_duration(body),
+        timestamp(body.get("time_held")),
+    )
+    return Call("hold", args, hold_data)
+
+
+def cancel_hold_call(body) -> Call:
+    return Call("cancel_hold", (body["hold_id"],), "Hold cancelled")
+
+
+def unpark_call(body) -> Call:
+    plate_number = _plate_number(body["plate_number"])
+    args = (plate_number, timestamp(body.get("time_unparked")))
+    return Call("unpark", args, lambda charge: dict(charge=charge))
+
+
+def _batch_data(results: list, positions: list, key: str):
+    # Fills in the results at positions with the outcomes of a batch call
+    def data(outcomes) -> dict:
+        for i, outcome in zip(positions, outcomes):
+            if isinstance(outcome, Exception):
+                results[i] = error_item(outcome)
+            else:
+                results[i] = {key: outcome}
+        return dict(results=results)
+
+    return data
+
+
+def park_batch_call(body) -> Call:
+    # Vehicles of an invalid plate number or size fail on their own
+    results = [None] * len(body["vehicles"])
+    requests = []
+    positions = []
+    for i, item in enumerate(body["vehicles"]):
+        try:
+            vehicle = Vehicle(_plate_number(item["plate_number"]), _size(item["size"]))
+        except ParkingError as err:
+            results[i] = error_item(err)
+            continue
+        requests.append(
+            (vehicle, item["entry_point"], timestamp(item.get("time_parked")))
+        )
+        positions.append(i)
+    return Call("park_many", (requests,), _batch_data(results, positions, "location"))
+
+
+def unpark_batch_call(body) -> Call:
+    # Like park_batch_call, for invalid plate numbers
+    results = [None] * len(body["vehicles"])
+    plate_numbers = []
+    times_unparked = []
+    positions = []
+    for i, item in enumerate(body["vehicles"]):
+        try:
+            plate_numbers.append(_plate_number(item["plate_number"]))
+        except ParkingError as err:
+            results[i] = error_item(err)
+            continue
+        times_unparked.append(timestamp(item.get("time_unparked")))
+        positions.append(i)
+    data = _batch_data(results, positions, "charge")
+    return Call("unpark_many", (plate_numbers, times_unparked), data)
+
+
+def availability_args(args) -> Tuple[int, Optional[int]]:
+    # (size, entry_point) of an availability query
+    try:
+        size = int_arg(args, "size", Size.SMALL)
+    except ValueError:
+        raise InvalidSizeError("Invalid vehicle size")
+    try:
+        entry_point = int_arg(args, "entry_point")
+    except ValueError:
+        raise InvalidEntryPointError("Invalid entry point.")
+    return _size(size), entry_point
+
+
+def availability_data(size, entry_point, vacant, vacant_by_size) -> dict:
+    return dict(
+        size=size,
+        entry_point=entry_point,
+        vacant=vacant,
+        vacant_by_size=vacant_by_size,
+    )
+
+
+def page_args(args, all_fields: Tuple[str, ...]):
+    # cursor, limit and fields query arguments of the listing routes, or None
+    # when invalid. fields is a comma separated subset of all_fields.
+    try:
+        cursor = int(args.get("cursor", 0))
+        limit = args.get("limit")
+        limit = None if limit is None else int(limit)
+    except ValueError:
+        return None
+    if cursor < 0 or (limit is not None and limit < 0):
+        return None
+
+    fields = all_fields
+    if args.get("fields"):
+        fields = tuple(args["fields"].split(","))
+        if not {*fields} <= {*all_fields}:
+            return None
+    return cursor, limit, fields
+
+
+def event_args(args, max_wait: float):
+    # since, limit and wait query arguments of /parking/events, or None when
+    # invalid. since is None for consumers starting out, and wait is capped
+    # at max_wait seconds.
+    try:
+        since = args.get("since")
+        since = None if since is None else int(since)
+        limit = min(int(args.get("limit", EVENTS_LIMIT)), EVENTS_LIMIT)
+        wait = min(float(args.get("wait", 0)), max_wait)
+    except ValueError:
+        return None
+    if (since is not None and since < 0) or limit <= 0 or not wait >= 0:
+        return None
+    return since, limit, wait
+
+
+def events_page(event_log: EventLog, since: Optional[int], new_events) -> dict:
+    # seq is what to ask for the events after these with
+    if since is None:
+        return dict(events=[], seq=event_log.seq)
+    return dict(events=new_events, seq=new_events[-1].seq if new_events else since)
+
+
+def revenue_args(args) -> Optional[tuple]:
+    # (start, end, size) of a revenue query, in Unix time, size being
+    # optional
+    try:
+        start = float(args["start"])
+        end = float(args["end"])
+        size = args.get("size")
+        if size is not None:
+            size = int(size)
+    except (KeyError, ValueError):
+        return None
+    if size is not None and size not in {*Size}:
+        return None
+    return start, end, size
+
+
+def _page_rows(items: Listing, fields, limit: Optional[int]):
+    # Chunks of up to STREAM_CHUNK_SIZE rows of the page, then (rows, cursor
+    # of the next page or None) as a last chunk. Takes one item more than the
+    # page holds, to tell whether there is a next page. Fields are read off
+    # the items rather than through dataclasses.asdict, which would copy
+    # fields left out.
+    count = 0
+    chunk = []
+    position = items.position
+    next_cursor = None
+    for item in items:
+        if count == limit:
+            next_cursor = position
+            break
+        chunk.append({field: getattr(item, field) for field in fields})
+        count += 1
+        position = items.position
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+    yield count, next_cursor
+
+
+def stream_page(
+    name: str,
+    items: Listing,
+    fields,
+    limit: Optional[int],
+    content_type: str = encoding.JSON_TYPE,
+):
+    # Encodes {name: [...], "next_cursor": ...} chunk by chunk, only holding
+    # STREAM_CHUNK_SIZE items at a time
+    if content_type == encoding.MSGPACK_TYPE:
+        yield from _pack_page(name, items, fields, limit)
+        return
+
+    yield f'{{"{name}": ['.encode()
+    separator = b""
+    for chunk in _page_rows(items, fields, limit):
+        if isinstance(chunk, tuple):
+            _, next_cursor = chunk
+            break
+        # One encoder call per chunk, without the brackets of the list
+        yield separator + encoding.dumps(chunk)[1:-1]
+        separator = b","
+
+    yield b'], "next_cursor": ' + encoding.dumps(next_cursor) + b"}"
+
+
+def _pack_page(name: str, items: Listing, fields, limit: Optional[int]):
+    # msgpack of a page, as a stream of {name: [...]} maps of a chunk of rows
+    # each, then {name: [], "next_cursor": ...}. A single map would need the
+    # number of rows up front. Clients read it with msgpack.Unpacker, joining
+    # the rows of the maps.
+    packer = encoding.msgpack.Packer(default=encoding.to_plain, use_bin_type=True)
+    for chunk in _page_rows(items, fields, limit):
+        if isinstance(chunk, tuple):
+            _, next_cursor = chunk
+            break
+        yield packer.pack({name: chunk})
+    yield packer.pack({name: [], "next_cursor": next_cursor})
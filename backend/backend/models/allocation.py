@@ -0,0 +1,169 @@
+import abc
+import heapq
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Type, Union
+
+if TYPE_CHECKING:
+    from .parking import ParkingSystem, Slot
+
+# Strategies picking the slot a vehicle parks in, or a hold takes. Each one
+# answers from vacant slot heaps, those of NearestSlotIndex, one per entry
+# point and slot size, or its own, and from the vacancy counters of the
+# parking system, so that picking a slot stays sublinear in the number of
+# slots:
+#
+#   nearest       nearest fitting slot to the entry point, of any size
+#   best_fit      smallest fitting slot size with a vacant slot, then the
+#                 nearest slot of that size, keeping larger slots for larger
+#                 vehicles
+#   zone_balance  nearest fitting slot of the zone with the most fitting
+#                 vacant slots to the entry point of the zone, spreading
+#                 vehicles across the entry points instead of filling the
+#                 busiest zone first. Zones are the slots nearest to each
+#                 entry point.
+#
+# Other strategies subclass AllocationStrategy and are added to STRATEGIES.
+# Strategies are journaled by name, see ParkingSystem.snapshot().
+
+NEAREST = "nearest"
+BEST_FIT = "best_fit"
+ZONE_BALANCE = "zone_balance"
+
+
+class AllocationStrategy(abc.ABC):
+    name: str = ""
+
+    # Called with the zone of each slot changing vacancy and the slot, with
+    # the slot lock held, by strategies keeping state of their own. None
+    # skips the call.
+    vacancy_changed: Optional[Callable[[int, "Slot"], None]] = None
+
+    def __init__(self, parking_system: "ParkingSystem"):
+        self._system = parking_system
+        self.reset()
+
+    def reset(self) -> None:
+        # Rebuilds any state kept from the vacancy counters of the system,
+        # once they are recounted
+        pass
+
+    @abc.abstractmethod
+    def select(self, size: int, entry_point: int) -> Optional["Slot"]:
+        # Vacant slot for a vehicle of size arriving at entry_point, None if
+        # none fits. Called with the slot lock held.
+        ...
+
+
+class Nearest(AllocationStrategy):
+    name = NEAREST
+
+    def select(self, size: int, entry_point: int) -> Optional["Slot"]:
+        return self._system._index.nearest(size, entry_point)
+
+
+class BestFit(AllocationStrategy):
+    name = BEST_FIT
+
+    def select(self, size: int, entry_point: int) -> Optional["Slot"]:
+        vacant_counts = self._system._vacant_counts
+        index = self._system._index
+        for slot_size in range(size, len(vacant_counts)):
+            if vacant_counts[slot_size]:
+                slot = index.nearest(slot_size, entry_point, slot_size + 1)
+                if slot is not None:
+                    return slot
+        return None
+
+
+class ZoneBalance(AllocationStrategy):
+    name = ZONE_BALANCE
+    # Heaps are rebuilt once they hold this many entries per zone
+    REBUILD_FACTOR = 4
+
+    def reset(self) -> None:
+        # Per vehicle size, a heap of (-fitting vacant slots, zone) pushed on
+        # every change of a zone. Entries no longer matching the counters of
+        # their zone are dropped once they reach the top, so that the zone
+        # with the most fitting slots is found without scanning the zones.
+        zone_counts = self._system._zone_vacant_counts
+        self._heaps = []
+        for size in range(len(self._system._vacant_counts)):
+            heap = [
+                (-sum(counts[size:]), zone) for zone, counts in enumerate(zone_counts)
+            ]
+            heapq.heapify(heap)
+            self._heaps.append(heap)
+        self._max_entries = self.REBUILD_FACTOR * (len(zone_counts) + 16)
+
+        # Per zone and slot size, a heap of (distance to the entry point of
+        # the zone, slot id) of its vacant slots, in the order of the slot
+        # index, for the slot to be picked in the zone. The nearest slot to
+        # the entry point may lie in another zone. Taken slots are dropped
+        # once they reach the top, and in_heap tells the slots in a heap.
+        slots = self._system._slots
+        zones = self._system._zones
+        self._slot_heaps = [[[] for _ in self._heaps] for _ in zone_counts]
+        self._in_heap = bytearray(len(slots))
+        for slot in slots.values():
+            if slot.is_vacant:
+                zone = zones[slot.id]
+                heap = self._slot_heaps[zone][slot.size]
+                heap.append((slot.location[zone], slot.id))
+                self._in_heap[slot.id] = 1
+        for heaps in self._slot_heaps:
+            for heap in heaps:
+                heapq.heapify(heap)
+
+    def vacancy_changed(self, zone: int, slot: "Slot") -> None:
+        counts = self._system._zone_vacant_counts[zone]
+        heaps = self._heaps
+        # Slots fit the vehicles of their size and smaller
+        for vehicle_size in range(slot.size + 1):
+            heapq.heappush(heaps[vehicle_size], (-sum(counts[vehicle_size:]), zone))
+        if slot.is_vacant and not self._in_heap[slot.id]:
+            heap = self._slot_heaps[zone][slot.size]
+            heapq.heappush(heap, (slot.location[zone], slot.id))
+            self._in_heap[slot.id] = 1
+        # Vehicles of size 0 fit every slot, so their heap is the largest
+        if len(heaps[0]) > self._max_entries:
+            self.reset()
+
+    def select(self, size: int, entry_point: int) -> Optional["Slot"]:
+        zone_counts = self._system._zone_vacant_counts
+        heap = self._heaps[size]
+        while True:
+            fitting, zone = heap[0]
+            if -fitting == sum(zone_counts[zone][size:]):
+                break
+            heapq.heappop(heap)
+        # Ties go to the zone of the entry point, then to the first zone,
+        # which comes first in the heap
+        if sum(zone_counts[entry_point][size:]) == -fitting:
+            zone = entry_point
+
+        slots = self._system._slots
+        best = None
+        for heap in self._slot_heaps[zone][size:]:
+            while heap and not slots[heap[0][1]].is_vacant:
+                _, slot_id = heapq.heappop(heap)
+                self._in_heap[slot_id] = 0
+            if heap and (best is None or heap[0] < best):
+                best = heap[0]
+        return None if best is None else slots[best[1]]
+
+
+STRATEGIES: Dict[str, Type[AllocationStrategy]] = {
+    NEAREST: Nearest,
+    BEST_FIT: BestFit,
+    ZONE_BALANCE: ZoneBalance,
+}
+
+
+def make_strategy(
+    strategy: Union[str, Type[AllocationStrategy]], parking_system: "ParkingSystem"
+) -> AllocationStrategy:
+    # Strategy of parking_system, by name or class
+    if isinstance(strategy, str):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown allocation strategy {strategy!r}")
+        strategy = STRATEGIES[strategy]
+    return strategy(parking_system)
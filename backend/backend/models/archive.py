@@ -0,0 +1,353 @@
+# Append-only archive of closed parking sessions, so that vehicles only keep
+# the last of their parking logs in memory (see Vehicle.compact_logs) while
+# revenue and the history of a plate number stay queryable.
+#
+# Sessions are buffered per time partition (a day of unpark times by
+# default) and written out a chunk at a time. Chunk files are columnar, rows
+# sorted by plate number, in native little-endian order with every column
+# 8-byte aligned:
+#   header         magic, version, rows
+#   time_parked    float64
+#   time_unparked  float64
+#   charge         int64
+#   slot_id        int64, -1 when unknown
+#   size           uint8, size of the slot, which the charge depends on
+#   plate_offsets  int64, rows + 1 offsets into plates
+#   plates         the UTF-8 plate numbers, back to back
+#
+# The index file lists the chunks, one JSON line each, with the range of
+# their unpark times, their revenue per slot size and a bloom filter of their
+# plate numbers. Revenue queries only read the chunks at the edges of the
+# time window, and history queries only the chunks that may hold the plate.
+# Chunks are written before they are indexed, so a crash leaves at most an
+# unindexed chunk behind, which is ignored. Sessions still buffered are lost
+# with the process unless flushed, see close().
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .parking import Size
+
+MAGIC = b"PKARCHIV"
+VERSION = 1
+
+# magic, version, rows
+_HEADER = struct.Struct("<8sIQ")
+_HEADER_SIZE = 32
+
+# Unpark times are partitioned by day
+PARTITION_SECONDS = 24 * 60 * 60
+# Sessions per chunk file
+CHUNK_ROWS = 65536
+INDEX_FILE = "index"
+
+BLOOM_BITS = 4096
+BLOOM_HASHES = 3
+
+
+@dataclass
+class ArchivedLog:
+    plate_number: str
+    # Size of the slot
+    size: int
+    slot_id: Optional[int]
+    time_parked: float
+    time_unparked: float
+    charge: int
+
+
+@dataclass
+class _Chunk:
+    # Index entry of a chunk file
+    path: str
+    rows: int
+    # Range of the unpark times
+    start: float
+    end: float
+    # Revenue per slot size
+    revenue: List[int]
+    bloom: bytes
+
+
+def _bloom_bits(plate_number: str) -> List[int]:
+    digest = hashlib.blake2b(
+        plate_number.encode(), digest_size=4 * BLOOM_HASHES
+    ).digest()
+    return [
+        int.from_bytes(digest[i * 4 : i * 4 + 4], "little") % BLOOM_BITS
+        for i in range(BLOOM_HASHES)
+    ]
+
+
+def _bloom_has(bloom: bytes, plate_number: str) -> bool:
+    return all(bloom[bit >> 3] & (1 << (bit & 7)) for bit in _bloom_bits(plate_number))
+
+
+def _sections(rows: int, plates_len: int) -> Dict:
+    # name: (offset, length, typecode)
+    lengths = [
+        ("time_parked", rows, "d"),
+        ("time_unparked", rows, "d"),
+        ("charge", rows, "q"),
+        ("slot_id", rows, "q"),
+        ("size", rows, "B"),
+        ("plate_offsets", rows + 1, "q"),
+        ("plates", plates_len, "B"),
+    ]
+    sections = {}
+    offset = _HEADER_SIZE
+    for name, length, typecode in lengths:
+        sections[name] = (offset, length, typecode)
+        itemsize = 1 if typecode == "B" else 8
+        offset += (length * itemsize + 7) // 8 * 8
+    return sections
+
+
+class _ChunkReader:
+    # Columns of a chunk file, memory-mapped so that only the columns read
+    # are loaded
+    def __init__(self, path: str):
+        with open(path, "rb") as chunk_file:
+            self._mapping = mmap.mmap(chunk_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows = _HEADER.unpack_from(self._mapping)
+        if magic != MAGIC or version != VERSION:
+            self._mapping.close()
+            raise ValueError("Not an archive chunk")
+        self.rows = rows
+        self._buffer = memoryview(self._mapping)
+        offset, length, _ = _sections(rows, 0)["plate_offsets"]
+        self._plates_len = self._buffer[offset : offset + length * 8].cast("q")[-1]
+        self._views = []
+
+    def column(self, name: str) -> memoryview:
+        offset, length, typecode = _sections(self.rows, self._plates_len)[name]
+        itemsize = 1 if typecode == "B" else 8
+        view = self._buffer[offset : offset + length * itemsize].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._buffer.release()
+        self._mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _write_chunk(path: str, rows: List[tuple]) -> None:
+    # rows of ArchivedLog fields, sorted by plate number
+    plates = bytearray()
+    plate_offsets = array("q", [0])
+    for row in rows:
+        plates += row[0].encode()
+        plate_offsets.append(len(plates))
+    columns = dict(
+        time_parked=array("d", [row[3] for row in rows]),
+        time_unparked=array("d", [row[4] for row in rows]),
+        charge=array("q", [row[5] for row in rows]),
+        slot_id=array("q", [-1 if row[2] is None else row[2] for row in rows]),
+        size=bytes(row[1] for row in rows),
+        plate_offsets=plate_offsets,
+        plates=plates,
+    )
+
+    sections = _sections(len(rows), len(plates))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as chunk_file:
+        chunk_file.write(_HEADER.pack(MAGIC, VERSION, len(rows)).ljust(_HEADER_SIZE))
+        for name, values in columns.items():
+            chunk_file.seek(sections[name][0])
+            chunk_file.write(values)
+        chunk_file.flush()
+        os.fsync(chunk_file.fileno())
+    os.replace(temp_path, path)
+
+
+class LogArchive:
+    def __init__(
+        self,
+        directory: str,
+        chunk_rows: int = CHUNK_ROWS,
+        partition_seconds: float = PARTITION_SECONDS,
+    ):
+        if sys.byteorder != "little":
+            raise ValueError("Archive chunks are little-endian")
+        self._directory = directory
+        self._chunk_rows = chunk_rows
+        self._partition_seconds = partition_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # Sessions not written out yet, by partition
+        self._buffers: Dict[int, List[tuple]] = {}
+        self._chunks = self._read_index()
+        self._lock = threading.Lock()
+
+    def _read_index(self) -> List[_Chunk]:
+        chunks = []
+        path = os.path.join(self._directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return chunks
+        with open(path) as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write of the last line
+                    break
+                entry["bloom"] = bytes.fromhex(entry["bloom"])
+                chunks.append(_Chunk(**entry))
+        return chunks
+
+    def attach(self, system) -> None:
+        # Sessions the system closes from here on are archived, and the
+        # vehicles only keep their last parking log
+        system._archive = self
+
+    def append(
+        self,
+        plate_number: str,
+        size: int,
+        slot_id: Optional[int],
+        time_parked: float,
+        time_unparked: float,
+        charge: int,
+    ) -> None:
+        partition = int(time_unparked // self._partition_seconds)
+        row = (plate_number, size, slot_id, time_parked, time_unparked, charge)
+        with self._lock:
+            buffer = self._buffers.setdefault(partition, [])
+            buffer.append(row)
+            if len(buffer) >= self._chunk_rows:
+                self._flush_partition(partition)
+
+    def _flush_partition(self, partition: int) -> None:
+        # Must hold the lock
+        rows = sorted(self._buffers.pop(partition))
+        bloom = bytearray(BLOOM_BITS // 8)
+        revenue = [0] * len(Size)
+        for row in rows:
+            for bit in _bloom_bits(row[0]):
+                bloom[bit >> 3] |= 1 << (bit & 7)
+            revenue[row[1]] += row[5]
+
+        partition_dir = f"{partition:08d}"
+        os.makedirs(os.path.join(self._directory, partition_dir), exist_ok=True)
+        path = os.path.join(partition_dir, f"chunk-{len(self._chunks):08d}")
+        _write_chunk(os.path.join(self._directory, path), rows)
+
+        chunk = _Chunk(
+            path,
+            len(rows),
+            min(row[4] for row in rows),
+            max(row[4] for row in rows),
+            revenue,
+            bytes(bloom),
+        )
+        entry = dict(vars(chunk), bloom=chunk.bloom.hex())
+        with open(os.path.join(self._directory, INDEX_FILE), "a") as index_file:
+            index_file.write(json.dumps(entry) + "\n")
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        self._chunks.append(chunk)
+
+    def flush(self) -> None:
+        # Writes out every buffered session
+        with self._lock:
+            for partition in list(self._buffers):
+                self._flush_partition(partition)
+
+    def close(self) -> None:
+        self.flush()
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._chunks), [
+                row for buffer in self._buffers.values() for row in buffer
+            ]
+
+    def revenue(self, start: float, end: float, size: Optional[int] = None) -> int:
+        # Charges of the sessions unparked from start to before end, of the
+        # given slot size or of every size
+        chunks, buffered = self._snapshot()
+        total = 0
+        for chunk in chunks:
+            if chunk.end < start or chunk.start >= end:
+                continue
+            if start <= chunk.start and chunk.end < end:
+                # Whole chunk in the window, its totals are enough
+                total += sum(chunk.revenue) if size is None else chunk.revenue[size]
+                continue
+
+            with _ChunkReader(os.path.join(self._directory, chunk.path)) as reader:
+                for time_unparked, charge, slot_size in zip(
+                    reader.column("time_unparked"),
+                    reader.column("charge"),
+                    reader.column("size"),
+                ):
+                    if start <= time_unparked < end and size in (None, slot_size):
+                        total += charge
+
+        for row in buffered:
+            if start <= row[4] < end and size in (None, row[1]):
+                total += row[5]
+        return total
+
+    def history(self, plate_number: str) -> List[ArchivedLog]:
+        # Archived sessions of a plate number, in the order parked
+        chunks, buffered = self._snapshot()
+        plate_bytes = plate_number.encode()
+        rows = [row for row in buffered if row[0] == plate_number]
+        for chunk in chunks:
+            if not _bloom_has(chunk.bloom, plate_number):
+                continue
+
+            with _ChunkReader(os.path.join(self._directory, chunk.path)) as reader:
+                offsets = reader.column("plate_offsets")
+                plates = reader.column("plates")
+
+                def plate_at(index: int) -> bytes:
+                    return bytes(plates[offsets[index] : offsets[index + 1]])
+
+                # Rows are sorted by plate number
+                low, high = 0, reader.rows
+                while low < high:
+                    middle = (low + high) // 2
+                    if plate_at(middle) < plate_bytes:
+                        low = middle + 1
+                    else:
+                        high = middle
+                if low == reader.rows or plate_at(low) != plate_bytes:
+                    continue
+
+                columns = [
+                    reader.column(name)
+                    for name in (
+                        "size",
+                        "slot_id",
+                        "time_parked",
+                        "time_unparked",
+                        "charge",
+                    )
+                ]
+                index = low
+                while index < reader.rows and plate_at(index) == plate_bytes:
+                    size, slot_id, *rest = (column[index] for column in columns)
+                    rows.append(
+                        (plate_number, size, None if slot_id < 0 else slot_id, *rest)
+                    )
+                    index += 1
+
+        rows.sort(key=lambda row: row[3])
+        return [ArchivedLog(*row) for row in rows]
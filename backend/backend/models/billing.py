@@ -0,0 +1,106 @@
+# Bulk billing of parking log chains with NumPy, for re-billing historical
+# logs. Applies the same tariff rules as ParkingSystem._get_charge, one chain step at
+# a time but across all chains at once.
+import numpy as np
+
+from .parking import DEFAULT_TARIFF, HOURS_IN_DAY, ParkingSystem, Tariff
+
+
+def bulk_charges(
+    time_parked,
+    time_unparked,
+    sizes,
+    chain_ids,
+    tariff: Tariff = DEFAULT_TARIFF,
+) -> np.ndarray:
+    # One row per parking log. Logs sharing a chain id form a continuous rate
+    # chain, in the order they appear in the input. Returns the charge of
+    # every log, i.e. what unpark() returns for it, in input order.
+    time_parked = np.asarray(time_parked, dtype=np.float64)
+    time_unparked = np.asarray(time_unparked, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.intp)
+    chain_ids = np.asarray(chain_ids)
+
+    logs_len = len(chain_ids)
+    charges = np.zeros(logs_len, dtype=np.int64)
+    if logs_len == 0:
+        return charges
+
+    # Make sure we don't get negative difference
+    assert (time_unparked >= time_parked).all()
+
+    # Group the logs of each chain together, keeping their order
+    order = np.argsort(chain_ids, kind="stable")
+    sorted_ids = chain_ids[order]
+    is_chain_start = np.empty(logs_len, dtype=bool)
+    is_chain_start[0] = True
+    is_chain_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    chain_starts = np.flatnonzero(is_chain_start)
+    chain_lengths = np.diff(np.append(chain_starts, logs_len))
+
+    # Longest chains first, so the chains still active at a step are a prefix
+    by_length = np.argsort(-chain_lengths, kind="stable")
+    chain_starts = chain_starts[by_length]
+    chain_lengths = chain_lengths[by_length]
+    active_chains = np.searchsorted(
+        -chain_lengths, -np.arange(1, chain_lengths[0] + 1), side="right"
+    )
+
+    compiled_tariff = tariff.compile()
+    stay_charges = np.array(compiled_tariff.stay_charges, dtype=np.int64)
+    hour_charges = np.array(compiled_tariff.hour_charges, dtype=np.int64)
+    flat_hours = compiled_tariff.flat_hours
+    hours_in_sec = ParkingSystem.HOURS_IN_SEC
+
+    # Billing state of every chain
+    chains_len = len(chain_starts)
+    total_hours_consumed = np.zeros(chains_len, dtype=np.int64)
+    total_charge = np.zeros(chains_len, dtype=np.int64)
+    current_start_time = time_parked[order[chain_starts]]
+
+    for step, active in enumerate(active_chains):
+        # Chains that still have a log at this step
+        chains = slice(0, active)
+        rows = order[chain_starts[chains] + step]
+
+        prev_total_hours_consumed = total_hours_consumed[chains]
+        prev_total_charge = total_charge[chains]
+        rows_time_unparked = time_unparked[rows]
+        rows_sizes = sizes[rows]
+
+        hours_consumed = (
+            rows_time_unparked - current_start_time[chains]
+        ) / hours_in_sec
+        hours_consumed_ceiled = np.ceil(hours_consumed).astype(np.int64)
+        rows_total_hours = prev_total_hours_consumed + hours_consumed_ceiled
+
+        stay = (rows_total_hours < HOURS_IN_DAY) & (
+            (rows_total_hours <= flat_hours) | (prev_total_hours_consumed < flat_hours)
+        )
+        daily = (
+            (rows_total_hours >= HOURS_IN_DAY)
+            & (prev_total_hours_consumed < HOURS_IN_DAY)
+        ) | (hours_consumed > HOURS_IN_DAY - (prev_total_hours_consumed % HOURS_IN_DAY))
+        # Table lookups are clipped, values out of range are not selected
+        rows_total_charge = np.select(
+            [stay, daily],
+            [
+                stay_charges[
+                    rows_sizes, np.minimum(rows_total_hours, HOURS_IN_DAY - 1)
+                ],
+                tariff.daily_rate * (rows_total_hours // HOURS_IN_DAY)
+                + hour_charges[rows_sizes, rows_total_hours % HOURS_IN_DAY],
+            ],
+            default=prev_total_charge
+            + hour_charges[rows_sizes, np.minimum(hours_consumed_ceiled, HOURS_IN_DAY)],
+        )
+
+        remaining_time = (hours_consumed_ceiled - hours_consumed) * hours_in_sec
+
+        # Each log is charged what the chain costs on top of earlier logs
+        charges[rows] = rows_total_charge - prev_total_charge
+        total_hours_consumed[chains] = rows_total_hours
+        total_charge[chains] = rows_total_charge
+        current_start_time[chains] = rows_time_unparked + remaining_time
+
+    return charges
@@ -0,0 +1,121 @@
+# Bulk loading of large lots from NumPy arrays: a slots x entry points
+# distances matrix, i.e. one row per slot location, and a vector of slot
+# sizes, e.g. read from .npy or .npz files. Validation, the slot store, the
+# nearest slot index and the vacancy counters are computed a column at a time
+# instead of a slot at a time. Slots are stored in an ArraySlotStore.
+from array import array
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .parking import ParkingSystem, Size, Tariff
+from .parkingerrs import InvalidEntryPointError, InvalidSizeError
+from .slotindex import NearestSlotIndex
+from .slotstore import ArraySlotStore
+
+
+def read_npz(file) -> Tuple[np.ndarray, np.ndarray]:
+    # distances and sizes arrays of an .npz file, by path or file object
+    with np.load(file, allow_pickle=False) as data:
+        return data["distances"], data["sizes"]
+
+
+def read_npy(distances_file, sizes_file) -> Tuple[np.ndarray, np.ndarray]:
+    return (
+        np.load(distances_file, allow_pickle=False),
+        np.load(sizes_file, allow_pickle=False),
+    )
+
+
+def validate(distances, sizes) -> Tuple[np.ndarray, np.ndarray]:
+    # Same checks as the ParkingSystem constructor and ArraySlotStore, on
+    # whole arrays. Returns int64 or float64 distances and uint8 sizes.
+    distances = np.asarray(distances)
+    sizes = np.asarray(sizes)
+
+    if distances.ndim != 2 or distances.shape[1] == 0:
+        raise InvalidEntryPointError("Invalid slot location")
+    if np.issubdtype(distances.dtype, np.integer):
+        distances = distances.astype(np.int64, copy=False)
+    elif np.issubdtype(distances.dtype, np.floating):
+        distances = distances.astype(np.float64, copy=False)
+        if not np.isfinite(distances).all():
+            raise InvalidEntryPointError("Invalid slot location")
+    else:
+        raise InvalidEntryPointError("Invalid slot location")
+
+    if (
+        sizes.shape != distances.shape[:1]
+        or not np.issubdtype(sizes.dtype, np.integer)
+        or ((sizes < 0) | (sizes >= len(Size))).any()
+    ):
+        raise InvalidSizeError("Invalid slot size")
+    return distances, sizes.astype(np.uint8)
+
+
+def _to_array(values: np.ndarray, typecode: str) -> array:
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values).tobytes())
+    return result
+
+
+def load_parking_system(
+    distances, sizes, tariff: Optional[Tariff] = None, **kwargs
+) -> ParkingSystem:
+    # ParkingSystem over the slots of a distances matrix and a sizes vector.
+    # kwargs are passed on to ParkingSystem; the slot store is always an
+    # ArraySlotStore. Repeated slot locations are rejected.
+    distances, sizes = validate(distances, sizes)
+    slots_len, entry_points = distances.shape
+    sizes_len = len(Size)
+
+    # Rows of the store are the columns of the matrix
+    columns = np.ascontiguousarray(distances.T)
+    store = ArraySlotStore.from_columns(
+        entry_points,
+        _to_array(columns, "q" if columns.dtype == np.int64 else "d"),
+        bytearray(sizes.tobytes()),
+    )
+
+    # Same orderings as NearestSlotIndex: ranks from a stable sort by
+    # distance, and every slot vacant, so heaps are the ranks of each size
+    by_rank = []
+    ranks = []
+    heaps = []
+    in_heap = []
+    positions = np.arange(slots_len, dtype=np.int64)
+    for row in columns:
+        row_by_rank = np.argsort(row, kind="stable")
+        row_ranks = np.empty(slots_len, dtype=np.int64)
+        row_ranks[row_by_rank] = positions
+        sizes_by_rank = sizes[row_by_rank]
+
+        by_rank.append(_to_array(row_by_rank.astype(np.int64), "q"))
+        ranks.append(_to_array(row_ranks, "q"))
+        heaps.append(
+            [
+                np.flatnonzero(sizes_by_rank == size).tolist()
+                for size in range(sizes_len)
+            ]
+        )
+        in_heap.append(bytearray(b"\x01" * slots_len))
+
+    # Zones are the nearest entry point, the first one on ties
+    zones = np.argmin(distances, axis=1) if slots_len else positions
+    vacant_counts = np.bincount(sizes, minlength=sizes_len)
+    zone_vacant_counts = np.bincount(
+        zones * sizes_len + sizes, minlength=entry_points * sizes_len
+    ).reshape(entry_points, sizes_len)
+
+    kwargs.pop("slot_store", None)
+    parking_system = ParkingSystem(entry_points, [], [], tariff=tariff, **kwargs)
+    parking_system._slots = store
+    parking_system._slot_ids = store.slot_ids
+    parking_system._index = NearestSlotIndex.from_orderings(
+        entry_points, sizes_len, store, by_rank, ranks, heaps, in_heap
+    )
+    parking_system._zones = _to_array(zones.astype(np.int64), "q")
+    parking_system._vacant_counts = vacant_counts.tolist()
+    parking_system._zone_vacant_counts = zone_vacant_counts.tolist()
+    parking_system._strategy.reset()
+    return parking_system
@@ -0,0 +1,146 @@
+# Stream of the slot state changes of a ParkingSystem, for consumers such as
+# signage, analytics or billing that would otherwise poll and diff the whole
+# slot listing. Events are numbered by a sequence number and kept in a bounded
+# ring buffer; consumers read the events after the last one they saw,
+# optionally waiting for new ones (long polling).
+#
+# Publishing never waits on consumers. A consumer that falls more than the
+# buffer's capacity behind gets EventsLostError, and resyncs by taking the
+# current sequence number, listing the slots again, then reading the events
+# after that number. Events carry the state of the slot after the change, so
+# applying an event already reflected in the listing is harmless.
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .parkingerrs import EventsLostError
+
+PARK = "park"
+UNPARK = "unpark"
+HOLD = "hold"
+# A hold was cancelled or expired
+RELEASE = "release"
+MOVE = "move"
+
+DEFAULT_CAPACITY = 4096
+
+
+@dataclass
+class Event:
+    seq: int
+    type: str
+    time: float
+    slot_id: int
+    location: tuple
+    is_vacant: bool
+    plate_number: Optional[str] = None
+    # Charged on unpark
+    charge: Optional[int] = None
+    hold_id: Optional[int] = None
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class EventLog:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("Event log capacity must be positive")
+        self._capacity = capacity
+        # Event fields after seq, stored as tuples so that publishing stays
+        # cheap; Event objects are only built for consumers
+        self._events: List[Optional[tuple]] = [None] * capacity
+        # Sequence number of the last event published, 0 before any
+        self._seq = 0
+
+        self._condition = threading.Condition(threading.Lock())
+        # Threads blocked in wait(), and (loop, future) of wait_async() calls
+        self._waiting = 0
+        self._async_waiters = []
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(
+        self,
+        event_type: str,
+        time: float,
+        slot,
+        plate_number: Optional[str] = None,
+        charge: Optional[int] = None,
+        hold_id: Optional[int] = None,
+    ) -> None:
+        # Called with the slot lock of the parking system held, so that
+        # events are numbered in the order the slots changed
+        with self._condition:
+            seq = self._seq + 1
+            self._events[seq % self._capacity] = (
+                event_type,
+                time,
+                slot.id,
+                slot.location,
+                slot.is_vacant,
+                plate_number,
+                charge,
+                hold_id,
+            )
+            self._seq = seq
+
+            if self._waiting:
+                self._condition.notify_all()
+            if self._async_waiters:
+                for loop, future in self._async_waiters:
+                    loop.call_soon_threadsafe(_wake, future)
+                self._async_waiters = []
+
+    def _since(self, seq: int, limit: Optional[int]) -> List[Event]:
+        # Must hold the condition
+        last = self._seq
+        if seq < 0 or seq > last or seq < last - self._capacity:
+            # Overwritten, or numbered by another run of the parking system
+            raise EventsLostError("Events lost, resync from the slot listing")
+        if limit is not None:
+            last = min(last, seq + limit)
+        return [
+            Event(event_seq, *self._events[event_seq % self._capacity])
+            for event_seq in range(seq + 1, last + 1)
+        ]
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Event]:
+        # Up to limit events published after seq, oldest first
+        with self._condition:
+            return self._since(seq, limit)
+
+    def wait(self, seq: int, timeout: float, limit: Optional[int] = None):
+        # Like since(), waiting up to timeout seconds for an event after seq
+        with self._condition:
+            if self._seq == seq:
+                self._waiting += 1
+                try:
+                    self._condition.wait_for(lambda: self._seq != seq, timeout)
+                finally:
+                    self._waiting -= 1
+            return self._since(seq, limit)
+
+    async def wait_async(self, seq: int, timeout: float, limit: Optional[int] = None):
+        # wait() for event loops, which must not block on the condition
+        with self._condition:
+            if self._seq != seq:
+                return self._since(seq, limit)
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+        return self.since(seq, limit)
@@ -0,0 +1,316 @@
+# Durability for ParkingSystem: park/unpark, hold and slot update operations
+# are appended to a binary write-ahead log (WAL) and the whole state is
+# periodically written to a snapshot. Restoring loads the latest snapshot and
+# replays the WALs written since.
+#
+# Files are numbered by generation. snapshot-N holds the state at the start
+# of wal-N, and taking a snapshot starts the next generation.
+import os
+import pickle
+import struct
+import threading
+import zlib
+from enum import Enum
+from typing import Optional
+
+from .layout import restore_layout
+from .parking import ParkingSystem, Size, Vehicle
+
+
+class FsyncPolicy(Enum):
+    # fsync before every operation returns
+    ALWAYS = "always"
+    # fsync once batch_size operations are pending, or after batch_interval
+    BATCH = "batch"
+    # Leave it to the OS to write the WAL to disk
+    OS = "os"
+
+
+PARK = 1
+UNPARK = 2
+UPDATE = 3
+HOLD = 4
+PARK_HOLD = 5
+CANCEL_HOLD = 6
+EXPIRE_HOLDS = 7
+
+# Every record is framed by its length and CRC, to detect a torn last write
+_FRAME = struct.Struct("<II")
+# op, time_parked, vehicle size, entry point; followed by the plate number
+_PARK = struct.Struct("<BdBI")
+# op, time_unparked; followed by the plate number
+_UNPARK = struct.Struct("<Bd")
+# op, entry points; followed by the pickled {slot id: location} updates
+_UPDATE = struct.Struct("<BI")
+# op, time_held, duration, slot size, entry point
+_HOLD = struct.Struct("<BddBI")
+# op, time_parked, vehicle size, hold id; followed by the plate number
+_PARK_HOLD = struct.Struct("<BdBQ")
+# op, hold id
+_CANCEL_HOLD = struct.Struct("<BQ")
+# op, time the holds expired by
+_EXPIRE_HOLDS = struct.Struct("<Bd")
+
+SNAPSHOT_PREFIX = "snapshot-"
+WAL_PREFIX = "wal-"
+
+
+class Journal:
+    def __init__(
+        self,
+        directory: str,
+        fsync_policy: FsyncPolicy = FsyncPolicy.BATCH,
+        batch_size: int = 128,
+        batch_interval: float = 0.01,
+        snapshot_every: Optional[int] = None,
+    ):
+        self._directory = directory
+        self._fsync_policy = FsyncPolicy(fsync_policy)
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._snapshot_every = snapshot_every
+
+        self._system = None
+        self._generation = 0
+        self._file = None
+
+        # Sequence numbers of the last record written and the last fsynced
+        self._written = 0
+        self._synced = 0
+        self._since_snapshot = 0
+
+        # Lock order: _snapshot_lock, _sync_lock, _lock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prefix: str, generation: int) -> str:
+        return os.path.join(self._directory, f"{prefix}{generation:08d}")
+
+    def _generations(self, prefix: str):
+        generations = []
+        for name in os.listdir(self._directory):
+            number = name[len(prefix) :]
+            if name.startswith(prefix) and number.isdigit():
+                generations.append(int(number))
+        return sorted(generations)
+
+    def attach(self, system: ParkingSystem) -> None:
+        # Start journaling the operations of system, from a fresh snapshot
+        self._system = system
+        self.snapshot()
+
+        if self._fsync_policy is FsyncPolicy.BATCH and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_pending, daemon=True)
+            self._flusher.start()
+
+    def restore(self, **kwargs) -> Optional[ParkingSystem]:
+        # Rebuild the system from the journal directory and attach to it.
+        # Returns None if nothing was journaled yet.
+        snapshots = self._generations(SNAPSHOT_PREFIX)
+        if not snapshots:
+            return None
+
+        # Replayed with the strategy of the snapshot, then switched to the
+        # strategy asked for, which the fresh snapshot of attach() records
+        strategy = kwargs.pop("strategy", None)
+        generation = snapshots[-1]
+        with open(self._path(SNAPSHOT_PREFIX, generation), "rb") as snapshot_file:
+            state = pickle.load(snapshot_file)
+        if state.get("layout") is not None:
+            system = restore_layout(state, **kwargs)
+        else:
+            system = ParkingSystem.from_snapshot(state, **kwargs)
+
+        for wal_generation in self._generations(WAL_PREFIX):
+            if wal_generation >= generation:
+                self._replay(system, self._path(WAL_PREFIX, wal_generation))
+        if strategy is not None:
+            system.set_strategy(strategy)
+
+        self._generation = max(self._generations(WAL_PREFIX) + [generation])
+        self.attach(system)
+        return system
+
+    def _replay(self, system: ParkingSystem, path: str) -> None:
+        with open(path, "rb") as wal_file:
+            data = wal_file.read()
+
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, offset)
+            payload = data[offset + _FRAME.size : offset + _FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                # Torn write at the end of the log, it was never committed
+                break
+            offset += _FRAME.size + length
+
+            if payload[0] == PARK:
+                _, time_parked, size, entry_point = _PARK.unpack_from(payload)
+                plate_number = payload[_PARK.size :].decode()
+                system.park(Vehicle(plate_number, Size(size)), entry_point, time_parked)
+            elif payload[0] == UNPARK:
+                _, time_unparked = _UNPARK.unpack_from(payload)
+                plate_number = payload[_UNPARK.size :].decode()
+                system.unpark(plate_number, time_unparked)
+            elif payload[0] == UPDATE:
+                _, entry_points = _UPDATE.unpack_from(payload)
+                updates = pickle.loads(payload[_UPDATE.size :])
+                system.add_entry_points(entry_points, updates)
+            elif payload[0] == HOLD:
+                _, time_held, duration, size, entry_point = _HOLD.unpack_from(payload)
+                system.hold(Size(size), entry_point, duration, time_held)
+            elif payload[0] == PARK_HOLD:
+                _, time_parked, size, hold_id = _PARK_HOLD.unpack_from(payload)
+                plate_number = payload[_PARK_HOLD.size :].decode()
+                system.park_hold(
+                    Vehicle(plate_number, Size(size)), hold_id, time_parked
+                )
+            elif payload[0] == CANCEL_HOLD:
+                _, hold_id = _CANCEL_HOLD.unpack_from(payload)
+                system.cancel_hold(hold_id)
+            elif payload[0] == EXPIRE_HOLDS:
+                _, now = _EXPIRE_HOLDS.unpack_from(payload)
+                system.expire_holds(now)
+
+    def record_park(
+        self, plate_number: str, size: int, entry_point: int, time_parked: float
+    ) -> int:
+        return self._append(
+            _PARK.pack(PARK, time_parked, size, entry_point) + plate_number.encode()
+        )
+
+    def record_unpark(self, plate_number: str, time_unparked: float) -> int:
+        return self._append(_UNPARK.pack(UNPARK, time_unparked) + plate_number.encode())
+
+    def record_update(self, entry_points: int, updates: dict) -> int:
+        return self._append(
+            _UPDATE.pack(UPDATE, entry_points)
+            + pickle.dumps(updates, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+
+    def record_hold(
+        self, size: int, entry_point: int, duration: float, time_held: float
+    ) -> int:
+        return self._append(_HOLD.pack(HOLD, time_held, duration, size, entry_point))
+
+    def record_park_hold(
+        self, plate_number: str, size: int, hold_id: int, time_parked: float
+    ) -> int:
+        return self._append(
+            _PARK_HOLD.pack(PARK_HOLD, time_parked, size, hold_id)
+            + plate_number.encode()
+        )
+
+    def record_cancel_hold(self, hold_id: int) -> int:
+        return self._append(_CANCEL_HOLD.pack(CANCEL_HOLD, hold_id))
+
+    def record_expire_holds(self, now: float) -> int:
+        return self._append(_EXPIRE_HOLDS.pack(EXPIRE_HOLDS, now))
+
+    def _append(self, payload: bytes) -> int:
+        with self._lock:
+            self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._written += 1
+            self._since_snapshot += 1
+            return self._written
+
+    def commit(self, seq: int) -> None:
+        # Called once the operation is done and the system locks are released
+        if self._fsync_policy is FsyncPolicy.ALWAYS:
+            self.sync(seq)
+        elif self._fsync_policy is FsyncPolicy.BATCH:
+            if seq - self._synced >= self._batch_size:
+                self.sync(seq)
+        else:
+            with self._lock:
+                self._file.flush()
+
+        if self._snapshot_every and self._since_snapshot >= self._snapshot_every:
+            # Another thread taking the snapshot already is good enough
+            if self._snapshot_lock.acquire(blocking=False):
+                try:
+                    if self._since_snapshot >= self._snapshot_every:
+                        self._snapshot()
+                finally:
+                    self._snapshot_lock.release()
+
+    def sync(self, seq: Optional[int] = None) -> None:
+        # Group commit: a single fsync covers every record written before it,
+        # so threads whose record got synced by another one return right away.
+        with self._sync_lock:
+            if seq is not None and self._synced >= seq:
+                return
+            with self._lock:
+                self._file.flush()
+                written = self._written
+            # Appends carry on while the disk catches up
+            os.fsync(self._file.fileno())
+            self._synced = written
+
+    def _flush_pending(self) -> None:
+        while not self._closed.wait(self._batch_interval):
+            if self._written > self._synced:
+                self.sync()
+
+    def snapshot(self) -> None:
+        with self._snapshot_lock:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        system = self._system
+        with system._exclusive():
+            state = pickle.dumps(system.snapshot(), protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Nothing can be journaled while the system is held exclusively
+            with self._sync_lock, self._lock:
+                if self._file is not None:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                self._generation += 1
+                generation = self._generation
+                self._file = open(self._path(WAL_PREFIX, generation), "ab")
+                self._synced = self._written
+                self._since_snapshot = 0
+
+            # Operations from here on are journaled after this snapshot
+            system._journal = self
+
+        path = self._path(SNAPSHOT_PREFIX, generation)
+        with open(path + ".tmp", "wb") as snapshot_file:
+            snapshot_file.write(state)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(path + ".tmp", path)
+        self._fsync_directory()
+
+        # Older generations are covered by the new snapshot
+        for prefix in (SNAPSHOT_PREFIX, WAL_PREFIX):
+            for old_generation in self._generations(prefix):
+                if old_generation < generation:
+                    os.remove(self._path(prefix, old_generation))
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._system is not None:
+            self._system._journal = None
+        with self._sync_lock, self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
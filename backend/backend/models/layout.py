@@ -0,0 +1,325 @@
+# Read-only lot layout files: the static geometry of a lot (slot distances
+# and sizes) along with its slot location table and nearest slot orderings,
+# written once and memory-mapped by every process serving the lot. Mapping
+# reads nothing up front; pages are loaded on use and shared between the
+# processes through the page cache. Only the vacancy state is held in memory.
+#
+# Layout, in native little-endian order, every section 8-byte aligned:
+#   header       magic, version, entry points, slots, table capacity, typecode
+#   distances    entry points x slots, like ArraySlotStore.distances
+#   sizes        one byte per slot
+#   table        ArraySlotStore location hash table
+#   by_rank      per entry point, the slot of each rank
+#   ranks        per entry point, the rank of each slot
+#   heap_ranks   per entry point, the ranks of the slots of each size
+#   heap_bounds  per entry point, where the ranks of each size start
+#   vacant       slots per size, then per zone and size
+#   zones        zone of each slot
+#
+# Journal snapshots of a mapped lot refer to its layout file, see
+# restore_layout. A layout is written from a /parking/init JSON body with:
+#
+#   python -m backend.models.layout lot.json lot.layout
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+from .allocation import NEAREST
+from .parking import ParkingSystem, Size, Tariff
+from .slotindex import NearestSlotIndex
+from .slotstore import ArraySlotStore
+
+MAGIC = b"PKLAYOUT"
+# 2: location table hashed with slotstore.location_hash
+# 3: zones section
+VERSION = 3
+
+# magic, version, entry points, slots, table capacity, distances typecode
+_HEADER = struct.Struct("<8sIIQQc")
+_HEADER_SIZE = 64
+
+
+def _sections(entry_points: int, slots: int, capacity: int, typecode: str) -> Dict:
+    # name: (offset, length, typecode)
+    lengths = [
+        ("distances", entry_points * slots, typecode),
+        ("sizes", slots, "B"),
+        ("table", capacity, "q"),
+        ("by_rank", entry_points * slots, "q"),
+        ("ranks", entry_points * slots, "q"),
+        ("heap_ranks", entry_points * slots, "q"),
+        ("heap_bounds", entry_points * (len(Size) + 1), "q"),
+        ("vacant", (entry_points + 1) * len(Size), "q"),
+        ("zones", slots, "q"),
+    ]
+    sections = {}
+    offset = _HEADER_SIZE
+    for name, length, section_typecode in lengths:
+        sections[name] = (offset, length, section_typecode)
+        itemsize = 1 if section_typecode == "B" else 8
+        offset += (length * itemsize + 7) // 8 * 8
+    sections["end"] = (offset, 0, "B")
+    return sections
+
+
+def _check_byteorder():
+    if sys.byteorder != "little":
+        raise ValueError("Layout files are little-endian")
+
+
+def write_layout(path: str, entry_points: int, slots: List[tuple], sizes: List[int]):
+    # Layout of a lot of vacant slots, given like to the ParkingSystem
+    # constructor. Written to a temporary file first, so that a layout is
+    # never mapped half written.
+    _check_byteorder()
+    parking_system = ParkingSystem(
+        entry_points, slots, sizes, slot_store=ArraySlotStore
+    )
+    store = parking_system._slots
+    index = parking_system._index
+
+    # Every slot is vacant, so each heap holds the ranks of its size in order
+    heap_ranks = array("q")
+    heap_bounds = array("q")
+    for heaps in index._heaps:
+        heap_bounds.append(0)
+        for heap in heaps:
+            heap_ranks.extend(heap)
+            heap_bounds.append(heap_bounds[-1] + len(heap))
+    vacant = array("q", parking_system._vacant_counts)
+    for zone_counts in parking_system._zone_vacant_counts:
+        vacant.extend(zone_counts)
+
+    typecode = store.distances.typecode
+    sections = _sections(entry_points, len(store), len(store._table), typecode)
+    data = dict(
+        distances=store.distances,
+        sizes=store.sizes,
+        table=store._table,
+        by_rank=b"".join(by_rank.tobytes() for by_rank in index._by_rank),
+        ranks=b"".join(ranks.tobytes() for ranks in index._ranks),
+        heap_ranks=heap_ranks,
+        heap_bounds=heap_bounds,
+        vacant=vacant,
+        zones=parking_system._zones,
+    )
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as layout_file:
+        header = _HEADER.pack(
+            MAGIC,
+            VERSION,
+            entry_points,
+            len(store),
+            len(store._table),
+            typecode.encode(),
+        )
+        layout_file.write(header.ljust(_HEADER_SIZE, b"\0"))
+        for name, values in data.items():
+            layout_file.seek(sections[name][0])
+            layout_file.write(values)
+        layout_file.truncate(sections["end"][0])
+        layout_file.flush()
+        os.fsync(layout_file.fileno())
+    os.replace(temp_path, path)
+
+
+class _MappedSlotIndex(NearestSlotIndex):
+    # NearestSlotIndex over the heap ranks of the layout. Every slot of a
+    # layout is vacant, so the ranks of each (entry point, size) are laid out
+    # in order and a cursor steps over them as slots are taken, instead of
+    # copying them into a heap. Slots released behind the cursor go to a heap
+    # of their own, so memory grows with the slots released rather than with
+    # the lot. Slots of a mapped store are never moved, see
+    # ArraySlotStore.relocate.
+
+    @classmethod
+    def from_layout(
+        cls,
+        entry_points: int,
+        sizes: int,
+        slots,
+        by_rank: List[memoryview],
+        ranks: List[memoryview],
+        heap_ranks: List[memoryview],
+        heap_bounds: List[memoryview],
+    ) -> "_MappedSlotIndex":
+        index = cls.from_orderings(entry_points, sizes, slots, by_rank, ranks, [], [])
+        index._heap_ranks = heap_ranks
+        index._heap_bounds = heap_bounds
+        # Per entry point, the position of the next mapped rank of each size
+        index._cursors = [bounds[:-1].tolist() for bounds in heap_bounds]
+        # Per entry point, the heaps of the ranks released behind the cursors
+        # by size, and the slots in those heaps
+        index._released = [[[] for _ in range(sizes)] for _ in range(entry_points)]
+        index._released_in_heap = [set() for _ in range(entry_points)]
+        return index
+
+    def _top(self, entry_point: int, size: int) -> Optional[int]:
+        heap_ranks = self._heap_ranks[entry_point]
+        stop = self._heap_bounds[entry_point][size + 1]
+        cursors = self._cursors[entry_point]
+        released = self._released[entry_point][size]
+        by_rank = self._by_rank[entry_point]
+        while True:
+            cursor = cursors[size]
+            rank = heap_ranks[cursor] if cursor < stop else None
+            is_released = bool(released) and (rank is None or released[0] < rank)
+            if is_released:
+                rank = released[0]
+            elif rank is None:
+                return None
+
+            order = by_rank[rank]
+            if self._slots[order].is_vacant:
+                return rank
+            # Lazy deletion of a slot taken since it was released, or since
+            # the layout was written
+            if is_released:
+                heapq.heappop(released)
+                self._released_in_heap[entry_point].discard(order)
+            else:
+                cursors[size] = cursor + 1
+            self.dropped += 1
+
+    def _release_order(self, order: int) -> None:
+        size = self._slots[order].size
+        for entry_point in range(self._entry_points):
+            # Ranks from the cursor on are still ahead in the mapping
+            rank = self._ranks[entry_point][order]
+            cursor = self._cursors[entry_point][size]
+            if (
+                cursor < self._heap_bounds[entry_point][size + 1]
+                and rank >= self._heap_ranks[entry_point][cursor]
+            ):
+                continue
+
+            in_heap = self._released_in_heap[entry_point]
+            if order not in in_heap:
+                heapq.heappush(self._released[entry_point][size], rank)
+                in_heap.add(order)
+
+
+def load_layout(path: str, tariff: Optional[Tariff] = None, **kwargs) -> ParkingSystem:
+    # ParkingSystem over the mapped layout at path, every slot vacant.
+    # kwargs are passed on to ParkingSystem; the slot store is always an
+    # ArraySlotStore over the mapping.
+    _check_byteorder()
+    with open(path, "rb") as layout_file:
+        mapping = mmap.mmap(layout_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, entry_points, slots_len, capacity, typecode = _HEADER.unpack_from(
+        mapping
+    )
+    if magic != MAGIC:
+        mapping.close()
+        raise ValueError("Not a layout file")
+    if version != VERSION:
+        mapping.close()
+        raise ValueError(f"Unsupported layout version {version}")
+    typecode = typecode.decode()
+    sections = _sections(entry_points, slots_len, capacity, typecode)
+    if len(mapping) < sections["end"][0]:
+        mapping.close()
+        raise ValueError("Truncated layout file")
+
+    buffer = memoryview(mapping)
+
+    def section(name: str) -> memoryview:
+        offset, length, section_typecode = sections[name]
+        itemsize = 1 if section_typecode == "B" else 8
+        return buffer[offset : offset + length * itemsize].cast(section_typecode)
+
+    def per_entry_point(view: memoryview, length: int) -> List[memoryview]:
+        return [
+            view[entry_point * length : (entry_point + 1) * length]
+            for entry_point in range(entry_points)
+        ]
+
+    sizes_len = len(Size)
+    store = ArraySlotStore.from_buffers(
+        entry_points,
+        section("distances"),
+        section("sizes"),
+        bytearray(b"\xff" * ((slots_len + 7) // 8)),
+        section("table"),
+    )
+    # The mapping is closed once nothing refers to the store anymore
+    store.mapping = mapping
+
+    index = _MappedSlotIndex.from_layout(
+        entry_points,
+        sizes_len,
+        store,
+        per_entry_point(section("by_rank"), slots_len),
+        per_entry_point(section("ranks"), slots_len),
+        per_entry_point(section("heap_ranks"), slots_len),
+        per_entry_point(section("heap_bounds"), sizes_len + 1),
+    )
+
+    vacant = section("vacant").tolist()
+    kwargs.pop("slot_store", None)
+    parking_system = ParkingSystem(entry_points, [], [], tariff=tariff, **kwargs)
+    parking_system._slots = store
+    parking_system._slot_ids = store.slot_ids
+    parking_system._index = index
+    parking_system._zones = section("zones")
+    parking_system._vacant_counts = vacant[:sizes_len]
+    parking_system._zone_vacant_counts = [
+        vacant[start : start + sizes_len]
+        for start in range(sizes_len, len(vacant), sizes_len)
+    ]
+    parking_system._strategy.reset()
+    parking_system._layout = os.path.abspath(path)
+    return parking_system
+
+
+def restore_layout(state: dict, **kwargs) -> ParkingSystem:
+    # ParkingSystem of a snapshot of a system loaded with load_layout(). The
+    # layout is mapped again, and only the vacancy of the slots, the vehicles
+    # and the holds come from the snapshot, so that restoring does not read
+    # the whole lot and keeps sharing its pages.
+    kwargs.setdefault("strategy", state.get("strategy", NEAREST))
+    parking_system = load_layout(state["layout"], tariff=state["tariff"], **kwargs)
+    store = parking_system._slots
+    if (
+        parking_system.get_entry_points() != state["entry_points"]
+        or len(store) != state["slots_len"]
+    ):
+        raise ValueError("Layout file changed since the snapshot")
+
+    # Taken slots are dropped from the mapped index once they reach the top
+    store.vacancy[:] = state["vacancy"]
+    parking_system._vacant_counts = list(state["vacant_counts"])
+    parking_system._zone_vacant_counts = [
+        list(counts) for counts in state["zone_vacant_counts"]
+    ]
+    parking_system._strategy.reset()
+    parking_system._restore_state(state)
+    return parking_system
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lot", help="/parking/init JSON body")
+    parser.add_argument("layout", help="layout file to write")
+    args = parser.parse_args()
+
+    with open(args.lot) as lot_file:
+        lot = json.load(lot_file)
+    write_layout(
+        args.layout,
+        lot["entry_points"],
+        [tuple(slot) for slot in lot["slots"]],
+        lot["sizes"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# Many parking lots behind one app. Lots are sharded by lot id across worker
+# processes, and every lot is owned by the single thread of its worker, so
+# lots never contend for locks with each other and scale across cores.
+#
+# The registry talks to each worker over a pipe. Requests are pipelined: a
+# caller sends its request and waits on a future, which a receiver thread
+# resolves when the worker answers.
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from .journal import FsyncPolicy, Journal
+from .parking import ParkingSystem, Tariff
+from .parkingerrs import LotNotExistsError
+
+# ParkingSystem methods that can be called on a lot
+OPERATIONS = {
+    "park",
+    "unpark",
+    "park_many",
+    "unpark_many",
+    "count_vacant",
+    "get_vacant_counts",
+    "get_tariff",
+    "get_entry_points",
+    "add_entry_points",
+    "hold",
+    "park_hold",
+    "cancel_hold",
+    "expire_holds",
+}
+
+# Listings are read off the lot in pages of rows, see LotRegistry.iter_rows
+ROWS_OF = {
+    "slots": ParkingSystem.iter_slots,
+    "vehicles": ParkingSystem.iter_vehicles,
+}
+
+
+def shard_of(lot_id: str, shards: int) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(lot_id.encode()) % shards
+
+
+class _Worker:
+    # State of a worker process: the lots of its shard
+    def __init__(self, shard: int, shards: int, options: dict):
+        self.shard = shard
+        self.shards = shards
+        self.data_dir = options.pop("data_dir", None)
+        self.fsync_policy = options.pop("fsync_policy", FsyncPolicy.BATCH)
+        self.snapshot_every = options.pop("snapshot_every", None)
+        # Each lot has a single owner, the worker thread
+        self.system_options = dict(options, thread_safe=False)
+        self.lots: Dict[str, ParkingSystem] = {}
+
+    def _journal(self, lot_id: str) -> Optional[Journal]:
+        if self.data_dir is None:
+            return None
+        return Journal(
+            os.path.join(self.data_dir, lot_id),
+            self.fsync_policy,
+            snapshot_every=self.snapshot_every,
+        )
+
+    def restore(self) -> None:
+        # Reload the journaled lots of this shard
+        if self.data_dir is None or not os.path.isdir(self.data_dir):
+            return
+        for lot_id in sorted(os.listdir(self.data_dir)):
+            if shard_of(lot_id, self.shards) != self.shard:
+                continue
+            system = self._journal(lot_id).restore(**self.system_options)
+            if system is not None:
+                self.lots[lot_id] = system
+
+    def init(self, lot_id: str, entry_points, slots, sizes, tariff=None) -> bool:
+        # False if the lot already exists
+        if lot_id in self.lots:
+            return False
+        system = ParkingSystem(
+            entry_points, slots, sizes, tariff=tariff, **self.system_options
+        )
+        journal = self._journal(lot_id)
+        if journal is not None:
+            journal.attach(system)
+        self.lots[lot_id] = system
+        return True
+
+    def call(self, lot_id: str, operation: str, *args):
+        if operation == "init":
+            return self.init(lot_id, *args)
+        if operation == "lots":
+            return list(self.lots)
+
+        system = self.lots.get(lot_id)
+        if system is None:
+            raise LotNotExistsError("Lot not initialized.")
+        if operation == "rows":
+            # (position after the row, row) of up to limit rows
+            kind, start, limit, fields = args
+            items = ROWS_OF[kind](system, start)
+            return [
+                (items.position, tuple(getattr(item, field) for field in fields))
+                for item in itertools.islice(items, limit)
+            ]
+        if operation not in OPERATIONS:
+            raise ValueError(f"Invalid lot operation {operation}")
+        return getattr(system, operation)(*args)
+
+
+def _serve(connection, shard: int, shards: int, options: dict) -> None:
+    # Worker process main loop, one request at a time
+    worker = _Worker(shard, shards, options)
+    worker.restore()
+    connection.send(None)
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        request_id, lot_id, operation, args = request
+        try:
+            connection.send((request_id, True, worker.call(lot_id, operation, *args)))
+        except Exception as exc:
+            connection.send((request_id, False, exc))
+
+
+class _Shard:
+    def __init__(self, context, shard: int, shards: int, options: dict):
+        self._connection, worker_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(worker_connection, shard, shards, options),
+            name=f"parking-lots-{shard}",
+            daemon=True,
+        )
+        self.process.start()
+        worker_connection.close()
+        # Restored lots are loaded before the first request
+        self._connection.recv()
+
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._request_ids = itertools.count()
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    def submit(self, lot_id: str, operation: str, args: tuple) -> Future:
+        future = Future()
+        with self._send_lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            self._connection.send((request_id, lot_id, operation, args))
+        return future
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                request_id, ok, value = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        # Worker is gone, fail whoever is still waiting
+        for request_id in list(self._pending):
+            self._pending.pop(request_id).set_exception(
+                RuntimeError("Lot worker stopped")
+            )
+
+    def close(self) -> None:
+        with self._send_lock:
+            try:
+                self._connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self._connection.close()
+        self._receiver.join()
+
+
+class LotRegistry:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        data_dir: Optional[str] = None,
+        fsync_policy: FsyncPolicy = FsyncPolicy.BATCH,
+        snapshot_every: Optional[int] = None,
+        **system_options,
+    ):
+        # Lots journal to data_dir/<lot id> when data_dir is set.
+        # system_options are passed on to ParkingSystem, and must pickle.
+        workers = workers or os.cpu_count() or 1
+        options = dict(
+            system_options,
+            data_dir=data_dir,
+            fsync_policy=fsync_policy,
+            snapshot_every=snapshot_every,
+        )
+        # Workers are spawned, forking a threaded server is not safe
+        context = multiprocessing.get_context("spawn")
+        self._shards = [
+            _Shard(context, shard, workers, dict(options)) for shard in range(workers)
+        ]
+
+    def submit(self, lot_id: str, operation: str, *args) -> Future:
+        shard = self._shards[shard_of(lot_id, len(self._shards))]
+        return shard.submit(lot_id, operation, args)
+
+    def call(self, lot_id: str, operation: str, *args):
+        # Runs operation on the lot in its worker, raising what it raised
+        return self.submit(lot_id, operation, *args).result()
+
+    def init_lot(
+        self, lot_id: str, entry_points: int, slots, sizes, tariff: Tariff = None
+    ) -> bool:
+        # False if the lot already exists
+        return self.call(lot_id, "init", entry_points, slots, sizes, tariff)
+
+    def lot_ids(self) -> List[str]:
+        futures = [shard.submit(None, "lots", ()) for shard in self._shards]
+        return sorted(lot_id for future in futures for lot_id in future.result())
+
+    def iter_rows(
+        self,
+        lot_id: str,
+        kind: str,
+        fields,
+        start: int = 0,
+        limit: Optional[int] = None,
+        page_size: int = 256,
+    ):
+        # (position after the row, row) of up to limit slots or vehicles of a
+        # lot from position start, rows being tuples of the given fields,
+        # fetched from the worker a page at a time
+        position = start
+        taken = 0
+        while limit is None or taken < limit:
+            size = page_size if limit is None else min(page_size, limit - taken)
+            rows = self.call(lot_id, "rows", kind, position, size, tuple(fields))
+            yield from rows
+            if len(rows) < size:
+                return
+            position = rows[-1][0]
+            taken += len(rows)
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
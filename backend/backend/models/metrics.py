@@ -0,0 +1,168 @@
+# In-process metrics of the parking system, rendered in the Prometheus text
+# exposition format. Nothing is recorded unless a Metrics instance is passed
+# to ParkingSystem (see ParkingSystem._instrument) or enabled in the app with
+# PARKING_METRICS.
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    1e-6,
+    2.5e-6,
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    0.1,
+    1.0,
+)
+# Upper bounds of the histogram buckets of counts, e.g. slots scanned
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 16, 32, 64, 128, 256, 1024)
+
+HISTOGRAM = "histogram"
+COUNTER = "counter"
+
+# name: (type, help, buckets)
+FAMILIES = {
+    "parking_operation_seconds": (
+        HISTOGRAM,
+        "Latency of ParkingSystem operations.",
+        LATENCY_BUCKETS,
+    ),
+    "parking_slots_scanned": (
+        HISTOGRAM,
+        "Slot index entries inspected per nearest slot lookup.",
+        COUNT_BUCKETS,
+    ),
+    "parking_log_chain_length": (
+        HISTOGRAM,
+        "Parking logs in the continuous rate chain of a charge.",
+        COUNT_BUCKETS,
+    ),
+    "parking_errors_total": (
+        COUNTER,
+        "ParkingError raised by ParkingSystem operations, by error type.",
+        None,
+    ),
+    "parking_request_seconds": (
+        HISTOGRAM,
+        "Latency of the parking routes, excluding streamed bodies.",
+        LATENCY_BUCKETS,
+    ),
+    "parking_encode_seconds": (
+        HISTOGRAM,
+        "Time spent encoding JSON responses of the parking routes.",
+        LATENCY_BUCKETS,
+    ),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # One count per bucket, plus the +Inf bucket; not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self):
+        # Updates are a few list and dict operations, guarded by one lock
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], int] = {}
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(FAMILIES[name][2])
+            histogram.observe(value)
+
+    def inc(self, name: str, value: int = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def get_histogram(self, name: str, **labels) -> Histogram:
+        # Snapshot of a histogram, empty if nothing was observed
+        key = (name, tuple(sorted(labels.items())))
+        snapshot = Histogram(FAMILIES[name][2])
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is not None:
+                snapshot.counts = list(histogram.counts)
+                snapshot.sum = histogram.sum
+                snapshot.count = histogram.count
+        return snapshot
+
+    def get_counter(self, name: str, **labels) -> int:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = [
+                (key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()
+            ]
+            counters = list(self._counters.items())
+
+        by_family: Dict[str, List[str]] = {name: [] for name in FAMILIES}
+        for (name, labels), counts, total, count in sorted(histograms):
+            lines = by_family[name]
+            cumulative = 0
+            bounds = [*FAMILIES[name][2], float("inf")]
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", _format_value(bound)),)
+                lines.append(
+                    f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            by_family[name].append(f"{name}{_format_labels(labels)} {value}")
+
+        output = []
+        for name, (family_type, help_text, _) in FAMILIES.items():
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {family_type}")
+            output.extend(by_family[name])
+        return "\n".join(output) + "\n"
@@ -1,16 +1,31 @@
+import bisect
+import contextlib
+import heapq
+import itertools
 import math
+import threading
 import time
+from array import array
 from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+from .allocation import NEAREST, make_strategy
+from .events import HOLD, MOVE, PARK, RELEASE, UNPARK
 from .parkingerrs import (
     AlreadyParkedError,
+    HoldNotExistsError,
     InvalidEntryPointError,
+    InvalidHoldError,
     InvalidSizeError,
+    InvalidTariffError,
+    InvalidTimeError,
     NoSlotAvailableError,
+    ParkingError,
+    SlotNotExistsError,
     VehicleNotExistsError,
 )
+from .slotindex import NearestSlotIndex
 
 
 class Size(IntEnum):
@@ -21,20 +36,180 @@ class Size(IntEnum):
 
 SlotLocation = tuple
 
+# Used in place of the locks when ParkingSystem is not thread safe
+_NO_LOCK = contextlib.nullcontext()
+
+
+class Listing:
+    # Iterator over the slots or vehicles of a listing, see iter_slots() and
+    # iter_vehicles(). position is the cursor to resume the listing from
+    # after the items taken so far.
+    __slots__ = ("position", "_items")
+
+    def __init__(self, items: Iterator[Tuple[int, Any]], start: int = 0):
+        # items yields (position after the item, item)
+        self._items = items
+        self.position = start
+
+    def __iter__(self) -> "Listing":
+        return self
+
+    def __next__(self):
+        self.position, item = next(self._items)
+        return item
+
+
+def _iter_values(mapping, start: int, stop: Optional[int]):
+    # (position after the value, value) from position start to stop.
+    # Tolerates insertions into the mapping while being consumed, e.g. by a
+    # streamed response.
+    position = start
+    while True:
+        try:
+            for value in itertools.islice(mapping.values(), position, stop):
+                position += 1
+                yield position, value
+            return
+        except RuntimeError:
+            # Mapping changed size, resume from the same position
+            continue
+
+
+def _timed(metrics, operation: str, method):
+    # method, recording its latency and ParkingErrors to metrics
+    perf_counter = time.perf_counter
+
+    def timed_method(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except ParkingError as err:
+            metrics.inc("parking_errors_total", error=type(err).__name__)
+            raise
+        finally:
+            metrics.observe(
+                "parking_operation_seconds",
+                perf_counter() - start,
+                operation=operation,
+            )
+
+    return timed_method
+
 
 @dataclass
 class Slot:
     location: SlotLocation
     size: Size
     is_vacant: bool = True
+    # Position of the slot in the lot, which stays the same when it moves
+    id: int = 0
 
 
 @dataclass
 class ParkingLog:
+    # Location of the slot when the vehicle parked
     slot_location: SlotLocation
     time_parked: float
     time_unparked: Optional[float] = None
     charge: Optional[int] = None
+    # Slot the log refers to, looked up by slot_location when None
+    slot_id: Optional[int] = field(default=None, compare=False)
+
+
+@dataclass
+class Hold:
+    id: int
+    slot_id: int
+    # Location of the held slot, follows the slot when it moves
+    slot_location: SlotLocation
+    expires_at: float
+
+
+@dataclass
+class BillingState:
+    # Running state of a continuous rate chain, so that a charge can be
+    # computed without walking the chain's parking logs again.
+    total_hours_consumed: int = 0
+    total_charge: int = 0
+    current_start_time: Optional[float] = None
+    paid_charge: int = 0
+    # Number of logs billed in the chain
+    chain_length: int = 0
+
+
+HOURS_IN_DAY = 24
+
+
+def _is_amount(value) -> bool:
+    # Rates and hours are non-negative ints, bools are not amounts
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+@dataclass
+class Tariff:
+    # Charged for the first flat_hours of a stay
+    flat_rate: int = 40
+    flat_hours: int = 3
+    # Charged per full day, the remaining hours use the hour rates
+    daily_rate: int = 5000
+    hour_rates: Dict[Size, int] = field(
+        default_factory=lambda: {Size.SMALL: 20, Size.MEDIUM: 60, Size.LARGE: 100}
+    )
+
+    def __post_init__(self):
+        for name in ("flat_rate", "flat_hours", "daily_rate"):
+            if not _is_amount(getattr(self, name)):
+                raise InvalidTariffError(f"Invalid tariff {name}")
+        if self.flat_hours >= HOURS_IN_DAY:
+            raise InvalidTariffError("Invalid tariff flat_hours")
+
+        if not isinstance(self.hour_rates, dict) or {*self.hour_rates} != {*Size}:
+            raise InvalidTariffError("Invalid tariff hour_rates")
+        if not all(map(_is_amount, self.hour_rates.values())):
+            raise InvalidTariffError("Invalid tariff hour_rates")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Tariff":
+        # hour_rates is given as a list indexed by size
+        if not isinstance(data, dict):
+            raise InvalidTariffError("Invalid tariff")
+        data = dict(data)
+        if "hour_rates" in data:
+            hour_rates = data["hour_rates"]
+            if not isinstance(hour_rates, list) or len(hour_rates) != len(Size):
+                raise InvalidTariffError("Invalid tariff hour_rates")
+            data["hour_rates"] = dict(zip(Size, hour_rates))
+
+        try:
+            return cls(**data)
+        except TypeError:
+            raise InvalidTariffError("Invalid tariff")
+
+    def compile(self) -> "CompiledTariff":
+        return CompiledTariff(self)
+
+
+class CompiledTariff:
+    # Lookup tables of a Tariff, indexed by size and then by hours consumed:
+    # - stay_charges: charge of a chain of less than a day billed from the
+    #   flat rate, i.e. flat_rate then hour rates past flat_hours.
+    # - hour_charges: hours * hour rate, for 0 to HOURS_IN_DAY hours.
+    def __init__(self, tariff: Tariff):
+        self.tariff = tariff
+        self.flat_hours = tariff.flat_hours
+        self.daily_rate = tariff.daily_rate
+        self.stay_charges = tuple(
+            tuple(
+                tariff.flat_rate
+                + max(hours - tariff.flat_hours, 0) * tariff.hour_rates[size]
+                for hours in range(HOURS_IN_DAY)
+            )
+            for size in Size
+        )
+        self.hour_charges = tuple(
+            tuple(hours * tariff.hour_rates[size] for hours in range(HOURS_IN_DAY + 1))
+            for size in Size
+        )
 
 
 @dataclass
@@ -43,52 +218,497 @@ class Vehicle:
     size: Size
     is_parked: bool = False
     parking_logs: List[ParkingLog] = field(default_factory=list)
+    billing: BillingState = field(default_factory=BillingState)
 
     def add_log(self, log: ParkingLog):
         self.parking_logs.append(log)
 
+    def compact_logs(self, keep: int = 1) -> List[ParkingLog]:
+        # Charges only depend on the billing state, so older logs can be
+        # dropped. The last log is always kept since park() and unpark() use
+        # it. Returns the removed logs, e.g. for archiving.
+        keep = max(keep, 1)
+        removed = self.parking_logs[:-keep]
+        del self.parking_logs[:-keep]
+        return removed
+
+
+DEFAULT_TARIFF = Tariff()
+
 
 class ParkingSystem:
-    HOUR_RATES = {Size.SMALL: 20, Size.MEDIUM: 60, Size.LARGE: 100}
+    HOUR_RATES = DEFAULT_TARIFF.hour_rates
     HOURS_IN_SEC = 60 * 60
+    VEHICLE_LOCK_STRIPES = 64
+    # Idle vehicles swept by each park and unpark, see sweep_idle()
+    SWEEP_BATCH = 2
 
-    def __init__(self, entry_points: int, slots: List[tuple], sizes: List[int]):
+    def __init__(
+        self,
+        entry_points: int,
+        slots: List[tuple],
+        sizes: List[int],
+        thread_safe: bool = False,
+        tariff: Optional[Tariff] = None,
+        slot_store=None,
+        metrics=None,
+        events=None,
+        evict_idle: bool = False,
+        evict_sink=None,
+        strategy=NEAREST,
+    ):
         self._entry_points = entry_points
+        self._tariff = (tariff or DEFAULT_TARIFF).compile()
+        # {slot id: Slot}, and the id of each location
         self._slots = {}
+        self._slot_ids = {}
         self._vehicles = {}
+        self._init_vehicle_order()
+
+        # Operations on the same plate number are serialized by a striped
+        # vehicle lock, while claiming or releasing a slot only holds the slot
+        # lock for the index lookup and the vacancy update.
+        self._vehicle_locks = None
+        self._slot_lock = _NO_LOCK
+        if thread_safe:
+            self._vehicle_locks = [
+                threading.Lock() for _ in range(self.VEHICLE_LOCK_STRIPES)
+            ]
+            self._slot_lock = threading.Lock()
+
+        # Initialize slots, numbered in order. A repeated location keeps its
+        # first id and its last size. slot_store, e.g. ArraySlotStore, builds
+        # a mapping to use in place of the dict of Slot.
+        if slot_store is not None:
+            self._slots = slot_store(entry_points, slots, sizes)
+            self._slot_ids = self._slots.slot_ids
+        else:
+            valid_sizes = {*Size}
+            for location, size in zip(slots, sizes):
+                if size not in valid_sizes:
+                    raise InvalidSizeError("Invalid slot size")
+                slot_id = self._slot_ids.get(location)
+                if slot_id is None:
+                    slot_id = self._slot_ids[location] = len(self._slots)
+                self._slots[slot_id] = Slot(location, size, id=slot_id)
+
+        self._index = NearestSlotIndex(entry_points, len(Size), self._slots)
+        self._count_vacancies()
+        self._init_holds()
+        # MetricsRegistry recorded to, see _instrument()
+        self._metrics = None
+        # Picks the slots of parks and holds, see backend.models.allocation
+        self.set_strategy(strategy)
+
+        # Min-heap of (time unparked, plate number) of the vehicles to evict
+        # once they are idle, None when vehicles are kept, see sweep_idle().
+        # evict_sink is called with each evicted vehicle.
+        self._idle: Optional[List[Tuple[float, str]]] = [] if evict_idle else None
+        self._evict_sink = evict_sink
 
-        # Initialize slots
-        for i in range(len(slots)):
-            if sizes[i] not in {*Size}:
-                raise InvalidSizeError("Invalid slot size")
-            self._slots[slots[i]] = Slot(slots[i], sizes[i])
+        # Records park/unpark operations when attached, see Journal.attach()
+        self._journal = None
+        # Path of the layout file the slots are mapped from, see
+        # backend.models.layout
+        self._layout = None
+        # EventLog the slot state changes are published to
+        self._events = events
+        # LogArchive closed sessions go to when attached, see
+        # LogArchive.attach()
+        self._archive = None
 
-    def add_entry_points(self: int, updates: Dict[str, tuple]) -> None:
-        # TODO: Implement adding entry points and updating slots
-        # Update self._slots keys -- use uuid4
-        # updates -> { slot_id: new_location }
-        pass
+        if metrics is not None:
+            self._instrument(metrics)
+
+    @classmethod
+    def from_snapshot(cls, state: dict, **kwargs) -> "ParkingSystem":
+        # Parks replayed on top of the snapshot must pick the same slots
+        kwargs.setdefault("strategy", state.get("strategy", NEAREST))
+        parking_system = cls(
+            state["entry_points"],
+            [location for location, _, _ in state["slots"]],
+            [size for _, size, _ in state["slots"]],
+            tariff=state["tariff"],
+            **kwargs,
+        )
+
+        for slot_id, (_, _, is_vacant) in enumerate(state["slots"]):
+            parking_system._slots[slot_id].is_vacant = is_vacant
+        parking_system._index = NearestSlotIndex(
+            parking_system._entry_points, len(Size), parking_system._slots
+        )
+        parking_system._count_vacancies()
+        parking_system._strategy.reset()
+        parking_system._restore_state(state)
+        return parking_system
+
+    def _restore_state(self, state: dict) -> None:
+        # Vehicles and holds of a snapshot, once the slots are restored. Held
+        # slots come back not vacant along with the other slots.
+        self._vehicles = {
+            vehicle.plate_number: vehicle for vehicle in state["vehicles"]
+        }
+        for plate_number in self._vehicles:
+            self._list_vehicle(plate_number)
+        if self._idle is not None:
+            self._idle = [
+                (vehicle.parking_logs[-1].time_unparked, vehicle.plate_number)
+                for vehicle in state["vehicles"]
+                if not vehicle.is_parked and vehicle.parking_logs
+            ]
+            heapq.heapify(self._idle)
+        for hold in state.get("holds", ()):
+            self._add_hold(hold)
+        self._next_hold_id = state.get("next_hold_id", 0)
+
+    def snapshot(self) -> dict:
+        # Refers to the live slots and vehicles, serialize it under
+        # _exclusive() to get a consistent copy.
+        state = dict(
+            entry_points=self._entry_points,
+            vehicles=list(self._vehicles.values()),
+            tariff=self._tariff.tariff,
+            holds=list(self._holds.values()),
+            next_hold_id=self._next_hold_id,
+            strategy=self._strategy.name,
+        )
+        if self._layout is None:
+            state["slots"] = [
+                (slot.location, slot.size, slot.is_vacant)
+                for slot in self._slots.values()
+            ]
+        else:
+            # Slots of a layout cannot be moved, only their vacancy changes,
+            # see layout.restore_layout
+            state.update(
+                layout=self._layout,
+                slots_len=len(self._slots),
+                vacancy=bytes(self._slots.vacancy),
+                vacant_counts=list(self._vacant_counts),
+                zone_vacant_counts=[list(c) for c in self._zone_vacant_counts],
+            )
+        return state
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        # Holds every lock, so that no operation is in progress
+        with contextlib.ExitStack() as stack:
+            for lock in self._vehicle_locks or ():
+                stack.enter_context(lock)
+            stack.enter_context(self._slot_lock)
+            yield
+
+    def _instrument(self, metrics) -> None:
+        # Shadows the hot path methods of this instance with ones recording
+        # to metrics, so that systems without metrics run the plain methods.
+        self._metrics = metrics
+        accrue_charge = _timed(metrics, "charge", self._accrue_charge)
+
+        def counted_accrue_charge(billing: BillingState, current_log: ParkingLog):
+            total_charge = accrue_charge(billing, current_log)
+            metrics.observe("parking_log_chain_length", billing.chain_length)
+            return total_charge
+
+        self.park = _timed(metrics, "park", self.park)
+        self.park_hold = _timed(metrics, "park_hold", self.park_hold)
+        self.unpark = _timed(metrics, "unpark", self.unpark)
+        self._accrue_charge = counted_accrue_charge
+        self._instrument_select()
+
+    def _instrument_select(self) -> None:
+        # The slot selection of the current strategy, whichever it is, so
+        # that set_strategy() keeps the selection metrics
+        metrics = self._metrics
+        select = _timed(metrics, "select_slot", self._strategy.select)
+
+        def counted_select(size, entry_point: int):
+            index = self._index
+            dropped = index.dropped
+            slot = select(size, entry_point)
+            # One heap top per fitting slot size, plus taken slots dropped
+            metrics.observe(
+                "parking_slots_scanned",
+                len(Size) - size + index.dropped - dropped,
+            )
+            return slot
+
+        self._select_slot = counted_select
+
+    def add_entry_points(
+        self, entry_points: Optional[int], updates: Dict[int, SlotLocation]
+    ) -> None:
+        # Grows the lot to entry_points entry points and moves slots, by id,
+        # to the new locations in updates. Locations hold a distance per entry
+        # point, so adding entry points takes a location for every slot.
+        # Slots keep their id, vacancy and parked vehicle, and the slot index
+        # is only updated for the slots whose distances changed. None keeps
+        # the entry points and only moves slots.
+        with self._exclusive():
+            if entry_points is None:
+                entry_points = self._entry_points
+            updates = self._check_updates(entry_points, updates)
+            for vehicle in self._vehicles.values():
+                # Logs from before slot ids refer to the slot by location
+                current_log = vehicle.parking_logs[-1]
+                if current_log.slot_id is None:
+                    current_log.slot_id = self._slot_ids[current_log.slot_location]
+
+            old_locations = {}
+            old_zones = []
+            for slot_id in updates:
+                slot = self._slots[slot_id]
+                old_locations[slot_id] = slot.location
+                if slot.is_vacant:
+                    old_zones.append((self._zone(slot), slot.size))
+
+            self._move_slots(entry_points, updates)
+            for zone, size in old_zones:
+                self._zone_vacant_counts[zone][size] -= 1
+            added = entry_points - self._entry_points
+            self._zone_vacant_counts += [[0] * len(Size) for _ in range(added)]
+            self._entry_points = entry_points
+            for slot_id in updates:
+                slot = self._slots[slot_id]
+                self._zones[slot_id] = self._locate_zone(slot)
+                if slot.is_vacant:
+                    self._zone_vacant_counts[self._zone(slot)][slot.size] += 1
+            self._index.relocate(entry_points, old_locations)
+            self._strategy.reset()
+
+            for vehicle in self._vehicles.values():
+                # Open logs follow their slot to its new location
+                current_log = vehicle.parking_logs[-1]
+                if vehicle.is_parked and current_log.slot_id in updates:
+                    current_log.slot_location = updates[current_log.slot_id]
+            for hold in self._holds.values():
+                if hold.slot_id in updates:
+                    hold.slot_location = updates[hold.slot_id]
+
+            events = self._events
+            if events is not None:
+                now = time.time()
+                for slot_id in updates:
+                    events.publish(MOVE, now, self._slots[slot_id])
+
+            journal = self._journal
+            if journal is not None:
+                journal_seq = journal.record_update(entry_points, updates)
+
+        if journal is not None:
+            journal.commit(journal_seq)
+
+    def _check_updates(
+        self, entry_points: int, updates: Dict[int, SlotLocation]
+    ) -> Dict[int, SlotLocation]:
+        if not isinstance(entry_points, int) or entry_points < self._entry_points:
+            raise InvalidEntryPointError("Invalid entry points.")
+
+        checked = {}
+        for slot_id, location in updates.items():
+            if self._slots.get(slot_id) is None:
+                raise SlotNotExistsError("Slot does not exist.")
+            if not isinstance(location, (list, tuple)):
+                raise InvalidEntryPointError("Invalid slot location")
+            location = tuple(location)
+            if len(location) != entry_points or not all(
+                isinstance(distance, (int, float))
+                and not isinstance(distance, bool)
+                and math.isfinite(distance)
+                for distance in location
+            ):
+                raise InvalidEntryPointError("Invalid slot location")
+            checked[slot_id] = location
+
+        if entry_points > self._entry_points and len(checked) != len(self._slots):
+            raise InvalidEntryPointError("Missing slot location")
+        # A location may only be taken by one slot, including slots staying
+        if len({*checked.values()}) != len(checked) or any(
+            self._slot_ids.get(location, slot_id) not in checked
+            for slot_id, location in checked.items()
+        ):
+            raise InvalidEntryPointError("Duplicate slot location")
+        return checked
+
+    def _move_slots(self, entry_points: int, updates: Dict[int, SlotLocation]):
+        # Must hold every lock. Stores other than a dict move their own slots.
+        if not isinstance(self._slots, dict):
+            self._slots.relocate(entry_points, updates)
+            return
+
+        for slot_id in updates:
+            del self._slot_ids[self._slots[slot_id].location]
+        for slot_id, location in updates.items():
+            self._slots[slot_id].location = location
+            self._slot_ids[location] = slot_id
+
+    def _vehicle_lock(self, plate_number: str):
+        if self._vehicle_locks is None:
+            return _NO_LOCK
+        return self._vehicle_locks[hash(plate_number) % self.VEHICLE_LOCK_STRIPES]
+
+    def get_tariff(self) -> Tariff:
+        return self._tariff.tariff
+
+    def get_entry_points(self) -> int:
+        return self._entry_points
 
     def get_slots(self) -> List[Slot]:
         return list(self._slots.values())
 
+    def iter_slots(self, start: int = 0, stop: Optional[int] = None) -> Listing:
+        # Slots from id start to before stop
+        return Listing(_iter_values(self._slots, start, stop), start)
+
     def get_slot(self, slot_location: SlotLocation) -> Slot:
-        return self._slots.get(slot_location)
+        slot_id = self._slot_ids.get(slot_location)
+        return None if slot_id is None else self._slots[slot_id]
+
+    def get_slot_by_id(self, slot_id: int) -> Slot:
+        return self._slots.get(slot_id)
+
+    def _log_slot(self, log: ParkingLog) -> Slot:
+        if log.slot_id is None:
+            return self.get_slot(log.slot_location)
+        return self._slots[log.slot_id]
 
     def get_vehicles(self) -> List[Vehicle]:
         return list(self._vehicles.values())
 
+    def iter_vehicles(self, start: int = 0, stop: Optional[int] = None) -> Listing:
+        # Vehicles in the order they were added, from position start to
+        # before stop. Positions are sequence numbers given to the vehicles as
+        # they are added, so evicting vehicles does not shift them.
+        return Listing(self._iter_vehicle_order(start, stop), start)
+
+    def _init_vehicle_order(self) -> None:
+        # Sequence number of each vehicle, and the (sequence numbers, plate
+        # numbers) of the vehicles in the order added, None when the vehicles
+        # are listed some other way. Entries of evicted vehicles stay behind
+        # until compacted, see _unlist_vehicle.
+        self._vehicle_seqs: Optional[Dict[str, int]] = {}
+        self._vehicle_order: Tuple[array, List[str]] = (array("q"), [])
+        self._next_vehicle_seq = 0
+
+    def _list_vehicle(self, plate_number: str) -> None:
+        # Must hold the slot lock
+        seqs, plate_numbers = self._vehicle_order
+        seq = self._next_vehicle_seq
+        self._next_vehicle_seq += 1
+        self._vehicle_seqs[plate_number] = seq
+        # Appended plate number first, for iterators that read both
+        plate_numbers.append(plate_number)
+        seqs.append(seq)
+
+    def _unlist_vehicle(self, plate_number: str) -> None:
+        # Must hold the slot lock
+        del self._vehicle_seqs[plate_number]
+        seqs, plate_numbers = self._vehicle_order
+        # Compacted once evicted vehicles outnumber the others, and a few
+        evicted = len(seqs) - len(self._vehicle_seqs)
+        if evicted > max(len(self._vehicle_seqs), 64):
+            # Iterators carry on over the old lists
+            vehicle_seqs = self._vehicle_seqs
+            live = [
+                (seq, plate_number)
+                for seq, plate_number in zip(seqs, plate_numbers)
+                if vehicle_seqs.get(plate_number) == seq
+            ]
+            self._vehicle_order = (
+                array("q", [seq for seq, _ in live]),
+                [plate_number for _, plate_number in live],
+            )
+
+    def _iter_vehicle_order(self, start: int, stop: Optional[int]):
+        # (position after the vehicle, vehicle), including vehicles added
+        # while being consumed
+        position = start
+        while True:
+            order = self._vehicle_order
+            seqs, plate_numbers = order
+            end = len(seqs)
+            i = bisect.bisect_left(seqs, position, 0, end)
+            while i < end:
+                seq = seqs[i]
+                if stop is not None and seq >= stop:
+                    return
+                plate_number = plate_numbers[i]
+                i += 1
+                position = seq + 1
+                if self._vehicle_seqs.get(plate_number) == seq:
+                    vehicle = self._vehicles.get(plate_number)
+                    if vehicle is not None:
+                        yield position, vehicle
+            if self._vehicle_order is order and len(seqs) == end:
+                return
+
     def get_vehicle(self, plate_number: str) -> Vehicle:
         return self._vehicles.get(plate_number)
 
     def get_nearest_slot(self, size, entry_point: int) -> Optional[Slot]:
-        vacant_slots = filter(
-            lambda slot: slot.is_vacant and slot.size >= size, self._slots.values()
-        )
-        sorted_slots = sorted(vacant_slots, key=lambda item: item.location[entry_point])
-        if not sorted_slots:
-            return None
-        return sorted_slots[0]
+        return self._index.nearest(size, entry_point)
+
+    def get_strategy(self) -> str:
+        return self._strategy.name
+
+    def set_strategy(self, strategy) -> None:
+        # Allocation strategy by name or AllocationStrategy subclass, for the
+        # parks and holds to come
+        self._strategy = make_strategy(strategy, self)
+        self._select_slot = self._strategy.select
+        self._vacancy_changed = self._strategy.vacancy_changed
+        if self._metrics is not None:
+            self._instrument_select()
+
+    def _zone(self, slot: Slot) -> int:
+        return self._zones[slot.id]
+
+    def _locate_zone(self, slot: Slot) -> int:
+        # Slots are zoned by their nearest entry point, the first one on ties
+        location = slot.location
+        return min(range(self._entry_points), key=location.__getitem__)
+
+    def _init_zones(self) -> None:
+        # Zone of each slot by id, located once rather than on every vacancy
+        # update, and again when the slot moves
+        self._zones = array("q", map(self._locate_zone, self._slots.values()))
+
+    def _count_vacancies(self) -> None:
+        # Vacant slots per slot size, overall and per zone
+        self._init_zones()
+        self._vacant_counts = [0] * len(Size)
+        self._zone_vacant_counts = [[0] * len(Size) for _ in range(self._entry_points)]
+        for slot in self._slots.values():
+            if slot.is_vacant:
+                self._vacant_counts[slot.size] += 1
+                self._zone_vacant_counts[self._zone(slot)][slot.size] += 1
+
+    def _set_vacancy(self, slot: Slot, is_vacant: bool) -> None:
+        # Must hold the slot lock
+        delta = 1 if is_vacant else -1
+        slot.is_vacant = is_vacant
+        self._vacant_counts[slot.size] += delta
+        zone = self._zone(slot)
+        self._zone_vacant_counts[zone][slot.size] += delta
+        if self._vacancy_changed is not None:
+            self._vacancy_changed(zone, slot)
+
+    def _counts(self, entry_point: Optional[int]) -> List[int]:
+        if entry_point is None:
+            return self._vacant_counts
+        if entry_point not in range(self._entry_points):
+            raise InvalidEntryPointError("Invalid entry point.")
+        return self._zone_vacant_counts[entry_point]
+
+    def count_vacant(
+        self, size: int = Size.SMALL, entry_point: Optional[int] = None
+    ) -> int:
+        # Vacant slots that fit a vehicle of the given size, in the zone of
+        # entry_point or in the whole lot
+        return sum(self._counts(entry_point)[size:])
+
+    def get_vacant_counts(self, entry_point: Optional[int] = None) -> List[int]:
+        # Vacant slots per slot size, in the zone of entry_point or overall
+        return list(self._counts(entry_point))
 
     def park(
         self, vehicle: Vehicle, entry_point: int, time_parked=None
@@ -98,113 +718,490 @@ class ParkingSystem:
 
         if time_parked is None:
             time_parked = time.time()
-        saved_vehicle = self._vehicles.get(vehicle.plate_number)
-        if saved_vehicle:
-            if saved_vehicle.is_parked:
-                raise AlreadyParkedError("Vehicle already parked.")
-            # Check for continuous rate parking
-            current_log = saved_vehicle.parking_logs[-1]
+        return self._park(vehicle, time_parked, entry_point, None)
 
-            # Make sure we don't get negative difference
-            assert time_parked >= current_log.time_unparked
-            if time_parked - current_log.time_unparked < self.HOURS_IN_SEC:
-                vehicle = saved_vehicle
+    def park_hold(
+        self, vehicle: Vehicle, hold_id: int, time_parked=None
+    ) -> Optional[SlotLocation]:
+        # Parks vehicle in the slot of a hold, which ends the hold
+        if time_parked is None:
+            time_parked = time.time()
+        return self._park(vehicle, time_parked, None, hold_id)
+
+    def _park(
+        self,
+        vehicle: Vehicle,
+        time_parked: float,
+        entry_point: Optional[int],
+        hold_id: Optional[int],
+    ) -> SlotLocation:
+        # Journal sequence number of the holds expired on the way, committed
+        # by the park unless it fails
+        expired_seq = None
+        try:
+            with self._vehicle_lock(vehicle.plate_number):
+                saved_vehicle = self._vehicles.get(vehicle.plate_number)
+                if saved_vehicle:
+                    if saved_vehicle.is_parked:
+                        raise AlreadyParkedError("Vehicle already parked.")
+                    # Check for continuous rate parking
+                    current_log = saved_vehicle.parking_logs[-1]
+
+                    # Make sure we don't get negative difference
+                    if time_parked < current_log.time_unparked:
+                        raise InvalidTimeError("Parked before the last unpark.")
+                    if time_parked - current_log.time_unparked < self.HOURS_IN_SEC:
+                        vehicle = saved_vehicle
+
+                with self._slot_lock:
+                    expiries = self._hold_expiries
+                    if expiries and expiries[0][0] <= time_parked:
+                        expired_journal = self._journal
+                        expired_seq = self._expire_holds(time_parked)
+
+                    if hold_id is None:
+                        # Full lots are turned away without looking for a slot
+                        slot = None
+                        if self.count_vacant(vehicle.size):
+                            slot = self._select_slot(vehicle.size, entry_point)
+                        if slot is None:
+                            raise NoSlotAvailableError("No slots available.")
+                        # Claim the slot before any other thread can look for one
+                        self._set_vacancy(slot, False)
+                    else:
+                        # The held slot is already claimed
+                        slot = self._claim_hold(hold_id, vehicle.size)
+
+                    # Journal in the order slots are claimed, for replays to match
+                    journal = self._journal
+                    if journal is not None:
+                        if hold_id is None:
+                            journal_seq = journal.record_park(
+                                vehicle.plate_number,
+                                vehicle.size,
+                                entry_point,
+                                time_parked,
+                            )
+                        else:
+                            journal_seq = journal.record_park_hold(
+                                vehicle.plate_number, vehicle.size, hold_id, time_parked
+                            )
+
+                    events = self._events
+                    if events is not None:
+                        events.publish(
+                            PARK, time_parked, slot, vehicle.plate_number, None, hold_id
+                        )
+
+                vehicle.add_log(
+                    ParkingLog(
+                        time_parked=time_parked,
+                        slot_location=slot.location,
+                        slot_id=slot.id,
+                    )
+                )
+
+                # Set attributes after parking
+                vehicle.is_parked = True
+
+                # Update/insert vehicle
+                self._vehicles[vehicle.plate_number] = vehicle
+                vehicle_seqs = self._vehicle_seqs
+                if (
+                    vehicle_seqs is not None
+                    and vehicle.plate_number not in vehicle_seqs
+                ):
+                    with self._slot_lock:
+                        self._list_vehicle(vehicle.plate_number)
+        except Exception:
+            if expired_seq is not None:
+                expired_journal.commit(expired_seq)
+            raise
+
+        if journal is not None:
+            journal.commit(journal_seq)
+
+        if self._idle is not None:
+            self.sweep_idle(time_parked, self.SWEEP_BATCH)
+
+        return slot.location
+
+    def _init_holds(self) -> None:
+        # Holds by id, and a min-heap of (expires_at, hold id) over them.
+        # Entries of holds parked in or cancelled stay in the heap until they
+        # reach its top, where they are dropped.
+        self._holds: Dict[int, Hold] = {}
+        self._hold_expiries: List[Tuple[float, int]] = []
+        self._next_hold_id = 0
+
+    def _add_hold(self, hold: Hold) -> None:
+        # Must hold the slot lock, the slot is already claimed
+        self._holds[hold.id] = hold
+        heapq.heappush(self._hold_expiries, (hold.expires_at, hold.id))
+
+    def _release_hold(self, hold: Hold, now: float) -> None:
+        # Must hold the slot lock
+        del self._holds[hold.id]
+        slot = self._slots[hold.slot_id]
+        self._set_vacancy(slot, True)
+        self._index.release(slot.id)
+
+        events = self._events
+        if events is not None:
+            events.publish(RELEASE, now, slot, hold_id=hold.id)
+
+    def _expire_holds(self, now: float) -> Optional[int]:
+        # Must hold the slot lock. Releases the slots of the holds expired by
+        # now. Expiring is journaled on its own, since the operation that
+        # expired the holds may still fail. Returns the journal sequence
+        # number, if any.
+        expired = False
+        expiries = self._hold_expiries
+        while expiries and expiries[0][0] <= now:
+            _, hold_id = heapq.heappop(expiries)
+            hold = self._holds.get(hold_id)
+            if hold is not None:
+                self._release_hold(hold, now)
+                expired = True
+
+        journal = self._journal
+        if expired and journal is not None:
+            return journal.record_expire_holds(now)
+        return None
+
+    def _claim_hold(self, hold_id: int, size: int) -> Slot:
+        # Must hold the slot lock. Ends the hold and returns its slot, which
+        # stays claimed.
+        hold = self._holds.get(hold_id)
+        if hold is None:
+            raise HoldNotExistsError("Hold does not exist.")
+        slot = self._slots[hold.slot_id]
+        if size > slot.size:
+            raise InvalidSizeError("Vehicle does not fit the held slot.")
+        del self._holds[hold_id]
+        return slot
+
+    def get_hold(self, hold_id: int) -> Optional[Hold]:
+        return self._holds.get(hold_id)
+
+    def get_holds(self) -> List[Hold]:
+        return list(self._holds.values())
+
+    def hold(self, size, entry_point: int, duration: float, time_held=None) -> Hold:
+        # Holds the nearest vacant slot fitting size for duration seconds,
+        # e.g. for a vehicle on its way. The slot is taken off the vacant
+        # slots until the hold is parked in with park_hold(), cancelled, or
+        # expires. Expired holds are released by the next operation past
+        # their expiry, or by the next read of the routes, see
+        # expire_holds().
+        if entry_point not in range(self._entry_points):
+            raise InvalidEntryPointError("Invalid entry point.")
+        if size not in {*Size}:
+            raise InvalidSizeError("Invalid vehicle size")
+        if (
+            not isinstance(duration, (int, float))
+            or isinstance(duration, bool)
+            or not 0 < duration < math.inf
+        ):
+            raise InvalidHoldError("Invalid hold duration")
+
+        if time_held is None:
+            time_held = time.time()
+        with self._slot_lock:
+            journal = self._journal
+            # Holds expired on the way are committed along with the hold, or
+            # on their own when no slot is left
+            journal_seq = self._expire_holds(time_held)
+
+            slot = None
+            if self.count_vacant(size):
+                slot = self._select_slot(size, entry_point)
+            if slot is not None:
+                self._set_vacancy(slot, False)
+                hold = Hold(
+                    self._next_hold_id, slot.id, slot.location, time_held + duration
+                )
+                self._next_hold_id += 1
+                self._add_hold(hold)
+
+                if journal is not None:
+                    journal_seq = journal.record_hold(
+                        size, entry_point, duration, time_held
+                    )
 
-        slot = self.get_nearest_slot(vehicle.size, entry_point)
+                events = self._events
+                if events is not None:
+                    events.publish(HOLD, time_held, slot, hold_id=hold.id)
+
+        if journal_seq is not None:
+            journal.commit(journal_seq)
         if slot is None:
             raise NoSlotAvailableError("No slots available.")
 
-        vehicle.add_log(
-            ParkingLog(time_parked=time_parked, slot_location=slot.location)
-        )
+        return hold
 
-        # Set attributes after parking
-        vehicle.is_parked = True
-        slot.is_vacant = False
+    def cancel_hold(self, hold_id: int) -> None:
+        with self._slot_lock:
+            hold = self._holds.get(hold_id)
+            if hold is None:
+                raise HoldNotExistsError("Hold does not exist.")
+            self._release_hold(hold, time.time())
 
-        # Update/insert vehicle
-        self._vehicles[vehicle.plate_number] = vehicle
+            journal = self._journal
+            if journal is not None:
+                journal_seq = journal.record_cancel_hold(hold_id)
 
-        return slot.location
+        if journal is not None:
+            journal.commit(journal_seq)
+
+    def holds_expired(self, now=None) -> bool:
+        # Whether expire_holds(now) has anything to do, without taking the
+        # slot lock. The heap top is read through a slice, which cannot fail
+        # if another thread pops it meanwhile.
+        if now is None:
+            now = time.time()
+        top = self._hold_expiries[:1]
+        return bool(top) and top[0][0] <= now
+
+    def expire_holds(self, now=None) -> int:
+        # Releases the slots of the holds expired by now, so that they count
+        # as vacant before the next park or hold comes. The routes expire
+        # holds before reading slots or vacancies. Returns how many holds
+        # expired.
+        if now is None:
+            now = time.time()
+        if not self.holds_expired(now):
+            return 0
+        with self._slot_lock:
+            holds_len = len(self._holds)
+            journal = self._journal
+            journal_seq = self._expire_holds(now)
+            expired = holds_len - len(self._holds)
+
+        if journal_seq is not None:
+            journal.commit(journal_seq)
+
+        return expired
+
+    def park_many(
+        self, requests: Sequence[Tuple], time_parked=None
+    ) -> List[Union[SlotLocation, Exception]]:
+        # Each request is (vehicle, entry_point) or (vehicle, entry_point,
+        # time_parked). Requests are served in order against the same slot
+        # index, so results match calling park() once per request. Failures
+        # are returned in place of the location instead of being raised,
+        # whatever they are, so that every request gets a result.
+        if time_parked is None:
+            time_parked = time.time()
+
+        results = []
+        for vehicle, entry_point, *request_time in requests:
+            vehicle_time_parked = time_parked
+            if request_time and request_time[0] is not None:
+                vehicle_time_parked = request_time[0]
+
+            try:
+                results.append(self.park(vehicle, entry_point, vehicle_time_parked))
+            except Exception as exc:
+                results.append(exc)
+        return results
 
     def unpark(self, plate_number: str, time_unparked=None) -> int:
-        vehicle = self._vehicles.get(plate_number)
-        if vehicle is None or not vehicle.is_parked:
-            raise VehicleNotExistsError("Vehicle not parked.")
+        with self._vehicle_lock(plate_number):
+            vehicle = self._vehicles.get(plate_number)
+            if vehicle is None or not vehicle.is_parked:
+                raise VehicleNotExistsError("Vehicle not parked.")
+
+            if time_unparked is None:
+                time_unparked = time.time()
+            current_log = vehicle.parking_logs[-1]
+
+            # Make sure we don't get negative difference
+            if time_unparked < current_log.time_parked:
+                raise InvalidTimeError("Unparked before the last park.")
+            current_log.time_unparked = time_unparked
+            slot = self._log_slot(current_log)
+
+            billing = vehicle.billing
+            charge = self._accrue_charge(billing, current_log) - billing.paid_charge
+            billing.paid_charge += charge
+
+            # Set attributes after unparking
+            current_log.charge = charge
+            vehicle.is_parked = False
+
+            archive = self._archive
+            if archive is not None:
+                # Older logs are archived already, and the last one is kept
+                # for a return within the continuous rate window
+                archive.append(
+                    plate_number,
+                    slot.size,
+                    slot.id,
+                    current_log.time_parked,
+                    time_unparked,
+                    charge,
+                )
+                vehicle.compact_logs()
+            # Stores other than a dict hand out copies of the vehicle
+            self._vehicles[plate_number] = vehicle
+            with self._slot_lock:
+                # Holds expired on the way are committed along with the unpark
+                journal = self._journal
+                self._expire_holds(time_unparked)
+                self._set_vacancy(slot, True)
+                self._index.release(slot.id)
+
+                if journal is not None:
+                    journal_seq = journal.record_unpark(plate_number, time_unparked)
+
+                events = self._events
+                if events is not None:
+                    events.publish(UNPARK, time_unparked, slot, plate_number, charge)
+
+                idle = self._idle
+                if idle is not None:
+                    heapq.heappush(idle, (time_unparked, plate_number))
 
+        if journal is not None:
+            journal.commit(journal_seq)
+
+        if idle is not None:
+            self.sweep_idle(time_unparked, self.SWEEP_BATCH)
+
+        return charge
+
+    def sweep_idle(self, now=None, limit: Optional[int] = None) -> int:
+        # Evicts the vehicles unparked for the continuous rate window or more
+        # before now, which park() would bill from scratch anyway, so that
+        # the vehicles kept are the parked ones and the ones that may still
+        # come back at the continuous rate. Looks at up to limit unparks, so
+        # that park() and unpark() sweep a few each and keep up with the
+        # vehicles leaving; a background thread may sweep the rest. Returns
+        # the number of vehicles evicted.
+        #
+        # The window is measured back from now, so operations are expected
+        # to come in time order. Sweeps are not journaled: replays sweep
+        # along with the parks and unparks they replay, and a vehicle a
+        # replay would keep is billed the same as an evicted one.
+        if self._idle is None:
+            return 0
+        if now is None:
+            now = time.time()
+        cutoff = now - self.HOURS_IN_SEC
+
+        evicted = 0
+        swept = 0
+        while limit is None or swept < limit:
+            with self._slot_lock:
+                idle = self._idle
+                if not idle or idle[0][0] > cutoff:
+                    break
+                time_unparked, plate_number = heapq.heappop(idle)
+            swept += 1
+
+            with self._vehicle_lock(plate_number):
+                vehicle = self._vehicles.get(plate_number)
+                if (
+                    vehicle is None
+                    or vehicle.is_parked
+                    or vehicle.parking_logs[-1].time_unparked != time_unparked
+                ):
+                    # Parked again since, a later unpark has its own entry
+                    continue
+                del self._vehicles[plate_number]
+                with self._slot_lock:
+                    self._unlist_vehicle(plate_number)
+
+            if self._evict_sink is not None:
+                self._evict_sink(vehicle)
+            evicted += 1
+        return evicted
+
+    def unpark_many(
+        self, plate_numbers: Sequence[str], times_unparked=None, time_unparked=None
+    ) -> List[Union[int, Exception]]:
+        # times_unparked optionally gives a time per plate number, falling back
+        # to time_unparked for the whole batch. Failures are returned like in
+        # park_many().
         if time_unparked is None:
             time_unparked = time.time()
-        current_log = vehicle.parking_logs[-1]
+        if times_unparked is None:
+            times_unparked = [None] * len(plate_numbers)
+
+        results = []
+        for plate_number, plate_time_unparked in zip(plate_numbers, times_unparked):
+            if plate_time_unparked is None:
+                plate_time_unparked = time_unparked
 
+            try:
+                results.append(self.unpark(plate_number, plate_time_unparked))
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    def _get_charge(self, logs: List[ParkingLog]) -> int:
+        billing = BillingState()
+        for current_log in logs[:-1]:
+            self._accrue_charge(billing, current_log)
+            # Add all previous charges
+            billing.paid_charge += current_log.charge
+
+        return self._accrue_charge(billing, logs[-1]) - billing.paid_charge
+
+    def _accrue_charge(self, billing: BillingState, current_log: ParkingLog) -> int:
+        # Advance the billing state of a continuous rate chain by one log and
+        # return the total charge of the chain so far.
         # Make sure we don't get negative difference
-        assert time_unparked >= current_log.time_parked
-        current_log.time_unparked = time_unparked
-        slot = self._slots[current_log.slot_location]
+        assert current_log.time_unparked >= current_log.time_parked
 
-        charge = self._get_charge(vehicle.parking_logs)
+        current_start_time = billing.current_start_time
+        if current_start_time is None:
+            current_start_time = current_log.time_parked
 
-        # Set attributes after unparking
-        current_log.charge = charge
-        vehicle.is_parked = False
-        slot.is_vacant = True
+        # Use for continuous rate conditions
+        prev_total_hours_consumed = billing.total_hours_consumed
 
-        return charge
+        hours_consumed = (current_log.time_unparked - current_start_time) / (
+            self.HOURS_IN_SEC
+        )
 
-    def _get_charge(self, logs: List[ParkingLog]) -> int:
-        total_hours_consumed = 0
-        total_charge = 0
-        current_start_time = logs[0].time_parked
-
-        paid_charge = 0
-        logs_len = len(logs)
-        for i in range(logs_len):
-            current_log = logs[i]
-            # Make sure we don't get negative difference
-            assert current_log.time_unparked >= current_log.time_parked
+        hours_consumed_ceiled = math.ceil(hours_consumed)
+        total_hours_consumed = prev_total_hours_consumed + hours_consumed_ceiled
 
-            # Use for continuous rate conditions
-            prev_total_hours_consumed = total_hours_consumed
+        tariff = self._tariff
+        size = self._log_slot(current_log).size
 
-            hours_consumed = (current_log.time_unparked - current_start_time) / (
-                self.HOURS_IN_SEC
+        if total_hours_consumed < HOURS_IN_DAY and (
+            total_hours_consumed <= tariff.flat_hours
+            or prev_total_hours_consumed < tariff.flat_hours
+        ):
+            # Flat charge, or continous rate charge from flat charge
+            total_charge = tariff.stay_charges[size][total_hours_consumed]
+        elif (
+            total_hours_consumed >= HOURS_IN_DAY
+            and prev_total_hours_consumed < HOURS_IN_DAY
+        ) or hours_consumed > HOURS_IN_DAY - (prev_total_hours_consumed % HOURS_IN_DAY):
+            # Compute charge for daily rate
+            # Case #1: hours_consumed > 24
+            # Case #2: prev_hours_consumed == 40, current hours_consumed == 10
+            # -> total of 50 hours;
+            days, hours = divmod(total_hours_consumed, HOURS_IN_DAY)
+            total_charge = tariff.daily_rate * days + tariff.hour_charges[size][hours]
+        else:
+            # Add hourly rate charge to the total_charge
+            total_charge = (
+                billing.total_charge + tariff.hour_charges[size][hours_consumed_ceiled]
             )
 
-            hours_consumed_ceiled = math.ceil(hours_consumed)
-            total_hours_consumed += hours_consumed_ceiled
-
-            # Get hour rate
-            current_slot = self._slots[current_log.slot_location]
-            hour_rate = self.HOUR_RATES[current_slot.size]
-
-            if total_hours_consumed <= 3:
-                total_charge = 40
-            elif 3 < total_hours_consumed < 24 and prev_total_hours_consumed < 3:
-                # Compute continous rate charge from flat charge
-                total_charge = 40 + ((total_hours_consumed - 3) * hour_rate)
-            elif (
-                total_hours_consumed >= 24 and prev_total_hours_consumed < 24
-            ) or hours_consumed > 24 - (prev_total_hours_consumed % 24):
-                # Compute charge for daily rate
-                # Case #1: hours_consumed > 24
-                # Case #2: prev_hours_consumed == 40, current hours_consumed == 10
-                # -> total of 50 hours;
-                total_charge = (5000 * (total_hours_consumed // 24)) + (
-                    hour_rate * (total_hours_consumed % 24)
-                )
-            else:
-                # Add hourly rate charge to the total_charge
-                total_charge += hours_consumed_ceiled * hour_rate
-
-            # Remaining time computation
-            # Since we round up the hours_consumed, we need to get what hour the next
-            # charge be given.
-            remaining_time = (hours_consumed_ceiled - hours_consumed) * (
-                self.HOURS_IN_SEC
-            )
-            current_start_time = current_log.time_unparked + remaining_time
+        # Remaining time computation
+        # Since we round up the hours_consumed, we need to get what hour the next
+        # charge be given.
+        remaining_time = (hours_consumed_ceiled - hours_consumed) * self.HOURS_IN_SEC
 
-            # Add all previous charges
-            if i < logs_len - 1:
-                paid_charge += current_log.charge
+        billing.total_hours_consumed = total_hours_consumed
+        billing.total_charge = total_charge
+        billing.current_start_time = current_log.time_unparked + remaining_time
+        billing.chain_length += 1
 
-        return total_charge - paid_charge
+        return total_charge
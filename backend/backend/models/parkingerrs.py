@@ -21,3 +21,47 @@ class InvalidEntryPointError(ParkingError):
 
 class InvalidSizeError(ParkingError):
     pass
+
+
+class InvalidTariffError(ParkingError):
+    pass
+
+
+class LotNotExistsError(ParkingError):
+    pass
+
+
+class InvalidPlateNumberError(ParkingError):
+    pass
+
+
+class VehicleCapacityError(ParkingError):
+    pass
+
+
+class SlotNotExistsError(ParkingError):
+    pass
+
+
+class HoldNotExistsError(ParkingError):
+    pass
+
+
+class InvalidHoldError(ParkingError):
+    pass
+
+
+class InvalidTimeError(ParkingError):
+    pass
+
+
+class InvalidBodyError(ParkingError):
+    pass
+
+
+class UnsupportedOperationError(ParkingError):
+    pass
+
+
+class EventsLostError(ParkingError):
+    pass
@@ -0,0 +1,578 @@
+# Parking state in a named shared memory segment, so that several processes,
+# e.g. the workers of a WSGI server, serve park/unpark against one lot.
+#
+# The segment holds the slots as laid out by ArraySlotStore, the vacancy
+# counters, a table of vehicles and a ring of released slots. Claims and
+# releases are made atomic across processes by fcntl record locks on a lock
+# file, one byte per lock, taken on top of a thread lock. Every process keeps
+# its own NearestSlotIndex over the shared vacancy bitmap: slots taken by
+# other processes are dropped lazily as usual, and slots they released are
+# read off the release ring before each lookup.
+#
+# POSIX only. Vehicles keep their billing state and last parking log, like
+# Vehicle.compact_logs(). The segment outlives the processes using it, until
+# SharedParkingSystem.unlink().
+#
+# The segment is sized once, for the lot and vehicle capacity it is created
+# with, and only holds what every process sees. So a shared lot has no holds,
+# journal, events, archive or idle eviction, its slots cannot be moved nor
+# entry points added, and strategies keeping state of their own are
+# rejected. snapshot() gives a copy of the lot, e.g. to load it elsewhere.
+import fcntl
+import math
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Optional
+
+from .allocation import NEAREST
+from .parking import (
+    DEFAULT_TARIFF,
+    BillingState,
+    Listing,
+    ParkingLog,
+    ParkingSystem,
+    Size,
+    Tariff,
+    Vehicle,
+)
+from .parkingerrs import (
+    InvalidPlateNumberError,
+    UnsupportedOperationError,
+    VehicleCapacityError,
+)
+from .slotindex import NearestSlotIndex
+from .slotstore import ArraySlotStore
+
+# "SSPARKS2", the digit being the version of the segment layout. 2: slot
+# table hashed with slotstore.location_hash
+MAGIC = 0x32534B5241505353
+
+# Header of the segment, one int64 each
+HEADER_FIELDS = (
+    "magic",
+    "entry_points",
+    "slots_len",
+    "slot_table_capacity",
+    "vehicle_capacity",
+    "vehicle_table_capacity",
+    "release_ring_size",
+    "distances_are_float",
+    "flat_rate",
+    "flat_hours",
+    "daily_rate",
+    "small_rate",
+    "medium_rate",
+    "large_rate",
+    # Updated as the lot is used
+    "vehicles_len",
+    "release_seq",
+)
+H = {name: i for i, name in enumerate(HEADER_FIELDS)}
+
+# plate number, size, is_parked, slot position, time_parked, time_unparked,
+# charge, then the billing state. NaN and -1 stand for None.
+_VEHICLE = struct.Struct("<32sBB6xqddqqqdqq")
+PLATE_NUMBER_BYTES = 32
+# Records past the vehicle capacity, for inserts racing at the limit
+VEHICLE_HEADROOM = 1024
+
+DEFAULT_VEHICLE_CAPACITY = 100_000
+DEFAULT_RELEASE_RING_SIZE = 65_536
+
+# Bytes of the lock file: vehicle lock stripes, then the slot lock and the
+# lock of vehicle inserts
+SLOT_LOCK = ParkingSystem.VEHICLE_LOCK_STRIPES
+INSERT_LOCK = SLOT_LOCK + 1
+
+
+def _layout(header) -> dict:
+    # (offset, bytes) of every region of the segment, 8 byte aligned
+    def aligned(nbytes):
+        return (nbytes + 7) // 8 * 8
+
+    regions = [
+        ("header", len(HEADER_FIELDS) * 8),
+        ("distances", header["entry_points"] * header["slots_len"] * 8),
+        ("slot_table", header["slot_table_capacity"] * 8),
+        ("counts", (1 + header["entry_points"]) * len(Size) * 8),
+        ("release_ring", header["release_ring_size"] * 8),
+        ("vehicle_table", header["vehicle_table_capacity"] * 8),
+        (
+            "vehicles",
+            (header["vehicle_capacity"] + VEHICLE_HEADROOM) * _VEHICLE.size,
+        ),
+        ("sizes", header["slots_len"]),
+        ("vacancy", (header["slots_len"] + 7) // 8),
+    ]
+    layout = {}
+    offset = 0
+    for name, nbytes in regions:
+        layout[name] = (offset, nbytes)
+        offset += aligned(nbytes)
+    layout["total"] = (0, max(offset, 1))
+    return layout
+
+
+def _untrack(segment: shared_memory.SharedMemory) -> None:
+    # The resource tracker would unlink the segment as soon as the process
+    # that created or attached it exits, under the other processes
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"{name.lstrip('/')}.lock")
+
+
+class _ProcessLock:
+    # Held by one thread of one process at a time: the thread lock excludes
+    # the threads of this process, the record lock other processes
+    __slots__ = ("_fd", "_offset", "_thread_lock")
+
+    def __init__(self, fd: int, offset: int):
+        self._fd = fd
+        self._offset = offset
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._offset)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset)
+        self._thread_lock.release()
+
+
+def _plate_bytes(plate_number: str) -> bytes:
+    plate_bytes = plate_number.encode()
+    if not plate_bytes or len(plate_bytes) > PLATE_NUMBER_BYTES:
+        raise InvalidPlateNumberError("Invalid plate number.")
+    return plate_bytes
+
+
+class SharedVehicleTable(Mapping):
+    # {plate number: Vehicle} over the segment. Vehicles are copies: changes
+    # are only shared once the vehicle is stored again. Records are appended
+    # in insertion order and found through an open addressing table.
+
+    def __init__(self, store, header, table, records, insert_lock):
+        self._store = store
+        self._header = header
+        self._table = table
+        self._records = records
+        self._insert_lock = insert_lock
+
+    def _find(self, plate_bytes: bytes) -> int:
+        # Bucket of the plate number, or the empty bucket to put it in
+        mask = len(self._table) - 1
+        bucket = zlib.crc32(plate_bytes) & mask
+        while True:
+            index = self._table[bucket]
+            if index < 0 or self._plate_at(index) == plate_bytes:
+                return bucket
+            bucket = (bucket + 1) & mask
+
+    def _plate_at(self, index: int) -> bytes:
+        offset = index * _VEHICLE.size
+        return bytes(self._records[offset : offset + PLATE_NUMBER_BYTES]).rstrip(b"\0")
+
+    def is_full(self) -> bool:
+        return len(self) >= self._header[H["vehicle_capacity"]]
+
+    def vehicle_at(self, index: int) -> Vehicle:
+        (
+            plate_bytes,
+            size,
+            is_parked,
+            slot,
+            time_parked,
+            time_unparked,
+            charge,
+            total_hours_consumed,
+            total_charge,
+            current_start_time,
+            paid_charge,
+            chain_length,
+        ) = _VEHICLE.unpack_from(self._records, index * _VEHICLE.size)
+
+        log = ParkingLog(
+            slot_location=self._store.location_at(slot),
+            slot_id=slot,
+            time_parked=time_parked,
+            time_unparked=None if math.isnan(time_unparked) else time_unparked,
+            charge=None if charge < 0 else charge,
+        )
+        billing = BillingState(
+            total_hours_consumed=total_hours_consumed,
+            total_charge=total_charge,
+            current_start_time=(
+                None if math.isnan(current_start_time) else current_start_time
+            ),
+            paid_charge=paid_charge,
+            chain_length=chain_length,
+        )
+        return Vehicle(
+            plate_bytes.rstrip(b"\0").decode(),
+            Size(size),
+            bool(is_parked),
+            [log],
+            billing,
+        )
+
+    def get(self, plate_number: str, default=None) -> Optional[Vehicle]:
+        try:
+            index = self._table[self._find(_plate_bytes(plate_number))]
+        except InvalidPlateNumberError:
+            return default
+        return default if index < 0 else self.vehicle_at(index)
+
+    def __getitem__(self, plate_number: str) -> Vehicle:
+        vehicle = self.get(plate_number)
+        if vehicle is None:
+            raise KeyError(plate_number)
+        return vehicle
+
+    def __setitem__(self, plate_number: str, vehicle: Vehicle) -> None:
+        # Must hold the vehicle lock of plate_number
+        plate_bytes = _plate_bytes(plate_number)
+        log = vehicle.parking_logs[-1]
+        billing = vehicle.billing
+        record = _VEHICLE.pack(
+            plate_bytes,
+            vehicle.size,
+            vehicle.is_parked,
+            (
+                self._store.order_of(log.slot_location)
+                if log.slot_id is None
+                else log.slot_id
+            ),
+            log.time_parked,
+            math.nan if log.time_unparked is None else log.time_unparked,
+            -1 if log.charge is None else log.charge,
+            billing.total_hours_consumed,
+            billing.total_charge,
+            (
+                math.nan
+                if billing.current_start_time is None
+                else billing.current_start_time
+            ),
+            billing.paid_charge,
+            billing.chain_length,
+        )
+
+        index = self._table[self._find(plate_bytes)]
+        if index >= 0:
+            self._records[index * _VEHICLE.size : (index + 1) * _VEHICLE.size] = record
+            return
+
+        with self._insert_lock:
+            index = self._header[H["vehicles_len"]]
+            if index * _VEHICLE.size >= len(self._records):
+                raise VehicleCapacityError("No vehicle capacity left.")
+            # The record is written before it can be found
+            self._records[index * _VEHICLE.size : (index + 1) * _VEHICLE.size] = record
+            self._table[self._find(plate_bytes)] = index
+            self._header[H["vehicles_len"]] = index + 1
+
+    def iter_values(self, start: int = 0, stop: Optional[int] = None):
+        # Vehicles in insertion order, including ones inserted meanwhile
+        index = start
+        while (stop is None or index < stop) and index < len(self):
+            yield self.vehicle_at(index)
+            index += 1
+
+    def values(self):
+        return self.iter_values()
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self._plate_at(index).decode()
+
+    def __len__(self) -> int:
+        return self._header[H["vehicles_len"]]
+
+
+class SharedSlotIndex(NearestSlotIndex):
+    # NearestSlotIndex of one process, kept up to date with the slots other
+    # processes release through the release ring of the segment
+
+    def __init__(self, entry_points: int, sizes: int, slots, header, ring):
+        self._header = header
+        self._ring = ring
+        self._store = slots
+        # Releases from here on are replayed; replaying a release of a slot
+        # already in the heaps is a no-op
+        self._seen = header[H["release_seq"]]
+        super().__init__(entry_points, sizes, slots)
+
+    def _catch_up(self) -> None:
+        seq = self._header[H["release_seq"]]
+        if seq - self._seen > len(self._ring):
+            # Fell behind the ring, start over from the vacancy bitmap
+            SharedSlotIndex.__init__(
+                self,
+                self._entry_points,
+                self._sizes,
+                self._store,
+                self._header,
+                self._ring,
+            )
+            return
+        ring_size = len(self._ring)
+        for released in range(self._seen, seq):
+            self._release_order(self._ring[released % ring_size])
+        self._seen = seq
+
+    def nearest(self, size: int, entry_point: int, stop: Optional[int] = None):
+        self._catch_up()
+        return super().nearest(size, entry_point, stop)
+
+    def release(self, slot_id: int) -> None:
+        # Must hold the slot lock
+        self._release_order(slot_id)
+        seq = self._header[H["release_seq"]]
+        self._ring[seq % len(self._ring)] = slot_id
+        self._header[H["release_seq"]] = seq + 1
+
+
+class SharedParkingSystem(ParkingSystem):
+    def __init__(self, segment: shared_memory.SharedMemory, metrics=None):
+        # Use create() or attach()
+        self._segment = segment
+        self._views = []
+        header = self._view(0, len(HEADER_FIELDS) * 8, "q")
+        if header[H["magic"]] != MAGIC:
+            self.close()
+            raise ValueError("Not a parking segment")
+        layout = _layout({name: header[i] for i, name in enumerate(HEADER_FIELDS)})
+
+        entry_points = header[H["entry_points"]]
+        self._entry_points = entry_points
+        self._tariff = Tariff(
+            flat_rate=header[H["flat_rate"]],
+            flat_hours=header[H["flat_hours"]],
+            daily_rate=header[H["daily_rate"]],
+            hour_rates={
+                Size.SMALL: header[H["small_rate"]],
+                Size.MEDIUM: header[H["medium_rate"]],
+                Size.LARGE: header[H["large_rate"]],
+            },
+        ).compile()
+
+        self._slots = ArraySlotStore.from_buffers(
+            entry_points,
+            self._view(
+                *layout["distances"], "d" if header[H["distances_are_float"]] else "q"
+            ),
+            self._view(*layout["sizes"], "B"),
+            self._view(*layout["vacancy"], "B"),
+            self._view(*layout["slot_table"], "q"),
+        )
+        self._slot_ids = self._slots.slot_ids
+
+        self._lock_fd = os.open(_lock_path(segment.name), os.O_RDWR | os.O_CREAT, 0o600)
+        self._vehicle_locks = [
+            _ProcessLock(self._lock_fd, stripe)
+            for stripe in range(self.VEHICLE_LOCK_STRIPES)
+        ]
+        self._slot_lock = _ProcessLock(self._lock_fd, SLOT_LOCK)
+
+        self._vehicles = SharedVehicleTable(
+            self._slots,
+            header,
+            self._view(*layout["vehicle_table"], "q"),
+            self._view(*layout["vehicles"], "B"),
+            _ProcessLock(self._lock_fd, INSERT_LOCK),
+        )
+
+        counts = self._view(*layout["counts"], "q")
+        sizes_len = len(Size)
+        self._vacant_counts = counts[:sizes_len]
+        self._zone_vacant_counts = [
+            counts[sizes_len * (zone + 1) : sizes_len * (zone + 2)]
+            for zone in range(entry_points)
+        ]
+        self._views += [self._vacant_counts, *self._zone_vacant_counts]
+
+        self._index = SharedSlotIndex(
+            entry_points,
+            len(Size),
+            self._slots,
+            header,
+            self._view(*layout["release_ring"], "q"),
+        )
+        self._init_holds()
+        self._journal = None
+        self._layout = None
+        # Events would only hold the changes made by this process
+        self._events = None
+        self._archive = None
+        # The vehicle table is bounded by its capacity instead
+        self._idle = None
+        self._evict_sink = None
+        # Listed by their index in the vehicle table
+        self._vehicle_seqs = None
+        self._init_zones()
+        self._metrics = None
+        self.set_strategy(NEAREST)
+
+        if metrics is not None:
+            self._instrument(metrics)
+
+    def _view(self, offset: int, nbytes: int, typecode: str) -> memoryview:
+        view = self._segment.buf[offset : offset + nbytes].cast(typecode)
+        self._views.append(view)
+        return view
+
+    @classmethod
+    def create(
+        cls,
+        name: str,
+        entry_points: int,
+        slots,
+        sizes,
+        tariff: Optional[Tariff] = None,
+        vehicle_capacity: int = DEFAULT_VEHICLE_CAPACITY,
+        release_ring_size: int = DEFAULT_RELEASE_RING_SIZE,
+        metrics=None,
+    ) -> "SharedParkingSystem":
+        # Raises FileExistsError if the segment already exists
+        store = ArraySlotStore(entry_points, slots, sizes)
+        tariff = tariff or DEFAULT_TARIFF
+
+        vehicle_table_capacity = 8
+        while vehicle_table_capacity < (vehicle_capacity + VEHICLE_HEADROOM) * 2:
+            vehicle_table_capacity *= 2
+        header = dict(
+            magic=0,
+            entry_points=entry_points,
+            slots_len=len(store),
+            slot_table_capacity=len(store._table),
+            vehicle_capacity=vehicle_capacity,
+            vehicle_table_capacity=vehicle_table_capacity,
+            release_ring_size=release_ring_size,
+            distances_are_float=store.distances.typecode == "d",
+            flat_rate=tariff.flat_rate,
+            flat_hours=tariff.flat_hours,
+            daily_rate=tariff.daily_rate,
+            small_rate=tariff.hour_rates[Size.SMALL],
+            medium_rate=tariff.hour_rates[Size.MEDIUM],
+            large_rate=tariff.hour_rates[Size.LARGE],
+            vehicles_len=0,
+            release_seq=0,
+        )
+        layout = _layout(header)
+
+        segment = shared_memory.SharedMemory(name, create=True, size=layout["total"][1])
+        _untrack(segment)
+        buf = segment.buf
+        struct.pack_into(f"<{len(HEADER_FIELDS)}q", buf, 0, *header.values())
+        for region, source in [
+            ("distances", store.distances),
+            ("slot_table", store._table),
+            ("sizes", store.sizes),
+            ("vacancy", store.vacancy),
+        ]:
+            offset, nbytes = layout[region]
+            buf[offset : offset + nbytes] = memoryview(source).cast("B")
+        offset, nbytes = layout["vehicle_table"]
+        buf[offset : offset + nbytes] = b"\xff" * nbytes
+
+        # Attaching processes wait for the magic number, written last
+        struct.pack_into("<q", buf, 0, MAGIC)
+        del buf
+        parking_system = cls(segment, metrics)
+        parking_system._count_vacancies()
+        return parking_system
+
+    @classmethod
+    def attach(cls, name: str, metrics=None) -> Optional["SharedParkingSystem"]:
+        # None if the segment does not exist or is still being created
+        try:
+            segment = shared_memory.SharedMemory(name)
+        except (FileNotFoundError, ValueError):
+            return None
+        _untrack(segment)
+        try:
+            return cls(segment, metrics)
+        except ValueError:
+            return None
+
+    def _count_vacancies(self) -> None:
+        # Into the shared counters, see ParkingSystem._count_vacancies
+        with self._slot_lock:
+            for counts in (self._vacant_counts, *self._zone_vacant_counts):
+                counts[:] = memoryview(bytes(len(counts) * 8)).cast("q")
+            for slot in self._slots.values():
+                if slot.is_vacant:
+                    self._vacant_counts[slot.size] += 1
+                    self._zone_vacant_counts[self._zone(slot)][slot.size] += 1
+
+    def park(self, vehicle: Vehicle, entry_point: int, time_parked=None):
+        # Checked before a slot gets claimed
+        _plate_bytes(vehicle.plate_number)
+        if self._vehicles.is_full() and vehicle.plate_number not in self._vehicles:
+            raise VehicleCapacityError("No vehicle capacity left.")
+        return super().park(vehicle, entry_point, time_parked)
+
+    def set_strategy(self, strategy) -> None:
+        super().set_strategy(strategy)
+        # Other processes change the counters without telling the strategy
+        if self._strategy.vacancy_changed is not None:
+            name = self._strategy.name
+            self.set_strategy(NEAREST)
+            raise ValueError(f"Allocation strategy {name!r} is not shared")
+
+    def add_entry_points(self, entry_points: int, updates) -> None:
+        # Checked before anything changes, the slots of the segment are fixed
+        raise UnsupportedOperationError("Slots of a shared lot cannot be moved")
+
+    def hold(self, size, entry_point: int, duration: float, time_held=None):
+        # Holds would only be known to the process that made them
+        raise UnsupportedOperationError("Holds are not shared between processes")
+
+    def iter_vehicles(self, start: int = 0, stop: Optional[int] = None) -> Listing:
+        # Vehicles are never removed from the table, positions are indexes
+        return Listing(
+            enumerate(self._vehicles.iter_values(start, stop), start + 1), start
+        )
+
+    def snapshot(self) -> dict:
+        # A copy, read with every lock held since other processes go on
+        # changing the lot
+        with self._exclusive():
+            return super().snapshot()
+
+    def close(self) -> None:
+        # Detach this process from the segment
+        self._slots = self._vehicles = self._index = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if getattr(self, "_lock_fd", None) is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self._segment.close()
+
+    def unlink(self) -> None:
+        # Remove the segment once every process closed it
+        name = self._segment.name
+        # unlink() unregisters the segment from the resource tracker again
+        resource_tracker.register(self._segment._name, "shared_memory")
+        self._segment.unlink()
+        try:
+            os.remove(_lock_path(name))
+        except FileNotFoundError:
+            pass
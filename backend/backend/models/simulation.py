@@ -0,0 +1,254 @@
+# Capacity planning: replays gate traces, i.e. park and unpark events with
+# their times, against candidate lots (layout and tariff) and reports the
+# occupancy over time, the share of vehicles turned away and the revenue.
+#
+# Traces are streamed, never loaded whole, from CSV files with the columns
+# of TRACE_COLUMNS, or from columnar traces: a directory holding one .npy file
+# per column, memory-mapped and read a chunk at a time, or an .npz file.
+# Columnar traces need numpy. Candidates are /parking/init JSON bodies, or
+# .npz lot files (see backend.models.bulkload), and are simulated in parallel
+# on a process pool, each worker streaming the trace on its own:
+#
+#   python -m backend.models.simulation trace.csv lot-a.json lot-b.json
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .parking import ParkingSystem, Tariff, Vehicle
+from .parkingerrs import NoSlotAvailableError, ParkingError
+
+PARK = "park"
+UNPARK = "unpark"
+TRACE_COLUMNS = ("time", "operation", "plate_number", "size", "entry_point")
+
+# Rows of a columnar trace read at a time
+COLUMN_CHUNK_SIZE = 65536
+# Seconds between two occupancy samples
+DEFAULT_INTERVAL = 60 * 60
+
+
+class TraceEvent(NamedTuple):
+    time: float
+    # PARK or UNPARK
+    operation: str
+    plate_number: str
+    # Only used by PARK events
+    size: int
+    entry_point: int
+
+
+def read_csv(path: str) -> Iterator[TraceEvent]:
+    # size and entry_point may be left empty for UNPARK events
+    with open(path, newline="") as trace_file:
+        reader = csv.reader(trace_file)
+        header = next(reader)
+        columns = [header.index(name) for name in TRACE_COLUMNS]
+        for row in reader:
+            event_time, operation, plate_number, size, entry_point = (
+                row[column] for column in columns
+            )
+            yield TraceEvent(
+                float(event_time),
+                operation,
+                plate_number,
+                int(size or 0),
+                int(entry_point or 0),
+            )
+
+
+def read_columns(path: str) -> Iterator[TraceEvent]:
+    import numpy as np
+
+    if os.path.isdir(path):
+        columns = [
+            np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in TRACE_COLUMNS
+        ]
+    else:
+        with np.load(path, allow_pickle=False) as data:
+            columns = [data[name] for name in TRACE_COLUMNS]
+
+    for start in range(0, len(columns[0]), COLUMN_CHUNK_SIZE):
+        chunk = [
+            column[start : start + COLUMN_CHUNK_SIZE].tolist() for column in columns
+        ]
+        for row in zip(*chunk):
+            yield TraceEvent(*row)
+
+
+def write_columns(path: str, events: Iterable[TraceEvent]) -> None:
+    # Columnar trace directory of events, e.g. to convert a CSV trace once
+    import numpy as np
+
+    columns = list(zip(*events)) or [()] * len(TRACE_COLUMNS)
+    dtypes = (np.float64, str, str, np.uint8, np.uint32)
+    os.makedirs(path, exist_ok=True)
+    for name, column, dtype in zip(TRACE_COLUMNS, columns, dtypes):
+        np.save(os.path.join(path, f"{name}.npy"), np.array(column, dtype=dtype))
+
+
+def read_trace(path: str) -> Iterator[TraceEvent]:
+    if path.endswith(".csv"):
+        return read_csv(path)
+    return read_columns(path)
+
+
+def load_lot(path: str) -> ParkingSystem:
+    # Idle vehicles are evicted, so that memory stays flat over long traces
+    if path.endswith(".npz"):
+        from . import bulkload
+
+        distances, sizes = bulkload.read_npz(path)
+        return bulkload.load_parking_system(distances, sizes, evict_idle=True)
+
+    with open(path) as lot_file:
+        lot = json.load(lot_file)
+    tariff = None
+    if lot.get("tariff") is not None:
+        tariff = Tariff.from_dict(lot["tariff"])
+    return ParkingSystem(
+        lot["entry_points"],
+        [tuple(slot) for slot in lot["slots"]],
+        lot["sizes"],
+        tariff=tariff,
+        evict_idle=True,
+    )
+
+
+@dataclass
+class SimulationReport:
+    lot: str
+    slots: int
+    events: int = 0
+    parks: int = 0
+    # Parks turned away with NoSlotAvailableError
+    rejected: int = 0
+    rejection_rate: float = 0.0
+    # Events that do not apply, e.g. the departure of a vehicle turned away
+    skipped: int = 0
+    revenue: int = 0
+    peak_occupied: int = 0
+    # (time, occupied slots) at the start of every interval from the first
+    # event on
+    occupancy: List[Tuple[float, int]] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+
+def simulate(
+    parking_system: ParkingSystem,
+    events: Iterable[TraceEvent],
+    interval: float = DEFAULT_INTERVAL,
+    lot: str = "",
+) -> SimulationReport:
+    # Replays events, in time order, against a lot with every slot vacant.
+    # Each event costs one park or unpark, so the run time is linear in the
+    # length of the trace.
+    start = time.perf_counter()
+    report = SimulationReport(lot, parking_system.count_vacant())
+    park = parking_system.park
+    unpark = parking_system.unpark
+    get_vehicle = parking_system.get_vehicle
+
+    occupied = 0
+    next_sample = None
+    for event in events:
+        event_time = event.time
+        if next_sample is None:
+            next_sample = event_time
+        while event_time >= next_sample:
+            report.occupancy.append((next_sample, occupied))
+            next_sample += interval
+
+        report.events += 1
+        try:
+            if event.operation == PARK:
+                report.parks += 1
+                park(
+                    Vehicle(event.plate_number, event.size),
+                    event.entry_point,
+                    event_time,
+                )
+                occupied += 1
+                if occupied > report.peak_occupied:
+                    report.peak_occupied = occupied
+            elif event.operation == UNPARK:
+                report.revenue += unpark(event.plate_number, event_time)
+                occupied -= 1
+                # Charges only need the billing state, keep memory flat
+                get_vehicle(event.plate_number).compact_logs()
+            else:
+                report.skipped += 1
+        except NoSlotAvailableError:
+            report.rejected += 1
+        except ParkingError:
+            # e.g. times going back for a vehicle
+            report.skipped += 1
+
+    if report.parks:
+        report.rejection_rate = report.rejected / report.parks
+    report.elapsed_sec = time.perf_counter() - start
+    return report
+
+
+def run(
+    trace_path: str, lot_path: str, interval: float = DEFAULT_INTERVAL
+) -> SimulationReport:
+    return simulate(load_lot(lot_path), read_trace(trace_path), interval, lot_path)
+
+
+def run_many(
+    trace_path: str,
+    lot_paths: Sequence[str],
+    interval: float = DEFAULT_INTERVAL,
+    workers: Optional[int] = None,
+) -> List[SimulationReport]:
+    # One report per candidate lot, in order. Candidates are simulated in
+    # worker processes, one per CPU when workers is None.
+    workers = min(workers or os.cpu_count() or 1, len(lot_paths))
+    if workers <= 1:
+        return [run(trace_path, lot_path, interval) for lot_path in lot_paths]
+
+    # Spawned rather than forked, like the lot workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        return list(
+            executor.map(
+                run,
+                [trace_path] * len(lot_paths),
+                lot_paths,
+                [interval] * len(lot_paths),
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace", help="CSV, .npz or .npy directory trace")
+    parser.add_argument("lots", nargs="+", help="/parking/init JSON or .npz lots")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="seconds between occupancy samples",
+    )
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    reports = run_many(args.trace, args.lots, args.interval, args.workers)
+    data = json.dumps([asdict(report) for report in reports], indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(data + "\n")
+    else:
+        print(data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import heapq
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+if TYPE_CHECKING:
+    from .parking import Slot
+
+
+def ordered_slots(slots: Mapping[int, "Slot"]) -> Sequence["Slot"]:
+    # Slots by id, ids being their position in the mapping
+    if hasattr(slots, "ordered"):
+        return slots.ordered()
+    return list(slots.values())
+
+
+class NearestSlotIndex:
+    # One min-heap per (entry point, slot size) of the vacant slots, keyed by
+    # their rank in distance to the entry point. Ranks come from a stable sort
+    # over the slots mapping, so ties on distance are broken by slot id.
+    # Taken slots are not removed right away; they are dropped lazily once
+    # they reach the top of a heap.
+    #
+    # Slots moved since the ranks were computed (see relocate) leave the rank
+    # heaps and go to smaller heaps keyed by (distance, slot id), which sort
+    # the same way, so that moving a few slots does not rerank the others.
+
+    # Share of slots moved at an entry point past which it is ranked again
+    RERANK_MOVED_SHARE = 0.25
+
+    def __init__(self, entry_points: int, sizes: int, slots: Mapping[int, "Slot"]):
+        self._entry_points = entry_points
+        self._sizes = sizes
+        self._source = slots
+        self._slots: Sequence["Slot"] = ordered_slots(slots)
+
+        self._heaps: List[List[List[int]]] = []
+        # Per entry point, the rank of each slot and the slot of each rank
+        self._ranks: List[array] = []
+        self._by_rank: List[array] = []
+        # Per entry point, whether a slot is in its heap
+        self._in_heap: List[bytearray] = []
+        self._init_moved()
+        for entry_point in range(entry_points):
+            by_rank, ranks, heaps, in_heap = self._rank(entry_point)
+            self._heaps.append(heaps)
+            self._ranks.append(ranks)
+            self._by_rank.append(by_rank)
+            self._in_heap.append(in_heap)
+
+        # Taken slots dropped from the heaps so far, for metrics
+        self.dropped = 0
+
+    def _init_moved(self) -> None:
+        # Per entry point, the distance of each moved slot, the heaps of the
+        # vacant ones by size, and the moved slots in those heaps
+        self._moved: List[Dict[int, float]] = [{} for _ in range(self._entry_points)]
+        self._moved_heaps: List[List[List[Tuple[float, int]]]] = [
+            [[] for _ in range(self._sizes)] for _ in range(self._entry_points)
+        ]
+        self._moved_in_heap: List[Set[int]] = [set() for _ in range(self._entry_points)]
+
+    def _rank(self, entry_point: int):
+        # by_rank, ranks, heaps and in_heap of entry_point, from the current
+        # distances
+        slots = self._slots
+        slots_len = len(slots)
+        # Stores laid out by column, e.g. ArraySlotStore, hand out the
+        # distances to an entry point without building every location
+        distance_row = getattr(self._source, "distance_row", None)
+        if distance_row is not None:
+            distances = distance_row(entry_point)
+        else:
+            distances = [slot.location[entry_point] for slot in slots]
+
+        by_rank = array("q", sorted(range(slots_len), key=distances.__getitem__))
+        ranks = array("q", bytes(by_rank.itemsize * slots_len))
+        heaps = [[] for _ in range(self._sizes)]
+        in_heap = bytearray(slots_len)
+        for rank, order in enumerate(by_rank):
+            ranks[order] = rank
+            slot = slots[order]
+            if slot.is_vacant:
+                # Appended in rank order, so each list already is a heap
+                heaps[slot.size].append(rank)
+                in_heap[order] = 1
+        return by_rank, ranks, heaps, in_heap
+
+    @classmethod
+    def from_orderings(
+        cls,
+        entry_points: int,
+        sizes: int,
+        slots: Mapping[int, "Slot"],
+        by_rank: List[array],
+        ranks: List[array],
+        heaps: List[List[List[int]]],
+        in_heap: List[bytearray],
+    ) -> "NearestSlotIndex":
+        # Index over orderings computed elsewhere, e.g. vectorized. Per entry
+        # point: the slot of each rank, the rank of each slot, the heaps of the
+        # ranks of vacant slots by size, and whether a slot is in its heap.
+        index = cls.__new__(cls)
+        index._entry_points = entry_points
+        index._sizes = sizes
+        index._source = slots
+        index._slots = ordered_slots(slots)
+        index._by_rank = by_rank
+        index._ranks = ranks
+        index._heaps = heaps
+        index._in_heap = in_heap
+        index._init_moved()
+        index.dropped = 0
+        return index
+
+    def _top(self, entry_point: int, size: int) -> Optional[int]:
+        heap = self._heaps[entry_point][size]
+        by_rank = self._by_rank[entry_point]
+        moved = self._moved[entry_point]
+        while heap:
+            order = by_rank[heap[0]]
+            if self._slots[order].is_vacant and order not in moved:
+                return heap[0]
+            # Lazy deletion of a slot taken or moved since it was pushed
+            heapq.heappop(heap)
+            self._in_heap[entry_point][order] = 0
+            self.dropped += 1
+        return None
+
+    def _moved_top(self, entry_point: int, size: int) -> Optional[Tuple[float, int]]:
+        heap = self._moved_heaps[entry_point][size]
+        moved = self._moved[entry_point]
+        while heap:
+            distance, order = heap[0]
+            if moved.get(order) == distance:
+                if self._slots[order].is_vacant:
+                    return heap[0]
+                self._moved_in_heap[entry_point].discard(order)
+            # Lazy deletion of a slot taken or moved again since it was pushed
+            heapq.heappop(heap)
+            self.dropped += 1
+        return None
+
+    def nearest(
+        self, size: int, entry_point: int, stop: Optional[int] = None
+    ) -> Optional["Slot"]:
+        # Nearest vacant slot of a size from size up to before stop, or of
+        # any larger size
+        stop = self._sizes if stop is None else stop
+        best = None
+        for slot_size in range(size, stop):
+            rank = self._top(entry_point, slot_size)
+            if rank is not None and (best is None or rank < best):
+                best = rank
+
+        slot = None
+        if best is not None:
+            slot = self._slots[self._by_rank[entry_point][best]]
+        if self._moved[entry_point]:
+            slot = self._nearest_moved(size, stop, entry_point, slot)
+        return slot
+
+    def _nearest_moved(
+        self, size: int, stop: int, entry_point: int, slot
+    ) -> Optional["Slot"]:
+        # Nearer of slot, from the rank heaps, and the moved slots
+        best = None
+        if slot is not None:
+            best = (slot.location[entry_point], slot.id)
+        for slot_size in range(size, stop):
+            top = self._moved_top(entry_point, slot_size)
+            if top is not None and (best is None or top < best):
+                best = top
+        return None if best is None else self._slots[best[1]]
+
+    def release(self, slot_id: int) -> None:
+        # Slot became vacant again. Slot distances only change through
+        # relocate(), so a slot still sitting in a heap is valid again and
+        # need not be pushed twice.
+        self._release_order(slot_id)
+
+    def _release_order(self, order: int) -> None:
+        slot = self._slots[order]
+        size = slot.size
+        for entry_point in range(self._entry_points):
+            moved = self._moved[entry_point]
+            if moved and order in moved:
+                self._push_moved(entry_point, order, moved[order], size)
+                continue
+
+            in_heap = self._in_heap[entry_point]
+            if not in_heap[order]:
+                heapq.heappush(
+                    self._heaps[entry_point][size], self._ranks[entry_point][order]
+                )
+                in_heap[order] = 1
+
+    def _push_moved(self, entry_point: int, order: int, distance, size: int) -> None:
+        in_heap = self._moved_in_heap[entry_point]
+        if order not in in_heap:
+            heapq.heappush(self._moved_heaps[entry_point][size], (distance, order))
+            in_heap.add(order)
+
+    def relocate(self, entry_points: int, old_locations: Dict[int, tuple]) -> None:
+        # Slots of old_locations, by id, moved to their current location, and
+        # entry points may have been added. Existing entry points only track
+        # the slots whose distance to them changed; added ones are ranked.
+        for entry_point in range(self._entry_points):
+            moved = self._moved[entry_point]
+            in_heap = self._moved_in_heap[entry_point]
+            for order, old_location in old_locations.items():
+                slot = self._slots[order]
+                distance = slot.location[entry_point]
+                if distance == moved.get(order, old_location[entry_point]):
+                    continue
+                moved[order] = distance
+                # Pushed again below, entries of the old distance are stale
+                in_heap.discard(order)
+                if slot.is_vacant:
+                    self._push_moved(entry_point, order, distance, slot.size)
+
+            if len(moved) > len(self._slots) * self.RERANK_MOVED_SHARE:
+                self._rerank(entry_point)
+
+        added = entry_points - self._entry_points
+        self._entry_points = entry_points
+        self._moved += [{} for _ in range(added)]
+        self._moved_heaps += [[[] for _ in range(self._sizes)] for _ in range(added)]
+        self._moved_in_heap += [set() for _ in range(added)]
+        for entry_point in range(entry_points - added, entry_points):
+            by_rank, ranks, heaps, in_heap = self._rank(entry_point)
+            self._heaps.append(heaps)
+            self._ranks.append(ranks)
+            self._by_rank.append(by_rank)
+            self._in_heap.append(in_heap)
+
+    def _rerank(self, entry_point: int) -> None:
+        # Too many moved slots to keep apart, rank every slot again
+        by_rank, ranks, heaps, in_heap = self._rank(entry_point)
+        self._heaps[entry_point] = heaps
+        self._ranks[entry_point] = ranks
+        self._by_rank[entry_point] = by_rank
+        self._in_heap[entry_point] = in_heap
+        self._moved[entry_point] = {}
+        self._moved_heaps[entry_point] = [[] for _ in range(self._sizes)]
+        self._moved_in_heap[entry_point] = set()
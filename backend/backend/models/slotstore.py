@@ -0,0 +1,303 @@
+import struct
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List
+
+from .parking import Size, SlotLocation
+from .parkingerrs import (
+    InvalidEntryPointError,
+    InvalidSizeError,
+    UnsupportedOperationError,
+)
+
+
+def location_hash(location: SlotLocation) -> int:
+    # Hash of the location table. Tables are shared between processes and
+    # written to layout files, so unlike hash() this is stable across
+    # interpreters. Distances are hashed as doubles, so that equal int and
+    # float locations hash the same.
+    return zlib.crc32(struct.pack(f"<{len(location)}d", *location))
+
+
+class SlotView:
+    # Stands in for a Slot stored in an ArraySlotStore
+    __slots__ = ("_store", "_order")
+
+    def __init__(self, store: "ArraySlotStore", order: int):
+        self._store = store
+        self._order = order
+
+    @property
+    def id(self) -> int:
+        return self._order
+
+    @property
+    def location(self) -> SlotLocation:
+        return self._store.location_at(self._order)
+
+    @property
+    def size(self) -> int:
+        return self._store.sizes[self._order]
+
+    @property
+    def is_vacant(self) -> bool:
+        return self._store.is_vacant_at(self._order)
+
+    @is_vacant.setter
+    def is_vacant(self, is_vacant: bool):
+        self._store.set_vacant_at(self._order, is_vacant)
+
+    def asdict(self) -> dict:
+        return dict(
+            location=self.location,
+            size=self.size,
+            is_vacant=self.is_vacant,
+            id=self.id,
+        )
+
+    def __eq__(self, other):
+        try:
+            return (self.location, self.size, self.is_vacant, self.id) == (
+                other.location,
+                other.size,
+                other.is_vacant,
+                other.id,
+            )
+        except AttributeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return (
+            f"SlotView(location={self.location!r}, size={self.size!r}, "
+            f"is_vacant={self.is_vacant!r}, id={self.id!r})"
+        )
+
+
+class _SlotViews:
+    # Sequence of the slots of a store in order, built on access
+    __slots__ = ("_store",)
+
+    def __init__(self, store: "ArraySlotStore"):
+        self._store = store
+
+    def __getitem__(self, order: int) -> SlotView:
+        return SlotView(self._store, order)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __iter__(self) -> Iterator[SlotView]:
+        for order in range(len(self._store)):
+            yield SlotView(self._store, order)
+
+
+class _SlotIds:
+    # Id of each location in a store, like the location dict of ParkingSystem
+    __slots__ = ("_store",)
+
+    def __init__(self, store: "ArraySlotStore"):
+        self._store = store
+
+    def __getitem__(self, location: SlotLocation) -> int:
+        return self._store.order_of(location)
+
+    def get(self, location: SlotLocation, default=None):
+        try:
+            return self._store.order_of(location)
+        except KeyError:
+            return default
+
+
+class ArraySlotStore(Mapping):
+    # Slots stored in parallel typed arrays instead of one Slot per location:
+    # - distances: entry points x slots matrix, one row per entry point
+    # - sizes: one byte per slot
+    # - vacancy: one bit per slot
+    # Behaves like the {slot id: Slot} dict of ParkingSystem, with SlotView
+    # records in place of the Slot dataclasses. Slot ids are positions.
+
+    def __init__(self, entry_points: int, slots: List[tuple], sizes: List[int]):
+        self._entry_points = entry_points
+        self.sizes = bytearray()
+
+        valid_sizes = {*Size}
+        is_integral = True
+        for location, size in zip(slots, sizes):
+            if size not in valid_sizes:
+                raise InvalidSizeError("Invalid slot size")
+            if len(location) != entry_points:
+                raise InvalidEntryPointError("Invalid slot location")
+            is_integral = is_integral and all(
+                isinstance(distance, int) for distance in location
+            )
+        self.distances = array("q" if is_integral else "d")
+
+        # Locations are looked up through an open addressing hash table of
+        # slot positions, rather than a dict holding a tuple per slot.
+        capacity = 8
+        while capacity < len(slots) * 2:
+            capacity *= 2
+        self._table = array("q", [-1]) * capacity
+
+        # Same semantics as the dict: a repeated location keeps its first
+        # position and its last size.
+        rows = []
+        for location, size in zip(slots, sizes):
+            bucket = self._find(location, rows)
+            if self._table[bucket] >= 0:
+                self.sizes[self._table[bucket]] = size
+                continue
+            self._table[bucket] = len(rows)
+            rows.append(location)
+            self.sizes.append(size)
+
+        for entry_point in range(entry_points):
+            self.distances.extend(location[entry_point] for location in rows)
+        self.vacancy = bytearray(b"\xff" * ((len(rows) + 7) // 8))
+        self.slot_ids = _SlotIds(self)
+
+    @classmethod
+    def from_columns(
+        cls, entry_points: int, distances: array, sizes: bytearray
+    ) -> "ArraySlotStore":
+        # Store over already validated arrays, laid out like the attributes:
+        # distances row-major per entry point. Unlike the constructor, which
+        # takes the last size of a repeated location, rejects duplicates.
+        slots_len = len(sizes)
+        capacity = 8
+        while capacity < slots_len * 2:
+            capacity *= 2
+        store = cls.from_buffers(
+            entry_points,
+            distances,
+            sizes,
+            bytearray(b"\xff" * ((slots_len + 7) // 8)),
+            array("q", [-1]) * capacity,
+        )
+
+        rows = [store.distance_row(entry_point) for entry_point in range(entry_points)]
+        table = store._table
+        for order, location in enumerate(zip(*rows)):
+            bucket = store._find(location)
+            if table[bucket] >= 0:
+                raise InvalidEntryPointError("Duplicate slot location")
+            table[bucket] = order
+        return store
+
+    @classmethod
+    def from_buffers(
+        cls, entry_points: int, distances, sizes, vacancy, table
+    ) -> "ArraySlotStore":
+        # Store over existing buffers, e.g. memoryviews of shared memory, laid
+        # out like the attributes of a store built from slots
+        store = cls.__new__(cls)
+        store._entry_points = entry_points
+        store.distances = distances
+        store.sizes = sizes
+        store.vacancy = vacancy
+        store._table = table
+        store.slot_ids = _SlotIds(store)
+        return store
+
+    def _find(self, location: SlotLocation, rows=None) -> int:
+        # Bucket of location in the table, or the empty bucket to put it in
+        mask = len(self._table) - 1
+        bucket = location_hash(location) & mask
+        while True:
+            order = self._table[bucket]
+            if order < 0:
+                return bucket
+            row = rows[order] if rows is not None else self.location_at(order)
+            if row == location:
+                return bucket
+            bucket = (bucket + 1) & mask
+
+    def order_of(self, location: SlotLocation) -> int:
+        try:
+            order = self._table[self._find(location)]
+        except (TypeError, OverflowError, struct.error):
+            # Not a location of distances
+            raise KeyError(location)
+        if order < 0:
+            raise KeyError(location)
+        return order
+
+    def location_at(self, order: int) -> SlotLocation:
+        # Column of the distances matrix
+        return tuple(self.distances[order :: len(self.sizes)])
+
+    def distance_row(self, entry_point: int):
+        # Distances of every slot to entry_point, in slot order
+        slots_len = len(self.sizes)
+        return self.distances[entry_point * slots_len : (entry_point + 1) * slots_len]
+
+    def is_vacant_at(self, order: int) -> bool:
+        return bool(self.vacancy[order >> 3] & (1 << (order & 7)))
+
+    def set_vacant_at(self, order: int, is_vacant: bool) -> None:
+        if is_vacant:
+            self.vacancy[order >> 3] |= 1 << (order & 7)
+        else:
+            self.vacancy[order >> 3] &= ~(1 << (order & 7)) & 0xFF
+
+    def ordered(self):
+        # For NearestSlotIndex, which addresses slots by position
+        return _SlotViews(self)
+
+    def __getitem__(self, slot_id: int) -> SlotView:
+        if not isinstance(slot_id, int) or not 0 <= slot_id < len(self.sizes):
+            raise KeyError(slot_id)
+        return SlotView(self, slot_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.sizes)))
+
+    def relocate(self, entry_points: int, updates: Dict[int, SlotLocation]) -> None:
+        # Moves slots, by id, to new locations given for entry_points entry
+        # points, see ParkingSystem.add_entry_points. Distances of new entry
+        # points are appended as rows.
+        if not isinstance(self.distances, array):
+            raise UnsupportedOperationError("Slots of a mapped store cannot be moved")
+
+        slots_len = len(self.sizes)
+        added = entry_points - self._entry_points
+        if added:
+            # Every location changes, start the table over
+            self._table = array("q", [-1]) * len(self._table)
+        else:
+            for order in updates:
+                self._remove(order)
+
+        if self.distances.typecode == "q" and not all(
+            isinstance(distance, int)
+            for location in updates.values()
+            for distance in location
+        ):
+            self.distances = array("d", self.distances)
+        self.distances.frombytes(bytes(self.distances.itemsize * slots_len * added))
+        self._entry_points = entry_points
+        for order, location in updates.items():
+            for entry_point, distance in enumerate(location):
+                self.distances[entry_point * slots_len + order] = distance
+
+        for order in updates if not added else range(slots_len):
+            self._table[self._find(self.location_at(order))] = order
+
+    def _remove(self, order: int) -> None:
+        # Backward shift deletion from the table, keeping every location
+        # reachable from its home bucket
+        table = self._table
+        mask = len(table) - 1
+        hole = self._find(self.location_at(order))
+        bucket = (hole + 1) & mask
+        while table[bucket] >= 0:
+            home = location_hash(self.location_at(table[bucket])) & mask
+            if (bucket - home) & mask >= (bucket - hole) & mask:
+                table[hole] = table[bucket]
+                hole = bucket
+            bucket = (bucket + 1) & mask
+        table[hole] = -1
+
+    def __len__(self) -> int:
+        return len(self.sizes)
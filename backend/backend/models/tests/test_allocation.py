@@ -0,0 +1,184 @@
+import random
+
+import pytest
+
+from backend.models.allocation import (
+    BEST_FIT,
+    NEAREST,
+    STRATEGIES,
+    ZONE_BALANCE,
+    AllocationStrategy,
+)
+from backend.models.journal import Journal
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import NoSlotAvailableError
+from backend.models.slotstore import ArraySlotStore
+
+# Zone of entry point 0: the LARGE slot then the SMALL one. Zone of entry
+# point 1: the MEDIUM, SMALL and LARGE slots.
+slots = [(1, 9), (2, 9), (9, 1), (9, 2), (9, 3)]
+sizes = [Size.LARGE, Size.SMALL, Size.MEDIUM, Size.SMALL, Size.LARGE]
+
+
+def _park(parking_system, plate_number, size, entry_point=0):
+    return parking_system.park(Vehicle(plate_number, size), entry_point, 0)
+
+
+@pytest.mark.parametrize("slot_store", [None, ArraySlotStore])
+def test_best_fit(slot_store):
+    nearest = ParkingSystem(2, slots, sizes, slot_store=slot_store)
+    best_fit = ParkingSystem(2, slots, sizes, slot_store=slot_store, strategy=BEST_FIT)
+    assert best_fit.get_strategy() == BEST_FIT
+
+    assert _park(nearest, "A", Size.SMALL) == (1, 9)
+    assert _park(best_fit, "A", Size.SMALL) == (2, 9)
+    # Then the nearest SMALL slot, before any larger one
+    assert _park(best_fit, "B", Size.SMALL) == (9, 2)
+    assert _park(best_fit, "C", Size.SMALL) == (9, 1)
+    assert _park(best_fit, "D", Size.LARGE) == (1, 9)
+
+    # Moved slots are looked up by size as well
+    best_fit.add_entry_points(2, {4: (0, 9)})
+    assert _park(best_fit, "E", Size.MEDIUM) == (0, 9)
+    with pytest.raises(NoSlotAvailableError):
+        _park(best_fit, "F", Size.SMALL)
+
+
+def test_zone_balance():
+    parking_system = ParkingSystem(2, slots, sizes, strategy=ZONE_BALANCE)
+    # Zone 1 has more vacant slots, even for vehicles arriving at entry point 0
+    assert _park(parking_system, "A", Size.SMALL) == (9, 1)
+    # Balanced, the zone of the entry point goes first
+    assert _park(parking_system, "B", Size.SMALL) == (1, 9)
+    assert _park(parking_system, "C", Size.SMALL) == (9, 2)
+    # Only LARGE slots fit
+    assert _park(parking_system, "D", Size.LARGE, 1) == (9, 3)
+    hold = parking_system.hold(Size.SMALL, 1, 60, 0)
+    assert hold.slot_location == (2, 9)
+
+
+@pytest.mark.parametrize("slot_store", [None, ArraySlotStore])
+def test_zone_balance_in_zone(slot_store):
+    # The slot nearest to entry point 1 lies in zone 0
+    parking_system = ParkingSystem(
+        2,
+        [(1, 2), (9, 5), (9, 6)],
+        [Size.SMALL] * 3,
+        slot_store=slot_store,
+        strategy=ZONE_BALANCE,
+    )
+    assert _park(parking_system, "A", Size.SMALL) == (9, 5)
+    assert _park(parking_system, "B", Size.SMALL) == (1, 2)
+    # Zone 0 is full
+    assert _park(parking_system, "C", Size.SMALL) == (9, 6)
+    with pytest.raises(NoSlotAvailableError):
+        _park(parking_system, "D", Size.SMALL)
+    parking_system.unpark("A", 1)
+    assert _park(parking_system, "E", Size.SMALL, 1) == (9, 5)
+
+
+class ScanZoneBalance(AllocationStrategy):
+    # ZoneBalance scanning every zone
+    name = "scan_zone_balance"
+
+    def select(self, size, entry_point):
+        zone_counts = self._system._zone_vacant_counts
+        best_zone = entry_point
+        for zone, counts in enumerate(zone_counts):
+            if sum(counts[size:]) > sum(zone_counts[best_zone][size:]):
+                best_zone = zone
+        zones = self._system._zones
+        vacant = [
+            slot
+            for slot in self._system._slots.values()
+            if slot.is_vacant and slot.size >= size and zones[slot.id] == best_zone
+        ]
+        if not vacant:
+            return None
+        return min(vacant, key=lambda slot: (slot.location[best_zone], slot.id))
+
+
+def test_zone_balance_incremental():
+    rng = random.Random(0)
+    lot_slots = [tuple(rng.randrange(100) for _ in range(4)) for _ in range(300)]
+    lot_sizes = [rng.randrange(len(Size)) for _ in lot_slots]
+    systems = [
+        ParkingSystem(4, lot_slots, lot_sizes, strategy=strategy)
+        for strategy in (ZONE_BALANCE, ScanZoneBalance)
+    ]
+
+    parked = []
+    for i in range(3000):
+        if parked and rng.random() < 0.45:
+            plate_number = parked.pop(rng.randrange(len(parked)))
+            for system in systems:
+                system.unpark(plate_number, i)
+        else:
+            size = rng.randrange(len(Size))
+            entry_point = rng.randrange(4)
+            results = []
+            for system in systems:
+                try:
+                    results.append(_park(system, f"ABC-{i}", size, entry_point))
+                except NoSlotAvailableError:
+                    results.append(None)
+            assert results[0] == results[1]
+            if results[0] is not None:
+                parked.append(f"ABC-{i}")
+
+        if i == 1000:
+            # Moved slots change zones
+            updates = {
+                slot_id: tuple(rng.randrange(100) for _ in range(4))
+                for slot_id in rng.sample(range(len(lot_slots)), 50)
+            }
+            for system in systems:
+                system.add_entry_points(4, updates)
+        elif i == 2000:
+            systems = [
+                ParkingSystem.from_snapshot(
+                    system.snapshot(), strategy=type(system._strategy)
+                )
+                for system in systems
+            ]
+
+
+def test_custom_strategy(monkeypatch):
+    class Farthest(AllocationStrategy):
+        name = "farthest"
+
+        def select(self, size, entry_point):
+            vacant = [
+                slot
+                for slot in self._system.get_slots()
+                if slot.is_vacant and slot.size >= size
+            ]
+            return max(vacant, key=lambda slot: slot.location[entry_point])
+
+    parking_system = ParkingSystem(2, slots, sizes, strategy=Farthest)
+    assert _park(parking_system, "A", Size.SMALL) == (9, 1)
+
+    # Restored by name once registered
+    monkeypatch.setitem(STRATEGIES, "farthest", Farthest)
+    restored = ParkingSystem.from_snapshot(parking_system.snapshot())
+    assert restored.get_strategy() == "farthest"
+
+    parking_system.set_strategy(NEAREST)
+    assert _park(parking_system, "B", Size.SMALL) == (1, 9)
+    with pytest.raises(ValueError):
+        parking_system.set_strategy("random")
+
+
+def test_restore_strategy(tmp_path):
+    journal = Journal(str(tmp_path))
+    parking_system = ParkingSystem(2, slots, sizes, strategy=BEST_FIT)
+    journal.attach(parking_system)
+    _park(parking_system, "A", Size.SMALL)
+    journal.close()
+
+    # Replayed with best fit, then nearest
+    restored = Journal(str(tmp_path)).restore(strategy=NEAREST)
+    assert restored.get_vehicle("A").parking_logs[-1].slot_location == (2, 9)
+    assert restored.get_strategy() == NEAREST
+    assert _park(restored, "B", Size.SMALL) == (1, 9)
+    assert ParkingSystem.from_snapshot(restored.snapshot()).get_strategy() == NEAREST
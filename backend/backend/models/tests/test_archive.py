@@ -0,0 +1,74 @@
+import os
+
+from backend.models.archive import INDEX_FILE, PARTITION_SECONDS, LogArchive
+from backend.models.parking import ParkingSystem, Size, Vehicle
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+HOUR = ParkingSystem.HOURS_IN_SEC
+
+
+def _sessions(parking_system):
+    # Charges of park/unpark cycles, the second one within the continuous
+    # rate window of the first
+    charges = []
+    for plate_number, size, start in [
+        ("ABC-123", Size.SMALL, 0),
+        ("XYZ-789", Size.LARGE, 0),
+        ("ABC-123", Size.SMALL, 3 * HOUR),
+        ("ABC-123", Size.SMALL, 6 * HOUR),
+        ("XYZ-789", Size.LARGE, PARTITION_SECONDS),
+    ]:
+        parking_system.park(Vehicle(plate_number, size), 0, start)
+        charges.append(parking_system.unpark(plate_number, start + 2.5 * HOUR))
+    return charges
+
+
+def test_archive(tmp_path):
+    archive = LogArchive(str(tmp_path), chunk_rows=2)
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    archive.attach(parking_system)
+
+    charges = _sessions(parking_system)
+    # Archiving does not change the charges of the continuous rate
+    assert charges == _sessions(ParkingSystem(entry_points, slots, sizes))
+    assert len(parking_system.get_vehicle("ABC-123").parking_logs) == 1
+
+    history = archive.history("ABC-123")
+    assert [log.time_parked for log in history] == [0, 3 * HOUR, 6 * HOUR]
+    assert [log.charge for log in history] == [charges[0], charges[2], charges[3]]
+    assert history[0].size == Size.MEDIUM
+    assert history[0].slot_id == 2
+    assert archive.history("NOT-PARKED") == []
+
+    total = sum(charges)
+    assert archive.revenue(0, 2 * PARTITION_SECONDS) == total
+    assert archive.revenue(0, PARTITION_SECONDS) == sum(charges[:4])
+    assert archive.revenue(0, 2.5 * HOUR) == 0
+    assert archive.revenue(3 * HOUR, 6 * HOUR) == charges[2]
+    assert archive.revenue(0, 2 * PARTITION_SECONDS, Size.LARGE) == (
+        charges[1] + charges[4]
+    )
+
+    # Reopened from the index, once the buffered sessions are written out
+    archive.close()
+    reopened = LogArchive(str(tmp_path))
+    assert reopened.revenue(0, 2 * PARTITION_SECONDS) == total
+    assert reopened.history("ABC-123") == history
+
+
+def test_torn_index(tmp_path):
+    archive = LogArchive(str(tmp_path))
+    archive.append("ABC-123", Size.SMALL, 0, 0, HOUR, 40)
+    archive.flush()
+    archive.append("ABC-123", Size.SMALL, 0, 2 * HOUR, 3 * HOUR, 20)
+    archive.flush()
+
+    path = os.path.join(str(tmp_path), INDEX_FILE)
+    with open(path, "rb+") as index_file:
+        index_file.truncate(os.path.getsize(path) - 10)
+
+    reopened = LogArchive(str(tmp_path))
+    assert reopened.revenue(0, 4 * HOUR) == 40
+    assert [log.charge for log in reopened.history("ABC-123")] == [40]
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from backend.models.parking import ParkingLog, ParkingSystem, Size, Tariff, Vehicle
+
+np = pytest.importorskip("numpy")
+billing = pytest.importorskip("backend.models.billing")
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+def _random_logs(rng, parking_system, chains):
+    # Park and unpark vehicles so that chains of various lengths and rates are
+    # produced, returning the logs with their chain ids.
+    logs = []
+    now = 0
+    for chain_id in range(chains):
+        plate_number = f"PLT-{chain_id}"
+        for _ in range(rng.randint(1, 6)):
+            parking_system.park(
+                Vehicle(plate_number, Size.SMALL), rng.randrange(entry_points), now
+            )
+            now += rng.uniform(0, 60) * ParkingSystem.HOURS_IN_SEC
+            parking_system.unpark(plate_number, now)
+            now += rng.uniform(0, 0.99) * ParkingSystem.HOURS_IN_SEC
+
+        vehicle = parking_system.get_vehicle(plate_number)
+        logs.extend((chain_id, log) for log in vehicle.parking_logs)
+    return logs
+
+
+@pytest.mark.parametrize(
+    "tariff",
+    [
+        Tariff(),
+        Tariff(
+            flat_rate=50,
+            flat_hours=2,
+            daily_rate=3000,
+            hour_rates={Size.SMALL: 10, Size.MEDIUM: 30, Size.LARGE: 70},
+        ),
+    ],
+)
+def test_bulk_charges_matches_scalar(tariff):
+    rng = random.Random(5)
+    parking_system = ParkingSystem(entry_points, slots, sizes, tariff=tariff)
+    logs = _random_logs(rng, parking_system, 200)
+
+    # Shuffle the chains into each other, keeping the order within a chain
+    rng.shuffle(logs)
+    logs.sort(key=lambda item: item[1].time_parked)
+
+    charges = billing.bulk_charges(
+        [log.time_parked for _, log in logs],
+        [log.time_unparked for _, log in logs],
+        [parking_system.get_slot(log.slot_location).size for _, log in logs],
+        [chain_id for chain_id, _ in logs],
+        tariff,
+    )
+    assert charges.tolist() == [log.charge for _, log in logs]
+
+
+def test_bulk_charges_continuous_rate():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    parking_logs = [
+        ParkingLog(
+            time_parked=0,
+            time_unparked=ParkingSystem.HOURS_IN_SEC * 13.5,
+            slot_location=(1, 2, 3),
+        ),
+        ParkingLog(
+            time_parked=ParkingSystem.HOURS_IN_SEC * 14,
+            time_unparked=ParkingSystem.HOURS_IN_SEC * 50.2,
+            slot_location=(2, 3, 5),
+        ),
+    ]
+
+    charges = billing.bulk_charges(
+        [log.time_parked for log in parking_logs],
+        [log.time_unparked for log in parking_logs],
+        [Size.SMALL, Size.LARGE],
+        [0, 0],
+    )
+    parking_logs[0].charge = 260
+    assert charges.tolist() == [260, parking_system._get_charge(parking_logs)]
+
+
+def test_bulk_charges_empty():
+    assert billing.bulk_charges([], [], [], []).tolist() == []
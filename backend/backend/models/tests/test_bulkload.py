@@ -0,0 +1,63 @@
+import pytest
+
+from backend.models.parking import ParkingSystem, Vehicle
+from backend.models.parkingerrs import InvalidEntryPointError, InvalidSizeError
+
+np = pytest.importorskip("numpy")
+bulkload = pytest.importorskip("backend.models.bulkload")
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4), (3, 1, 2)]
+sizes = [0, 2, 1, 1]
+
+
+def test_load_parking_system():
+    loaded = bulkload.load_parking_system(np.array(slots), np.array(sizes))
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    assert list(loaded.get_slots()) == list(parking_system.get_slots())
+    for entry_point in range(entry_points):
+        assert loaded.get_vacant_counts(entry_point) == (
+            parking_system.get_vacant_counts(entry_point)
+        )
+
+    for i, (size, entry_point) in enumerate([(1, 2), (0, 0), (1, 1), (0, 0)]):
+        plate_number = f"ABC-{i}"
+        assert loaded.park(Vehicle(plate_number, size), entry_point, 0) == (
+            parking_system.park(Vehicle(plate_number, size), entry_point, 0)
+        )
+    assert loaded.unpark("ABC-0", 3600) == parking_system.unpark("ABC-0", 3600)
+    assert loaded.get_vacant_counts(0) == parking_system.get_vacant_counts(0)
+
+
+def test_load_float_distances():
+    loaded = bulkload.load_parking_system(
+        np.array([[1.5, 2.0], [0.5, 3.0]]), np.array([0, 0])
+    )
+    assert loaded.get_slot((0.5, 3.0)).size == 0
+    assert loaded.park(Vehicle("ABC", 0), 0, 0) == (0.5, 3.0)
+
+
+def test_load_invalid_size():
+    for invalid_sizes in ([0, 1, 3, 0], [0, 1, -1, 0], [0, 1, 2], [0.0, 1.0, 1.0, 0]):
+        with pytest.raises(InvalidSizeError):
+            bulkload.load_parking_system(np.array(slots), np.array(invalid_sizes))
+
+
+def test_load_invalid_location():
+    for distances in (
+        np.array([1, 2, 3, 4]),
+        np.array([[1.0, np.nan, 3.0]] * 4),
+        np.array([["a", "b", "c"]] * 4),
+        np.array([[1, 2, 3], [1, 2, 3], [0, 1, 4], [3, 1, 2]]),
+    ):
+        with pytest.raises(InvalidEntryPointError):
+            bulkload.load_parking_system(distances, np.array(sizes))
+
+
+def test_read_npz(tmp_path):
+    path = tmp_path / "lot.npz"
+    np.savez(path, distances=np.array(slots), sizes=np.array(sizes))
+    distances, lot_sizes = bulkload.read_npz(path)
+    assert distances.tolist() == [list(slot) for slot in slots]
+    assert lot_sizes.tolist() == sizes
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.models.events import EventLog
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import EventsLostError
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+def test_events():
+    events = EventLog()
+    parking_system = ParkingSystem(entry_points, slots, sizes, events=events)
+
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    hold = parking_system.hold(Size.SMALL, 0, 60, 0)
+    parking_system.expire_holds(60)
+    parking_system.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC)
+    parking_system.add_entry_points(entry_points, {1: (9, 9, 9)})
+
+    assert [
+        (event.seq, event.type, event.slot_id, event.is_vacant)
+        for event in events.since(0)
+    ] == [
+        (1, "park", 2, False),
+        (2, "hold", 0, False),
+        (3, "release", 0, True),
+        (4, "unpark", 2, True),
+        (5, "move", 1, True),
+    ]
+    park, _, release, unpark, move = events.since(0)
+    assert park.plate_number == "ABC-123"
+    assert release.hold_id == hold.id
+    assert unpark.charge == 40
+    assert move.location == (9, 9, 9)
+
+    assert [event.seq for event in events.since(3, limit=1)] == [4]
+    assert events.since(5) == []
+
+
+def test_events_lost():
+    events = EventLog(capacity=2)
+    parking_system = ParkingSystem(entry_points, slots, sizes, events=events)
+    for plate_number in ("ABC-123", "DEF-456", "GHI-789"):
+        parking_system.park(Vehicle(plate_number, Size.SMALL), 0, 0)
+
+    assert [event.seq for event in events.since(1)] == [2, 3]
+    for since in (0, 4, -1):
+        with pytest.raises(EventsLostError):
+            events.since(since)
+
+
+def test_wait():
+    events = EventLog()
+    parking_system = ParkingSystem(entry_points, slots, sizes, events=events)
+    assert events.wait(0, 0) == []
+
+    timer = threading.Timer(
+        0.05, parking_system.park, (Vehicle("ABC-123", Size.SMALL), 0, 0)
+    )
+    timer.start()
+    assert [event.type for event in events.wait(0, 5)] == ["park"]
+    timer.join()
+
+
+def test_wait_async():
+    events = EventLog()
+    parking_system = ParkingSystem(entry_points, slots, sizes, events=events)
+
+    async def park_later():
+        await asyncio.sleep(0.05)
+        # From another thread, as the writer of the ASGI app does
+        await asyncio.to_thread(
+            parking_system.park, Vehicle("ABC-123", Size.SMALL), 0, 0
+        )
+
+    async def wait():
+        assert await events.wait_async(0, 0) == []
+        task = asyncio.create_task(park_later())
+        new_events = await events.wait_async(0, 5)
+        await task
+        return new_events
+
+    assert [event.type for event in asyncio.run(wait())] == ["park"]
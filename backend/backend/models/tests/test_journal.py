@@ -0,0 +1,144 @@
+import os
+import random
+
+import pytest
+
+from backend.models.journal import FsyncPolicy, Journal
+from backend.models.parking import ParkingSystem, Size, Tariff, Vehicle
+from backend.models.parkingerrs import HoldNotExistsError, NoSlotAvailableError
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4), (4, 0, 2), (3, 3, 3)]
+sizes = [0, 2, 1, 0, 1]
+
+
+def _run_trace(parking_system, seed, now=0, operations=200):
+    rng = random.Random(seed)
+    for _ in range(operations):
+        now += rng.uniform(0, 2) * ParkingSystem.HOURS_IN_SEC
+        plate_number = f"PLT-{rng.randrange(10)}"
+        vehicle = parking_system.get_vehicle(plate_number)
+        if vehicle is not None and vehicle.is_parked:
+            parking_system.unpark(plate_number, now)
+            continue
+
+        vehicle = Vehicle(plate_number, rng.randrange(len(Size)))
+        try:
+            parking_system.park(vehicle, rng.randrange(entry_points), now)
+        except NoSlotAvailableError:
+            pass
+    return now
+
+
+def _state(parking_system):
+    return parking_system.get_slots(), parking_system.get_vehicles()
+
+
+@pytest.mark.parametrize("fsync_policy", list(FsyncPolicy))
+def test_restore(tmp_path, fsync_policy):
+    tariff = Tariff(flat_rate=50)
+    parking_system = ParkingSystem(entry_points, slots, sizes, tariff=tariff)
+    journal = Journal(tmp_path, fsync_policy, snapshot_every=64)
+    journal.attach(parking_system)
+    now = _run_trace(parking_system, 1)
+    journal.close()
+
+    expected_system = ParkingSystem(entry_points, slots, sizes, tariff=tariff)
+    _run_trace(expected_system, 1)
+
+    restored_system = Journal(tmp_path, fsync_policy).restore()
+    assert _state(restored_system) == _state(expected_system)
+    assert restored_system.get_tariff() == tariff
+
+    # Restored system keeps allocating slots the same way
+    _run_trace(restored_system, 2, now)
+    _run_trace(expected_system, 2, now)
+    assert _state(restored_system) == _state(expected_system)
+
+
+def test_restore_empty(tmp_path):
+    assert Journal(tmp_path).restore() is None
+
+
+def test_restore_torn_write(tmp_path):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    journal = Journal(tmp_path, FsyncPolicy.ALWAYS)
+    journal.attach(parking_system)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.park(Vehicle("DEF-456", Size.SMALL), 0, 0)
+    journal.close()
+
+    # Cut the last record short, as if the process died while writing it
+    (wal_name,) = [name for name in os.listdir(tmp_path) if name.startswith("wal-")]
+    wal_path = tmp_path / wal_name
+    wal_path.write_bytes(wal_path.read_bytes()[:-3])
+
+    restored_system = Journal(tmp_path).restore()
+    assert restored_system.get_vehicle("ABC-123").is_parked
+    assert restored_system.get_vehicle("DEF-456") is None
+
+
+def test_snapshot_compacts(tmp_path):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    journal = Journal(tmp_path, FsyncPolicy.OS, snapshot_every=10)
+    journal.attach(parking_system)
+    _run_trace(parking_system, 3)
+    journal.close()
+
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 2
+    assert names[0].startswith("snapshot-")
+    assert names[1].startswith("wal-")
+
+
+def test_restore_slot_updates(tmp_path):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    journal = Journal(tmp_path)
+    journal.attach(parking_system)
+    now = _run_trace(parking_system, 1)
+    parking_system.add_entry_points(entry_points, {0: (9, 9, 0), 3: (0, 5, 5)})
+    parking_system.add_entry_points(
+        entry_points + 1, {i: slot + (i,) for i, slot in enumerate(slots)}
+    )
+    _run_trace(parking_system, 2, now)
+    journal.close()
+
+    restored_system = Journal(tmp_path).restore()
+    assert restored_system.get_entry_points() == entry_points + 1
+    assert _state(restored_system) == _state(parking_system)
+
+
+def test_restore_holds(tmp_path):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    journal = Journal(tmp_path)
+    journal.attach(parking_system)
+    holds = [parking_system.hold(Size.SMALL, 0, 60 * (i + 1), 0) for i in range(4)]
+    parking_system.park_hold(Vehicle("ABC-123", Size.SMALL), holds[0].id, 30)
+    parking_system.cancel_hold(holds[1].id)
+    # Expires the hold of 3 minutes while failing to park
+    with pytest.raises(HoldNotExistsError):
+        parking_system.park_hold(Vehicle("DEF-456", Size.LARGE), holds[1].id, 180)
+    journal.close()
+
+    restored_system = Journal(tmp_path).restore()
+    assert _state(restored_system) == _state(parking_system)
+    assert restored_system.get_holds() == parking_system.get_holds() == [holds[3]]
+    assert restored_system.hold(Size.SMALL, 0, 60, 180).id == 4
+
+
+def test_commit_expired_holds(tmp_path):
+    parking_system = ParkingSystem(1, [(1,)], [0])
+    journal = Journal(tmp_path, FsyncPolicy.ALWAYS)
+    journal.attach(parking_system)
+
+    # Holds expired by failing operations are synced all the same
+    hold = parking_system.hold(Size.SMALL, 0, 60, 0)
+    with pytest.raises(HoldNotExistsError):
+        parking_system.park_hold(Vehicle("ABC-123", Size.SMALL), hold.id, 120)
+    assert journal._synced == journal._written == 2
+
+    parking_system.hold(Size.SMALL, 0, 60, 180)
+    with pytest.raises(NoSlotAvailableError):
+        parking_system.hold(Size.LARGE, 0, 60, 300)
+    assert journal._synced == journal._written == 4
+    journal.close()
@@ -0,0 +1,176 @@
+import json
+import random
+import sys
+
+import pytest
+
+from backend.models import layout
+from backend.models.journal import Journal
+from backend.models.parking import ParkingSystem, Vehicle
+from backend.models.parkingerrs import NoSlotAvailableError, UnsupportedOperationError
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4), (3, 1, 2)]
+sizes = [0, 2, 1, 1]
+
+
+@pytest.fixture()
+def layout_path(tmp_path):
+    path = str(tmp_path / "lot.layout")
+    layout.write_layout(path, entry_points, slots, sizes)
+    return path
+
+
+def test_load_layout(layout_path):
+    mapped = layout.load_layout(layout_path)
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    assert list(mapped.get_slots()) == list(parking_system.get_slots())
+    assert mapped.get_slot((0, 1, 4)).size == 1
+    for entry_point in range(entry_points):
+        assert mapped.get_vacant_counts(entry_point) == (
+            parking_system.get_vacant_counts(entry_point)
+        )
+
+
+def test_park_unpark(layout_path):
+    mapped = layout.load_layout(layout_path)
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    rng = random.Random(0)
+    for i in range(200):
+        vehicle_size = rng.randrange(3)
+        entry_point = rng.randrange(entry_points)
+        results = []
+        for system in (mapped, parking_system):
+            try:
+                results.append(
+                    system.park(Vehicle(f"ABC-{i}", vehicle_size), entry_point, i)
+                )
+            except NoSlotAvailableError:
+                results.append(None)
+        assert results[0] == results[1]
+
+        plate_number = f"ABC-{rng.randrange(i + 1)}"
+        vehicle = parking_system.get_vehicle(plate_number)
+        if vehicle is not None and vehicle.is_parked:
+            assert mapped.unpark(plate_number, i + 1) == (
+                parking_system.unpark(plate_number, i + 1)
+            )
+
+    assert mapped.get_vacant_counts(None) == parking_system.get_vacant_counts(None)
+
+
+def test_heaps_stay_mapped(layout_path):
+    mapped = layout.load_layout(layout_path)
+    index = mapped._index
+    assert mapped.park(Vehicle("ABC", 0), 0, 0) == (0, 1, 4)
+    assert mapped.park(Vehicle("XYZ", 0), 0, 0) == (1, 2, 3)
+    # Taken slots are stepped over in the mapping, not copied out of it
+    assert index._heaps == []
+    assert not any(any(heaps) for heaps in index._released)
+
+    # Released slots behind a cursor are pushed on their own
+    mapped.unpark("ABC", 1)
+    assert sum(len(heap) for heaps in index._released for heap in heaps) == 1
+    assert mapped.park(Vehicle("DEF", 0), 0, 2) == (0, 1, 4)
+
+
+def _park_unpark(systems, seed, start):
+    rng = random.Random(seed)
+    for i in range(start, start + 50):
+        plate_number = f"ABC-{rng.randrange(8)}"
+        vehicle_size = rng.randrange(3)
+        entry_point = rng.randrange(entry_points)
+        results = []
+        for system in systems:
+            vehicle = system.get_vehicle(plate_number)
+            if vehicle is not None and vehicle.is_parked:
+                results.append(system.unpark(plate_number, i))
+                continue
+            try:
+                vehicle = Vehicle(plate_number, vehicle_size)
+                results.append(system.park(vehicle, entry_point, i))
+            except NoSlotAvailableError:
+                results.append(None)
+        assert results[0] == results[1]
+
+
+def test_restore_journal(tmp_path, layout_path):
+    mapped = layout.load_layout(layout_path)
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    journal = Journal(tmp_path / "journal", snapshot_every=16)
+    journal.attach(mapped)
+    _park_unpark([mapped, parking_system], 0, 0)
+    mapped.hold(0, 0, 60, 50)
+    parking_system.hold(0, 0, 60, 50)
+    journal.close()
+
+    # The layout is mapped again, with the slots of the snapshot taken
+    restored = Journal(tmp_path / "journal").restore()
+    assert isinstance(restored._index, layout._MappedSlotIndex)
+    assert restored._slots.mapping is not None
+    assert list(restored.get_slots()) == list(parking_system.get_slots())
+    assert restored.get_vehicles() == parking_system.get_vehicles()
+    assert restored.get_holds() == parking_system.get_holds()
+    for entry_point in range(entry_points):
+        assert restored.get_vacant_counts(entry_point) == (
+            parking_system.get_vacant_counts(entry_point)
+        )
+    _park_unpark([restored, parking_system], 1, 100)
+
+    # Only the vacancy of the slots is snapshotted
+    state = restored.snapshot()
+    assert "slots" not in state
+    assert state["layout"] == layout_path
+
+
+def test_slots_stay(layout_path):
+    mapped = layout.load_layout(layout_path)
+    with pytest.raises(UnsupportedOperationError):
+        mapped.add_entry_points(None, {0: (9, 9, 9)})
+    assert mapped.get_slot((1, 2, 3)).id == 0
+
+
+def test_layout_is_read_only(layout_path):
+    mapped = layout.load_layout(layout_path)
+    mapped.park(Vehicle("ABC", 0), 0, 0)
+    with open(layout_path, "rb") as layout_file:
+        data = layout_file.read()
+
+    layout.write_layout(layout_path + ".copy", entry_points, slots, sizes)
+    with open(layout_path + ".copy", "rb") as layout_file:
+        assert layout_file.read() == data
+
+
+def test_invalid_layout(tmp_path, layout_path):
+    path = tmp_path / "invalid.layout"
+    path.write_bytes(bytes(64))
+    with pytest.raises(ValueError, match="Not a layout file"):
+        layout.load_layout(str(path))
+
+    with open(layout_path, "rb") as layout_file:
+        path.write_bytes(layout_file.read()[:100])
+    with pytest.raises(ValueError, match="Truncated layout file"):
+        layout.load_layout(str(path))
+
+    # Layouts of version 1 hashed their location table with hash()
+    with open(layout_path, "rb") as layout_file:
+        data = bytearray(layout_file.read())
+    data[8:12] = (1).to_bytes(4, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="Unsupported layout version 1"):
+        layout.load_layout(str(path))
+
+
+def test_main(tmp_path, monkeypatch):
+    lot_path = tmp_path / "lot.json"
+    lot_path.write_text(
+        json.dumps(dict(entry_points=entry_points, slots=slots, sizes=sizes))
+    )
+    layout_path = str(tmp_path / "lot.layout")
+    monkeypatch.setattr(sys, "argv", ["layout", str(lot_path), layout_path])
+    layout.main()
+
+    mapped = layout.load_layout(layout_path)
+    assert [slot.location for slot in mapped.get_slots()] == slots
@@ -0,0 +1,50 @@
+import pytest
+
+from backend.models.journal import FsyncPolicy
+from backend.models.lots import LotRegistry, shard_of
+from backend.models.parking import Size, Vehicle
+from backend.models.parkingerrs import LotNotExistsError, NoSlotAvailableError
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+def test_shard_of():
+    assert shard_of("north", 4) == shard_of("north", 4)
+    assert {shard_of(f"lot-{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_registry(tmp_path):
+    registry = LotRegistry(2, data_dir=str(tmp_path), fsync_policy=FsyncPolicy.OS)
+    try:
+        lot_ids = [f"lot-{i}" for i in range(6)]
+        for lot_id in lot_ids:
+            assert registry.init_lot(lot_id, entry_points, slots, sizes)
+        assert not registry.init_lot("lot-0", entry_points, slots, sizes)
+        assert registry.lot_ids() == lot_ids
+
+        futures = [
+            registry.submit(lot_id, "park", Vehicle("ABC-123", Size.LARGE), 0, 0)
+            for lot_id in lot_ids
+        ]
+        assert [future.result() for future in futures] == [(2, 3, 5)] * 6
+        with pytest.raises(NoSlotAvailableError):
+            registry.call("lot-0", "park", Vehicle("XYZ-123", Size.LARGE), 0, 0)
+        with pytest.raises(LotNotExistsError):
+            registry.call("lot-9", "count_vacant")
+        with pytest.raises(ValueError):
+            registry.call("lot-0", "snapshot")
+
+        rows = list(registry.iter_rows("lot-1", "slots", ("is_vacant",), page_size=2))
+        assert rows == [(1, (True,)), (2, (False,)), (3, (True,))]
+    finally:
+        registry.close()
+
+    # Lots are restored from their journals, by whichever shard owns them now
+    registry = LotRegistry(3, data_dir=str(tmp_path))
+    try:
+        assert registry.lot_ids() == lot_ids
+        assert registry.call("lot-5", "unpark", "ABC-123", 3600) == 40
+    finally:
+        registry.close()
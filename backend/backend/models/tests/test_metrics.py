@@ -0,0 +1,114 @@
+import pytest
+
+from backend.models.allocation import STRATEGIES, Nearest
+from backend.models.metrics import LATENCY_BUCKETS, Metrics
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import NoSlotAvailableError, VehicleNotExistsError
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+def test_operation_metrics():
+    metrics = Metrics()
+    parking_system = ParkingSystem(entry_points, slots, sizes, metrics=metrics)
+
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC)
+    # Continuous rate, a chain of two logs
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, ParkingSystem.HOURS_IN_SEC)
+    parking_system.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC * 2)
+
+    for operation, count in [("park", 2), ("unpark", 2), ("select_slot", 2)]:
+        histogram = metrics.get_histogram(
+            "parking_operation_seconds", operation=operation
+        )
+        assert histogram.count == count
+        assert sum(histogram.counts) == count
+
+    chain_lengths = metrics.get_histogram("parking_log_chain_length")
+    assert chain_lengths.sum == 1 + 2
+    # A small vehicle looks at the top of each of the three size heaps
+    assert metrics.get_histogram("parking_slots_scanned").sum == 3 * 2
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_strategy_metrics(strategy):
+    metrics = Metrics()
+    parking_system = ParkingSystem(entry_points, slots, sizes, metrics=metrics)
+    parking_system.set_strategy(strategy)
+
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    # Every strategy selects through the same instrumented path
+    histogram = metrics.get_histogram(
+        "parking_operation_seconds", operation="select_slot"
+    )
+    assert histogram.count == 1
+    assert metrics.get_histogram("parking_slots_scanned").count == 1
+
+
+def test_keyword_arguments():
+    metrics = Metrics()
+    parking_system = ParkingSystem(entry_points, slots, sizes, metrics=metrics)
+
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, time_parked=0)
+    parking_system.unpark("ABC-123", time_unparked=ParkingSystem.HOURS_IN_SEC)
+    hold = parking_system.hold(Size.SMALL, 0, 60, ParkingSystem.HOURS_IN_SEC)
+    parking_system.park_hold(
+        Vehicle("XYZ-123", Size.SMALL), hold.id, time_parked=ParkingSystem.HOURS_IN_SEC
+    )
+
+    for operation in ("park", "unpark", "park_hold"):
+        histogram = metrics.get_histogram(
+            "parking_operation_seconds", operation=operation
+        )
+        assert histogram.count == 1
+
+
+def test_error_metrics():
+    metrics = Metrics()
+    parking_system = ParkingSystem(entry_points, slots, sizes, metrics=metrics)
+
+    for i in range(4):
+        try:
+            parking_system.park(Vehicle(f"ABC-{i}", Size.SMALL), 0, 0)
+        except NoSlotAvailableError:
+            pass
+    with pytest.raises(VehicleNotExistsError):
+        parking_system.unpark("XYZ-123", 0)
+
+    assert (
+        metrics.get_counter("parking_errors_total", error="NoSlotAvailableError") == 1
+    )
+    assert (
+        metrics.get_counter("parking_errors_total", error="VehicleNotExistsError") == 1
+    )
+    # Failed operations are timed as well
+    histogram = metrics.get_histogram("parking_operation_seconds", operation="park")
+    assert histogram.count == 4
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.observe("parking_operation_seconds", 3e-6, operation="park")
+    metrics.observe("parking_operation_seconds", 2.0, operation="park")
+    metrics.inc("parking_errors_total", error='Quoted"Error')
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE parking_operation_seconds histogram" in lines
+    assert 'parking_operation_seconds_bucket{operation="park",le="1e-06"} 0' in lines
+    assert 'parking_operation_seconds_bucket{operation="park",le="5e-06"} 1' in lines
+    assert 'parking_operation_seconds_bucket{operation="park",le="1.0"} 1' in lines
+    assert 'parking_operation_seconds_bucket{operation="park",le="+Inf"} 2' in lines
+    assert 'parking_operation_seconds_count{operation="park"} 2' in lines
+    assert 'parking_errors_total{error="Quoted\\"Error"} 1' in lines
+    buckets = [line for line in lines if line.startswith("parking_operation_seconds_b")]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+
+
+def test_no_metrics():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    # The plain methods are used
+    assert parking_system.park.__func__ is ParkingSystem.park
+    assert parking_system._select_slot.__func__ is Nearest.select
@@ -1,13 +1,25 @@
 import datetime
+import itertools
+import random
+import sys
+import threading
 
 import pytest
 
-from backend.models.parking import ParkingLog, ParkingSystem, Size, Vehicle
+from backend.models.parking import ParkingLog, ParkingSystem, Size, Tariff, Vehicle
 from backend.models.parkingerrs import (
     AlreadyParkedError,
+    HoldNotExistsError,
+    InvalidEntryPointError,
+    InvalidHoldError,
+    InvalidSizeError,
+    InvalidTariffError,
+    InvalidTimeError,
     NoSlotAvailableError,
+    SlotNotExistsError,
     VehicleNotExistsError,
 )
+from backend.models.slotstore import ArraySlotStore
 
 entry_points = 3
 slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
@@ -34,6 +46,24 @@ def test_park():
     assert vehicle.parking_logs[0].slot_location == expected_location
 
 
+def test_iter_vehicles():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.park(Vehicle("DEF-456", Size.SMALL), 0, 0)
+
+    vehicles = parking_system.iter_vehicles(1)
+    assert next(vehicles).plate_number == "DEF-456"
+
+    # Vehicles added while iterating are picked up
+    parking_system.park(Vehicle("GHI-789", Size.SMALL), 0, 0)
+    assert [vehicle.plate_number for vehicle in vehicles] == ["GHI-789"]
+
+    assert [slot.location for slot in parking_system.iter_slots(0, 2)] == [
+        (1, 2, 3),
+        (2, 3, 5),
+    ]
+
+
 def test_park_full():
     parking_system = ParkingSystem(entry_points, slots, sizes)
 
@@ -55,6 +85,28 @@ def test_park_full():
         parking_system.park(vehicle, 0)
 
 
+def test_vacant_counts():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    # All slots are nearest to entry point 0, so all are in its zone
+    assert parking_system.get_vacant_counts() == [1, 1, 1]
+    assert parking_system.get_vacant_counts(0) == [1, 1, 1]
+    assert parking_system.get_vacant_counts(1) == [0, 0, 0]
+    assert parking_system.count_vacant(Size.MEDIUM) == 2
+
+    parking_system.park(Vehicle("ABC-123", Size.MEDIUM), 0, 0)
+    assert parking_system.count_vacant(Size.MEDIUM) == 1
+    assert parking_system.count_vacant(Size.SMALL, 0) == 2
+
+    parking_system.park(Vehicle("DEF-456", Size.MEDIUM), 0, 0)
+    assert parking_system.count_vacant(Size.MEDIUM) == 0
+    with pytest.raises(NoSlotAvailableError):
+        parking_system.park(Vehicle("GHI-789", Size.LARGE), 0, 0)
+
+    parking_system.unpark("ABC-123", 10)
+    assert parking_system.get_vacant_counts() == [1, 1, 0]
+
+
 def test_already_parked():
     parking_system = ParkingSystem(entry_points, slots, sizes)
 
@@ -66,6 +118,77 @@ def test_already_parked():
         parking_system.park(vehicle, 0)
 
 
+def test_park_many():
+    def requests():
+        return [
+            (Vehicle("ABC-123", Size.SMALL), 0),
+            (Vehicle("DEF-456", Size.LARGE), 2, 10),
+            (Vehicle("ABC-123", Size.SMALL), 1),
+            (Vehicle("GHI-789", Size.SMALL), 1),
+            (Vehicle("JKL-012", Size.SMALL), 0),
+        ]
+
+    sequential_system = ParkingSystem(entry_points, slots, sizes)
+    expected = []
+    for vehicle, entry_point, *time_parked in requests():
+        try:
+            expected.append(
+                sequential_system.park(vehicle, entry_point, *time_parked or [0])
+            )
+        except Exception as err:
+            expected.append(type(err))
+
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    results = parking_system.park_many(requests(), time_parked=0)
+    assert [
+        type(result) if isinstance(result, Exception) else result for result in results
+    ] == expected
+    assert expected == [
+        (0, 1, 4),
+        (2, 3, 5),
+        AlreadyParkedError,
+        (1, 2, 3),
+        NoSlotAvailableError,
+    ]
+
+
+def test_park_many_errors():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 100)
+    parking_system.unpark("ABC-123", 200)
+
+    results = parking_system.park_many(
+        [
+            (Vehicle("ABC-123", Size.SMALL), 0, 100),
+            (Vehicle(["DEF-456"], Size.SMALL), 0),
+            (Vehicle("DEF-456", Size.SMALL), 0),
+        ],
+        time_parked=300,
+    )
+    # Every request gets a result, whatever it failed with
+    assert isinstance(results[0], InvalidTimeError)
+    assert isinstance(results[1], TypeError)
+    assert results[2] == (0, 1, 4)
+
+    results = parking_system.unpark_many(["DEF-456"], time_unparked=0)
+    assert isinstance(results[0], InvalidTimeError)
+
+
+def test_unpark_many():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.park(Vehicle("DEF-456", Size.LARGE), 2, 0)
+
+    results = parking_system.unpark_many(
+        ["ABC-123", "GHI-789", "DEF-456"],
+        times_unparked=[None, None, ParkingSystem.HOURS_IN_SEC * 5],
+        time_unparked=ParkingSystem.HOURS_IN_SEC,
+    )
+    assert results[0] == 40
+    assert isinstance(results[1], VehicleNotExistsError)
+    assert results[2] == 240
+
+
 def test_unpark():
     parking_system = ParkingSystem(entry_points, slots, sizes)
 
@@ -133,6 +256,31 @@ def test_not_continuous_rate():
     assert len(saved_vehicle.parking_logs) == 1
 
 
+def test_incremental_charge_matches_logs():
+    rng = random.Random(2)
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    compacted_system = ParkingSystem(entry_points, slots, sizes)
+
+    plate_number = "ABC-123"
+    now = 0
+    for _ in range(40):
+        entry_point = rng.randrange(entry_points)
+        for system in (parking_system, compacted_system):
+            system.park(Vehicle(plate_number, Size.SMALL), entry_point, now)
+        now += rng.uniform(0, 30) * ParkingSystem.HOURS_IN_SEC
+
+        charge = parking_system.unpark(plate_number, now)
+        assert compacted_system.unpark(plate_number, now) == charge
+        compacted_system.get_vehicle(plate_number).compact_logs()
+
+        # Charge from the running billing state matches a full recompute
+        logs = parking_system.get_vehicle(plate_number).parking_logs
+        assert parking_system._get_charge(logs) == charge
+        now += rng.uniform(0, 1.5) * ParkingSystem.HOURS_IN_SEC
+
+    assert len(compacted_system.get_vehicle(plate_number).parking_logs) == 1
+
+
 def test_basic_flat_rate():
     parking_system = ParkingSystem(entry_points, slots, sizes)
 
@@ -384,3 +532,417 @@ def test_continuous_rate_flat_hour_and_day():
     # 10300 - 260 = 10040
     charge = parking_system._get_charge(parking_logs)
     assert charge == 10040
+
+
+def _sorted_nearest_slot(parking_system, size, entry_point):
+    # Reference implementation: full sort over the vacant slots
+    vacant_slots = [
+        slot
+        for slot in parking_system.get_slots()
+        if slot.is_vacant and slot.size >= size
+    ]
+    vacant_slots.sort(key=lambda slot: slot.location[entry_point])
+    return vacant_slots[0] if vacant_slots else None
+
+
+def test_nearest_slot_matches_sort():
+    rng = random.Random(1)
+    lot_entry_points = 4
+    lot_slots = [
+        tuple(rng.randint(0, 5) for _ in range(lot_entry_points)) for _ in range(60)
+    ]
+    lot_sizes = [rng.randint(0, 2) for _ in lot_slots]
+    parking_system = ParkingSystem(lot_entry_points, lot_slots, lot_sizes)
+
+    parked = []
+    for i in range(500):
+        if parked and rng.random() < 0.4:
+            plate_number = parked.pop(rng.randrange(len(parked)))
+            parking_system.unpark(plate_number, time_unparked=i)
+            continue
+
+        size = rng.randint(0, 2)
+        entry_point = rng.randrange(lot_entry_points)
+        expected = _sorted_nearest_slot(parking_system, size, entry_point)
+        assert parking_system.get_nearest_slot(size, entry_point) is expected
+
+        plate_number = f"PLT-{i}"
+        if expected is None:
+            with pytest.raises(NoSlotAvailableError):
+                parking_system.park(Vehicle(plate_number, size), entry_point, i)
+        else:
+            location = parking_system.park(Vehicle(plate_number, size), entry_point, i)
+            assert location == expected.location
+            parked.append(plate_number)
+
+
+def test_nearest_slot_after_unpark():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    assert parking_system.get_nearest_slot(Size.SMALL, 0).location == (1, 2, 3)
+
+    parking_system.unpark("ABC-123", 10)
+    assert parking_system.get_nearest_slot(Size.SMALL, 0).location == (0, 1, 4)
+
+
+def test_thread_safe_no_double_booking():
+    rng = random.Random(3)
+    lot_entry_points = 3
+    lot_slots = [
+        tuple(rng.randint(0, 20) for _ in range(lot_entry_points)) for _ in range(40)
+    ]
+    lot_sizes = [rng.randint(0, 2) for _ in lot_slots]
+    parking_system = ParkingSystem(
+        lot_entry_points, lot_slots, lot_sizes, thread_safe=True
+    )
+
+    occupied = {}
+    occupied_lock = threading.Lock()
+    errors = []
+
+    def hammer(thread_id):
+        thread_rng = random.Random(thread_id)
+        parked = []
+        try:
+            for i in range(1000):
+                if parked and (thread_rng.random() < 0.5 or len(parked) > 4):
+                    plate_number = parked.pop(thread_rng.randrange(len(parked)))
+                    with occupied_lock:
+                        # Forget the slot before it is released for others
+                        location = next(
+                            location
+                            for location, plate in occupied.items()
+                            if plate == plate_number
+                        )
+                        del occupied[location]
+                    parking_system.unpark(plate_number)
+                    continue
+
+                plate_number = f"T{thread_id}-{i}"
+                vehicle = Vehicle(plate_number, thread_rng.randint(0, 2))
+                try:
+                    location = parking_system.park(
+                        vehicle, thread_rng.randrange(lot_entry_points)
+                    )
+                except NoSlotAvailableError:
+                    continue
+                with occupied_lock:
+                    assert location not in occupied
+                    occupied[location] = plate_number
+                parked.append(plate_number)
+        except Exception as err:
+            errors.append(err)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=hammer, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert not errors
+    taken = {slot.location for slot in parking_system.get_slots() if not slot.is_vacant}
+    assert taken == set(occupied)
+
+
+def test_custom_tariff():
+    tariff = Tariff(
+        flat_rate=50,
+        flat_hours=2,
+        daily_rate=3000,
+        hour_rates={Size.SMALL: 10, Size.MEDIUM: 30, Size.LARGE: 70},
+    )
+    parking_system = ParkingSystem(entry_points, slots, sizes, tariff=tariff)
+    assert parking_system.get_tariff() == tariff
+
+    parking_logs = [
+        ParkingLog(
+            time_parked=0,
+            time_unparked=ParkingSystem.HOURS_IN_SEC * 1.5,
+            slot_location=(1, 2, 3),
+            charge=50,
+        ),
+        ParkingLog(
+            time_parked=ParkingSystem.HOURS_IN_SEC * 2,
+            time_unparked=ParkingSystem.HOURS_IN_SEC * 6,
+            slot_location=(2, 3, 5),
+        ),
+    ]
+
+    # hours_consumed (ceiled) = 6
+    # 50 + (4 * 70) - 50 = 280
+    assert parking_system._get_charge(parking_logs) == 280
+
+    parking_logs[1].time_unparked = ParkingSystem.HOURS_IN_SEC * 26.5
+    # days = 1, hour_rate = 70/hr
+    # 3000 + (3 * 70) - 50 = 3160
+    assert parking_system._get_charge(parking_logs) == 3160
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"flat_rate": -1},
+        {"flat_hours": 24},
+        {"daily_rate": 1.5},
+        {"hour_rates": [20, 60]},
+        {"hour_rate": [20, 60, 100]},
+        {"flat_rate": True},
+        {"hour_rates": [20, False, 100]},
+        [("flat_rate", 50)],
+        "cheap",
+    ],
+)
+def test_invalid_tariff(data):
+    with pytest.raises(InvalidTariffError):
+        Tariff.from_dict(data)
+
+
+@pytest.mark.parametrize("slot_store", [None, ArraySlotStore])
+def test_move_slots(slot_store):
+    parking_system = ParkingSystem(entry_points, slots, sizes, slot_store=slot_store)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+
+    # Slot 1 moves nearer to entry point 0 than slot 2
+    parking_system.add_entry_points(entry_points, {1: (0, 9, 9)})
+    assert parking_system.get_slot((0, 9, 9)).id == 1
+    assert parking_system.get_slot((2, 3, 5)) is None
+    assert parking_system.park(Vehicle("DEF-456", Size.SMALL), 0) == (0, 9, 9)
+
+    # Parked vehicle follows its slot
+    parking_system.add_entry_points(entry_points, {2: (5, 5, 5)})
+    assert parking_system.get_vehicle("ABC-123").parking_logs[-1].slot_location == (
+        5,
+        5,
+        5,
+    )
+    parking_system.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC)
+    assert parking_system.get_slot((5, 5, 5)).is_vacant
+
+
+@pytest.mark.parametrize("slot_store", [None, ArraySlotStore])
+def test_add_entry_points(slot_store):
+    parking_system = ParkingSystem(entry_points, slots, sizes, slot_store=slot_store)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+
+    updates = {0: (1, 2, 3, 7), 1: (2, 3, 5, 0), 2: (0, 1, 4, 1)}
+    parking_system.add_entry_points(4, updates)
+    assert parking_system.get_entry_points() == 4
+    assert parking_system.park(Vehicle("DEF-456", Size.SMALL), 3) == (2, 3, 5, 0)
+    assert parking_system.get_vehicle("ABC-123").parking_logs[-1].slot_location == (
+        0,
+        1,
+        4,
+        1,
+    )
+    assert parking_system.count_vacant(entry_point=3) == 0
+    assert parking_system.count_vacant(entry_point=0) == 1
+    # The moved slot is back in its new zone
+    parking_system.unpark("DEF-456")
+    assert parking_system.count_vacant(entry_point=3) == 1
+
+
+@pytest.mark.parametrize(
+    "entry_points_count, updates, error",
+    [
+        (2, {}, InvalidEntryPointError),
+        (3, {3: (1, 1, 1)}, SlotNotExistsError),
+        (3, {0: (1, 1)}, InvalidEntryPointError),
+        (3, {0: (1, 1, float("nan"))}, InvalidEntryPointError),
+        (3, {0: (2, 3, 5)}, InvalidEntryPointError),
+        (4, {0: (1, 2, 3, 4)}, InvalidEntryPointError),
+    ],
+)
+def test_invalid_slot_updates(entry_points_count, updates, error):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    with pytest.raises(error):
+        parking_system.add_entry_points(entry_points_count, updates)
+    assert (
+        parking_system.get_slots()
+        == ParkingSystem(entry_points, slots, sizes).get_slots()
+    )
+
+
+def test_hold():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    hold = parking_system.hold(Size.SMALL, 0, 15 * 60, 0)
+    assert hold.slot_location == (0, 1, 4)
+    assert not parking_system.get_slot((0, 1, 4)).is_vacant
+    assert parking_system.count_vacant() == 2
+
+    # Other vehicles skip the held slot
+    location = parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 60)
+    assert location == (1, 2, 3)
+
+    location = parking_system.park_hold(Vehicle("DEF-456", Size.SMALL), hold.id, 120)
+    assert location == (0, 1, 4)
+    assert parking_system.get_hold(hold.id) is None
+    with pytest.raises(HoldNotExistsError):
+        parking_system.park_hold(Vehicle("GHI-789", Size.SMALL), hold.id, 120)
+
+    # Charged from the time parked, not the time held
+    charge = parking_system.unpark("DEF-456", 120 + ParkingSystem.HOURS_IN_SEC)
+    assert charge == 40
+
+
+def test_hold_expires():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    hold = parking_system.hold(Size.SMALL, 0, 60, 0)
+    parking_system.hold(Size.SMALL, 0, 120, 0)
+    assert parking_system.count_vacant() == 1
+
+    assert parking_system.expire_holds(60) == 1
+    assert parking_system.get_hold(hold.id) is None
+    assert parking_system.count_vacant() == 2
+
+    # Parking past the expiry of a hold releases its slot first
+    location = parking_system.park(Vehicle("ABC-123", Size.LARGE), 0, 120)
+    assert location == (2, 3, 5)
+    location = parking_system.park(Vehicle("DEF-456", Size.SMALL), 0, 120)
+    assert location == (0, 1, 4)
+
+
+def test_unpark_expires_holds():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.hold(Size.SMALL, 0, 60, 0)
+    assert not parking_system.holds_expired(59)
+    assert parking_system.holds_expired(60)
+
+    # Both the slot of the vehicle and the one of the expired hold are vacant
+    parking_system.unpark("ABC-123", 120)
+    assert parking_system.get_holds() == []
+    assert parking_system.count_vacant() == 3
+    assert not parking_system.holds_expired(120)
+
+
+def test_cancel_hold():
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    hold = parking_system.hold(Size.LARGE, 0, 60, 0)
+    with pytest.raises(NoSlotAvailableError):
+        parking_system.hold(Size.LARGE, 0, 60, 0)
+    with pytest.raises(InvalidSizeError):
+        parking_system.park_hold(Vehicle("ABC-123", 3), hold.id, 0)
+
+    parking_system.cancel_hold(hold.id)
+    assert parking_system.get_slot((2, 3, 5)).is_vacant
+    with pytest.raises(HoldNotExistsError):
+        parking_system.cancel_hold(hold.id)
+    assert parking_system.park(Vehicle("ABC-123", Size.LARGE), 0, 0) == (2, 3, 5)
+
+
+@pytest.mark.parametrize(
+    "size, entry_point, duration, error",
+    [
+        (3, 0, 60, InvalidSizeError),
+        (Size.SMALL, 3, 60, InvalidEntryPointError),
+        (Size.SMALL, 0, 0, InvalidHoldError),
+        (Size.SMALL, 0, float("inf"), InvalidHoldError),
+        (Size.SMALL, 0, "60", InvalidHoldError),
+    ],
+)
+def test_invalid_hold(size, entry_point, duration, error):
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+    with pytest.raises(error):
+        parking_system.hold(size, entry_point, duration, 0)
+
+
+def _random_sessions(parking_system, rng, plates=20, steps=2000):
+    # Charges of park/unpark in time order, with returns within and past the
+    # continuous rate window
+    charges = []
+    now = 0.0
+    for _ in range(steps):
+        now += rng.uniform(0, 20 * 60)
+        plate_number = f"P{rng.randrange(plates)}"
+        vehicle = parking_system.get_vehicle(plate_number)
+        try:
+            if vehicle is not None and vehicle.is_parked:
+                charges.append(parking_system.unpark(plate_number, now))
+            else:
+                parking_system.park(Vehicle(plate_number, Size.SMALL), 0, now)
+        except NoSlotAvailableError:
+            charges.append(None)
+    return charges
+
+
+def test_evict_idle_billing():
+    lot = [(i, i + 1, i + 2) for i in range(10)]
+    kept = ParkingSystem(entry_points, lot, [1] * len(lot))
+    evicting = ParkingSystem(entry_points, lot, [1] * len(lot), evict_idle=True)
+
+    charges = _random_sessions(evicting, random.Random(3))
+    assert charges == _random_sessions(kept, random.Random(3))
+    assert len(evicting.get_vehicles()) < len(kept.get_vehicles())
+
+
+def test_evict_idle_bounded():
+    # One vehicle an hour in and out of a slot, its plate never seen again
+    evicted = []
+    parking_system = ParkingSystem(
+        entry_points, slots, sizes, evict_idle=True, evict_sink=evicted.append
+    )
+    hour = ParkingSystem.HOURS_IN_SEC
+    for i in range(1000):
+        parking_system.park(Vehicle(f"P{i}", Size.SMALL), 0, i * hour)
+        parking_system.unpark(f"P{i}", i * hour + hour / 2)
+        assert len(parking_system.get_vehicles()) <= 3
+    assert [vehicle.plate_number for vehicle in evicted[:2]] == ["P0", "P1"]
+    assert len(evicted) == 1000 - len(parking_system.get_vehicles())
+
+
+def test_sweep_idle():
+    parking_system = ParkingSystem(entry_points, slots, sizes, evict_idle=True)
+    hour = ParkingSystem.HOURS_IN_SEC
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    parking_system.unpark("ABC-123", hour)
+    parking_system.park(Vehicle("XYZ-789", Size.SMALL), 0, 0)
+    parking_system.unpark("XYZ-789", 2 * hour)
+    # Back within the window, its earlier unpark is not evicted
+    parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 1.5 * hour)
+    parking_system.unpark("ABC-123", 1.75 * hour)
+
+    assert parking_system.sweep_idle(2.5 * hour) == 0
+    restored = ParkingSystem.from_snapshot(parking_system.snapshot(), evict_idle=True)
+    assert restored.sweep_idle(2.75 * hour) == 1
+    assert restored.get_vehicle("ABC-123") is None
+    assert restored.sweep_idle(3 * hour) == 1
+    assert restored.get_vehicles() == []
+    assert ParkingSystem(entry_points, slots, sizes).sweep_idle() == 0
+
+
+def test_iter_vehicles_evicted():
+    lot = [(i, i + 1, i + 2) for i in range(200)]
+    parking_system = ParkingSystem(entry_points, lot, [1] * len(lot), evict_idle=True)
+    hour = ParkingSystem.HOURS_IN_SEC
+    for i in range(150):
+        parking_system.park(Vehicle(f"P{i}", Size.SMALL), 0, 0)
+        if i < 100:
+            parking_system.unpark(f"P{i}", 0)
+
+    vehicles = parking_system.iter_vehicles()
+    assert [vehicle.plate_number for vehicle in itertools.islice(vehicles, 3)] == [
+        "P0",
+        "P1",
+        "P2",
+    ]
+    cursor = vehicles.position
+
+    # Evicting the vehicles listed so far, which compacts the listing order,
+    # does not shift the cursor
+    assert parking_system.sweep_idle(2 * hour) == 100
+    assert len(parking_system._vehicle_order[0]) < 150
+    page = parking_system.iter_vehicles(cursor)
+    assert next(page).plate_number == "P100"
+    assert [vehicle.plate_number for vehicle in vehicles][:2] == ["P100", "P101"]
+
+    # Vehicles come back at the end
+    parking_system.park(Vehicle("P0", Size.SMALL), 0, 3 * hour)
+    assert [vehicle.plate_number for vehicle in page][-2:] == ["P149", "P0"]
+    assert page.position == 151
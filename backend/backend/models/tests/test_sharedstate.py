@@ -0,0 +1,182 @@
+import multiprocessing
+import uuid
+
+import pytest
+
+from backend.models.allocation import BEST_FIT, NEAREST, ZONE_BALANCE
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import (
+    InvalidPlateNumberError,
+    NoSlotAvailableError,
+    UnsupportedOperationError,
+    VehicleCapacityError,
+)
+from backend.models.sharedstate import SharedParkingSystem
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+@pytest.fixture()
+def name():
+    name = f"parking-test-{uuid.uuid4().hex[:12]}"
+    yield name
+    parking_system = SharedParkingSystem.attach(name)
+    if parking_system is not None:
+        parking_system.close()
+        parking_system.unlink()
+
+
+def test_shared_between_systems(name):
+    first = SharedParkingSystem.create(name, entry_points, slots, sizes)
+    second = SharedParkingSystem.attach(name)
+    try:
+        assert first.park(Vehicle("ABC-123", Size.SMALL), 0, 0) == (0, 1, 4)
+        assert second.get_vehicle("ABC-123").is_parked
+        assert second.count_vacant(Size.SMALL) == 2
+
+        # The second system drops the slot taken by the first one
+        assert second.park(Vehicle("XYZ-123", Size.SMALL), 0, 0) == (1, 2, 3)
+        assert second.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC) == 40
+        # And the first one picks up the slot released by the second one
+        assert first.get_nearest_slot(Size.SMALL, 0).location == (0, 1, 4)
+
+        # Continuous rate across systems
+        assert first.park(Vehicle("ABC-123", Size.SMALL), 0, 3600) == (0, 1, 4)
+        assert second.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC * 5) == 120
+        assert [vehicle.plate_number for vehicle in first.iter_vehicles()] == [
+            "ABC-123",
+            "XYZ-123",
+        ]
+    finally:
+        second.close()
+        first.close()
+
+
+def test_create_twice(name):
+    parking_system = SharedParkingSystem.create(name, entry_points, slots, sizes)
+    try:
+        with pytest.raises(FileExistsError):
+            SharedParkingSystem.create(name, entry_points, slots, sizes)
+    finally:
+        parking_system.close()
+    assert SharedParkingSystem.attach(f"{name}-missing") is None
+
+
+def test_strategies(name):
+    parking_system = SharedParkingSystem.create(name, entry_points, slots, sizes)
+    try:
+        parking_system.set_strategy(BEST_FIT)
+        assert parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0) == (1, 2, 3)
+        # Its zone heaps would miss the parks of other processes
+        with pytest.raises(ValueError):
+            parking_system.set_strategy(ZONE_BALANCE)
+        assert parking_system.get_strategy() == NEAREST
+    finally:
+        parking_system.close()
+
+
+def test_unsupported(name):
+    parking_system = SharedParkingSystem.create(name, entry_points, slots, sizes)
+    try:
+        with pytest.raises(UnsupportedOperationError):
+            parking_system.hold(Size.SMALL, 0, 60, 0)
+        with pytest.raises(UnsupportedOperationError):
+            parking_system.add_entry_points(entry_points, {0: (9, 9, 9)})
+        assert parking_system.get_slot((1, 2, 3)) is not None
+    finally:
+        parking_system.close()
+
+
+def test_snapshot(name):
+    parking_system = SharedParkingSystem.create(name, entry_points, slots, sizes)
+    try:
+        parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+        parking_system.park(Vehicle("XYZ-123", Size.LARGE), 0, 0)
+        parking_system.unpark("XYZ-123", ParkingSystem.HOURS_IN_SEC)
+
+        # A copy of the lot, which loads as a private one
+        copy = ParkingSystem.from_snapshot(parking_system.snapshot())
+        assert [slot.is_vacant for slot in copy.get_slots()] == [True, True, False]
+        assert copy.get_vehicle("ABC-123").is_parked
+        assert copy.unpark("ABC-123", ParkingSystem.HOURS_IN_SEC) == 40
+        assert copy.park(Vehicle("XYZ-123", Size.LARGE), 0, 7200) == (2, 3, 5)
+    finally:
+        parking_system.close()
+
+
+def test_release_ring_overflow(name):
+    first = SharedParkingSystem.create(
+        name, entry_points, slots, sizes, release_ring_size=2
+    )
+    second = SharedParkingSystem.attach(name)
+    try:
+        for i in range(3):
+            first.park(Vehicle(f"ABC-{i}", Size.SMALL), 0, 0)
+        with pytest.raises(NoSlotAvailableError):
+            second.park(Vehicle("XYZ-123", Size.SMALL), 0, 0)
+        for i in range(3):
+            first.unpark(f"ABC-{i}", 0)
+
+        # Fell behind by more releases than the ring holds
+        assert second.park(Vehicle("XYZ-123", Size.SMALL), 0, 0) == (0, 1, 4)
+    finally:
+        second.close()
+        first.close()
+
+
+def test_vehicle_limits(name, monkeypatch):
+    monkeypatch.setattr("backend.models.sharedstate.VEHICLE_HEADROOM", 0)
+    parking_system = SharedParkingSystem.create(
+        name, entry_points, slots, sizes, vehicle_capacity=1
+    )
+    try:
+        with pytest.raises(InvalidPlateNumberError):
+            parking_system.park(Vehicle("A" * 33, Size.SMALL), 0, 0)
+        parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+        with pytest.raises(VehicleCapacityError):
+            parking_system.park(Vehicle("XYZ-123", Size.SMALL), 0, 0)
+        # No slot was claimed for it
+        assert parking_system.count_vacant(Size.SMALL) == 2
+    finally:
+        parking_system.close()
+
+
+def _park_from_process(name, worker, vehicles, results):
+    parking_system = SharedParkingSystem.attach(name)
+    for i in range(vehicles):
+        try:
+            location = parking_system.park(
+                Vehicle(f"W{worker}-{i}", Size.SMALL), i % 2, 0
+            )
+        except NoSlotAvailableError:
+            location = None
+        results.put(location)
+    parking_system.close()
+
+
+def test_processes_no_double_booking(name):
+    lot_slots = [(i, 200 - i) for i in range(200)]
+    parking_system = SharedParkingSystem.create(name, 2, lot_slots, [0] * 200)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=_park_from_process, args=(name, worker, 60, results))
+        for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    locations = [results.get(timeout=30) for _ in range(4 * 60)]
+    for process in processes:
+        process.join()
+
+    try:
+        parked = [location for location in locations if location is not None]
+        assert len(parked) == 200
+        assert len(set(parked)) == 200
+        assert parking_system.count_vacant() == 0
+        assert len(parking_system.get_vehicles()) == 200
+    finally:
+        parking_system.close()
@@ -0,0 +1,105 @@
+import csv
+import json
+
+import pytest
+
+from backend.models.parking import ParkingSystem
+from backend.models.simulation import (
+    TRACE_COLUMNS,
+    TraceEvent,
+    read_columns,
+    read_csv,
+    run,
+    run_many,
+    simulate,
+    write_columns,
+)
+
+HOUR = ParkingSystem.HOURS_IN_SEC
+
+lot = {
+    "entry_points": 3,
+    "slots": [[1, 2, 3], [2, 3, 5], [0, 1, 4]],
+    "sizes": [0, 2, 1],
+}
+trace = [
+    TraceEvent(0, "park", "ABC-123", 0, 0),
+    TraceEvent(0.5 * HOUR, "park", "DEF-456", 2, 0),
+    TraceEvent(HOUR, "park", "GHI-789", 0, 1),
+    TraceEvent(1.5 * HOUR, "park", "JKL-012", 0, 2),
+    TraceEvent(2 * HOUR, "unpark", "ABC-123", 0, 0),
+    TraceEvent(2.5 * HOUR, "unpark", "JKL-012", 0, 0),
+    TraceEvent(3 * HOUR, "unpark", "DEF-456", 0, 0),
+]
+
+
+def _write_csv(path, events):
+    with open(path, "w", newline="") as trace_file:
+        writer = csv.writer(trace_file)
+        writer.writerow(TRACE_COLUMNS)
+        for event in events:
+            operation = event.operation
+            size, entry_point = (event.size, event.entry_point)
+            if operation == "unpark":
+                size = entry_point = ""
+            writer.writerow(
+                [event.time, operation, event.plate_number, size, entry_point]
+            )
+
+
+@pytest.fixture()
+def paths(tmp_path):
+    trace_path = str(tmp_path / "trace.csv")
+    _write_csv(trace_path, trace)
+    lot_path = str(tmp_path / "lot.json")
+    with open(lot_path, "w") as lot_file:
+        json.dump(lot, lot_file)
+    return trace_path, lot_path
+
+
+def test_simulate():
+    parking_system = ParkingSystem(
+        lot["entry_points"], [tuple(slot) for slot in lot["slots"]], lot["sizes"]
+    )
+    report = simulate(parking_system, iter(trace), interval=HOUR)
+
+    assert report.slots == 3
+    assert report.events == 7
+    assert report.parks == 4
+    # Lot is full when JKL-012 arrives, so it never leaves either
+    assert report.rejected == 1
+    assert report.rejection_rate == 0.25
+    assert report.skipped == 1
+    # Flat rate for each of the two vehicles that parked and left
+    assert report.revenue == 80
+    assert report.peak_occupied == 3
+    # Sampled before the events at the same time
+    assert report.occupancy == [(0, 0), (HOUR, 2), (2 * HOUR, 3), (3 * HOUR, 2)]
+
+
+def test_read_csv(paths):
+    trace_path, _ = paths
+    assert list(read_csv(trace_path)) == trace
+
+
+def test_read_columns(tmp_path, paths):
+    pytest.importorskip("numpy")
+    columns_path = str(tmp_path / "trace")
+    write_columns(columns_path, read_csv(paths[0]))
+    assert list(read_columns(columns_path)) == trace
+
+    _, lot_path = paths
+    assert run(columns_path, lot_path, HOUR).revenue == 80
+
+
+def test_run_many(tmp_path, paths):
+    trace_path, lot_path = paths
+    # Same layout, twice the tariff
+    expensive_lot_path = str(tmp_path / "expensive.json")
+    with open(expensive_lot_path, "w") as lot_file:
+        json.dump(dict(lot, tariff={"flat_rate": 80}), lot_file)
+
+    reports = run_many(trace_path, [lot_path, expensive_lot_path], HOUR, workers=2)
+    assert [report.lot for report in reports] == [lot_path, expensive_lot_path]
+    assert [report.revenue for report in reports] == [80, 160]
+    assert reports[0].occupancy == reports[1].occupancy
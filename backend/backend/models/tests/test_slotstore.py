@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from backend.models.parking import ParkingSystem, Size, Slot, Vehicle
+from backend.models.parkingerrs import InvalidSizeError, NoSlotAvailableError
+from backend.models.slotstore import ArraySlotStore, location_hash
+
+entry_points = 3
+slots = [(1, 2, 3), (2, 3, 5), (0, 1, 4)]
+sizes = [0, 2, 1]
+
+
+def test_get_slots():
+    parking_system = ParkingSystem(
+        entry_points, slots, sizes, slot_store=ArraySlotStore
+    )
+
+    assert parking_system.get_slots() == [
+        Slot((1, 2, 3), 0, id=0),
+        Slot((2, 3, 5), 2, id=1),
+        Slot((0, 1, 4), 1, id=2),
+    ]
+    slot = parking_system.get_slot((2, 3, 5))
+    assert slot.location == (2, 3, 5)
+    assert slot.size == Size.LARGE
+    assert slot.is_vacant
+    assert parking_system.get_slot((9, 9, 9)) is None
+
+
+def test_vacancy():
+    parking_system = ParkingSystem(
+        entry_points, slots, sizes, slot_store=ArraySlotStore
+    )
+
+    location = parking_system.park(Vehicle("ABC-123", Size.SMALL), 0, 0)
+    assert location == (0, 1, 4)
+    assert not parking_system.get_slot(location).is_vacant
+    assert [slot.is_vacant for slot in parking_system.get_slots()] == [
+        True,
+        True,
+        False,
+    ]
+
+    parking_system.unpark("ABC-123", 10)
+    assert parking_system.get_slot(location).is_vacant
+
+
+def test_duplicate_and_float_locations():
+    store = ArraySlotStore(2, [(1.5, 2), (0, 1), (1.5, 2)], [0, 1, 2])
+
+    assert len(store) == 2
+    assert list(store) == [0, 1]
+    assert store[store.slot_ids[(1.5, 2)]].size == 2
+    assert store[1].location == (0, 1)
+    assert store.slot_ids[(0.0, 1.0)] == 1
+    assert store.slot_ids.get(("0", 1)) is None
+
+
+def test_location_hash_is_stable():
+    # Tables are shared and written to layout files, so the hash must not
+    # depend on the interpreter
+    assert location_hash((1, 2, 3)) == 1529210916
+    assert location_hash((1.0, 2.0, 3.0)) == location_hash((1, 2, 3))
+
+
+def test_invalid_size():
+    with pytest.raises(InvalidSizeError):
+        ParkingSystem(entry_points, slots, [0, 3, 1], slot_store=ArraySlotStore)
+
+
+def test_matches_dict_store():
+    rng = random.Random(4)
+    lot_entry_points = 4
+    lot_slots = [
+        tuple(rng.randint(0, 5) for _ in range(lot_entry_points)) for _ in range(60)
+    ]
+    lot_sizes = [rng.randint(0, 2) for _ in lot_slots]
+    parking_system = ParkingSystem(lot_entry_points, lot_slots, lot_sizes)
+    array_system = ParkingSystem(
+        lot_entry_points, lot_slots, lot_sizes, slot_store=ArraySlotStore
+    )
+
+    parked = []
+    for i in range(500):
+        if parked and rng.random() < 0.4:
+            plate_number = parked.pop(rng.randrange(len(parked)))
+            assert array_system.unpark(plate_number, i) == parking_system.unpark(
+                plate_number, i
+            )
+            continue
+
+        plate_number = f"PLT-{i}"
+        size = rng.randint(0, 2)
+        entry_point = rng.randrange(lot_entry_points)
+        try:
+            location = parking_system.park(Vehicle(plate_number, size), entry_point, i)
+        except NoSlotAvailableError:
+            with pytest.raises(NoSlotAvailableError):
+                array_system.park(Vehicle(plate_number, size), entry_point, i)
+            continue
+        assert array_system.park(Vehicle(plate_number, size), entry_point, i) == (
+            location
+        )
+        parked.append(plate_number)
+
+    assert array_system.get_slots() == parking_system.get_slots()
@@ -0,0 +1,44 @@
+# Runs the model and route benchmarks over a grid of lot sizes and entry
+# points, and writes the results as JSON to compare across commits.
+#
+#   python -m benchmarks --slots 1000,100000,1000000 --entry-points 2,50 \
+#       --output results.json
+import argparse
+
+from . import bench_model, bench_routes
+from .common import emit, environment
+
+
+def _ints(value: str):
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=_ints, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--entry-points", type=_ints, default=[2, 10, 50])
+    parser.add_argument("--arrivals", type=int, default=20_000)
+    parser.add_argument("--route-arrivals", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-routes", action="store_true")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = []
+    for slots in args.slots:
+        for entry_points in args.entry_points:
+            results.append(
+                bench_model.run(slots, entry_points, args.arrivals, args.seed)
+            )
+            if not args.skip_routes:
+                results.append(
+                    bench_routes.run(
+                        slots, entry_points, args.route_arrivals, args.seed
+                    )
+                )
+
+    emit(dict(environment=environment(), results=results), args.output)
+
+
+if __name__ == "__main__":
+    main()
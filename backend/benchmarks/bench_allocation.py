@@ -0,0 +1,93 @@
+# Rejection rate and park latency of each allocation strategy, replaying the
+# same synthetic gate trace against the same lot
+#
+#   python -m benchmarks.bench_allocation --slots 10000 --entry-points 10 \
+#       --occupancy 0.95
+import argparse
+import time
+
+from backend.models.allocation import STRATEGIES
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import NoSlotAvailableError
+
+from .common import emit, environment, generate_lot, generate_trace, summarize
+
+
+def run_strategy(lot, events, strategy: str) -> dict:
+    parking_system = ParkingSystem(
+        lot.entry_points, lot.slots, lot.sizes, strategy=strategy, evict_idle=True
+    )
+    park = parking_system.park
+    unpark = parking_system.unpark
+
+    park_latencies = []
+    parks = [0] * len(Size)
+    rejected = [0] * len(Size)
+    parked = set()
+    for event in events:
+        if event.operation == "park":
+            parks[event.size] += 1
+            start = time.perf_counter()
+            try:
+                park(
+                    Vehicle(event.plate_number, event.size),
+                    event.entry_point,
+                    event.time,
+                )
+            except NoSlotAvailableError:
+                rejected[event.size] += 1
+            else:
+                parked.add(event.plate_number)
+            park_latencies.append(time.perf_counter() - start)
+        elif event.plate_number in parked:
+            parked.remove(event.plate_number)
+            unpark(event.plate_number, event.time)
+
+    return dict(
+        strategy=strategy,
+        parks=sum(parks),
+        rejection_rate=sum(rejected) / max(sum(parks), 1),
+        rejection_rate_by_size={
+            size.name: rejected[size] / max(parks[size], 1) for size in Size
+        },
+        park=summarize(park_latencies),
+    )
+
+
+def run(
+    slots: int,
+    entry_points: int,
+    arrivals: int,
+    occupancy: float = 0.95,
+    seed: int = 0,
+) -> dict:
+    lot = generate_lot(slots, entry_points, seed)
+    events = list(generate_trace(lot, arrivals, seed, occupancy=occupancy))
+    return dict(
+        benchmark="allocation",
+        slots=slots,
+        entry_points=entry_points,
+        arrivals=arrivals,
+        occupancy=occupancy,
+        strategies=[run_strategy(lot, events, strategy) for strategy in STRATEGIES],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--arrivals", type=int, default=100_000)
+    parser.add_argument("--occupancy", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = run(
+        args.slots, args.entry_points, args.arrivals, args.occupancy, args.seed
+    )
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
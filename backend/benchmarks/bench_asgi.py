@@ -0,0 +1,171 @@
+# Load test of the ASGI app against the WSGI app of create_app(). Gate
+# connections replay a synthetic trace, each one owning a share of the plate
+# numbers, while signage connections poll /parking/availability and now and
+# then list the slots. The ASGI app serves every connection from one event
+# loop; the WSGI app gets one thread per connection, as a threaded server
+# would. Both run in process, so HTTP parsing and sockets are left out.
+#
+#   python -m benchmarks.bench_asgi --slots 10000 --connections 200
+import argparse
+import asyncio
+import importlib
+import json
+import threading
+import time
+import zlib
+
+from backend import create_app
+from backend.asgi import create_asgi_app
+
+from .bench_routes import _time_args
+from .common import emit, environment, generate_lot, generate_trace, summarize
+
+parking_controller = importlib.import_module("backend.controllers.parking")
+
+
+def _workload(slots: int, entry_points: int, arrivals: int, connections: int, seed):
+    # Requests of every connection as (method, path, body, query string)
+    lot = generate_lot(slots, entry_points, seed)
+    init = (
+        "POST",
+        "/parking/init",
+        dict(entry_points=entry_points, slots=lot.slots, sizes=lot.sizes),
+        "",
+    )
+
+    gates = max(connections // 2, 1)
+    gate_requests = [[] for _ in range(gates)]
+    for event in generate_trace(lot, arrivals, seed):
+        # Same shares on every run, unlike the salted hash() of str
+        requests = gate_requests[zlib.crc32(event.plate_number.encode()) % gates]
+        if event.operation == "park":
+            body = dict(
+                plate_number=event.plate_number,
+                size=event.size,
+                entry_point=event.entry_point,
+                time_parked=_time_args(event.time),
+            )
+            requests.append(("POST", "/parking/park", body, ""))
+        else:
+            body = dict(
+                plate_number=event.plate_number,
+                time_unparked=_time_args(event.time),
+            )
+            requests.append(("POST", "/parking/unpark", body, ""))
+
+    # As many requests per signage connection as per gate
+    per_connection = max(arrivals * 2 // gates, 1)
+    signage_requests = []
+    for connection in range(connections - gates):
+        requests = []
+        for i in range(per_connection):
+            if i % 50 == 49:
+                requests.append(("GET", "/parking/slots", None, "limit=100"))
+            else:
+                entry_point = (connection + i) % entry_points
+                query = f"size={i % 3}&entry_point={entry_point}"
+                requests.append(("GET", "/parking/availability", None, query))
+        signage_requests.append(requests)
+    return init, gate_requests + signage_requests
+
+
+async def _asgi_request(app, method, path, body, query):
+    request_body = b"" if body is None else json.dumps(body).encode()
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": request_body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = dict(type="http", method=method, path=path, query_string=query.encode())
+    await app(scope, receive, send)
+    return status
+
+
+def run_asgi(init, connections):
+    latencies = []
+
+    async def connection(app, requests):
+        for request in requests:
+            start = time.perf_counter()
+            await _asgi_request(app, *request)
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        app = create_asgi_app()
+        assert await _asgi_request(app, *init) == 201
+        start = time.perf_counter()
+        await asyncio.gather(*(connection(app, requests) for requests in connections))
+        elapsed = time.perf_counter() - start
+        await app.close()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    return dict(server="asgi", **summarize(latencies, elapsed))
+
+
+def run_wsgi(init, connections):
+    parking_controller.parking_system = None
+    app = create_app()
+    method, path, body, _ = init
+    assert app.test_client().open(path, method=method, json=body).status_code == 201
+
+    latencies = []
+    barrier = threading.Barrier(len(connections) + 1)
+
+    def connection(requests):
+        client = app.test_client()
+        barrier.wait()
+        for method, path, body, query in requests:
+            start = time.perf_counter()
+            client.open(path, method=method, json=body, query_string=query)
+            latencies.append(time.perf_counter() - start)
+
+    threads = [
+        threading.Thread(target=connection, args=(requests,))
+        for requests in connections
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    parking_controller.parking_system = None
+    return dict(server="wsgi", **summarize(latencies, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--arrivals", type=int, default=5_000)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    init, connections = _workload(
+        args.slots, args.entry_points, args.arrivals, args.connections, args.seed
+    )
+    results = []
+    for run in (run_asgi, run_wsgi):
+        result = run(init, connections)
+        result.update(
+            benchmark="asgi",
+            slots=args.slots,
+            entry_points=args.entry_points,
+            connections=args.connections,
+        )
+        results.append(result)
+    emit(dict(environment=environment(), results=results), args.output)
+
+
+if __name__ == "__main__":
+    main()
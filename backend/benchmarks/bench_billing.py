@@ -0,0 +1,85 @@
+# Throughput of re-billing parking log chains with the scalar
+# ParkingSystem._get_charge path and with the NumPy bulk engine.
+#
+#   python -m benchmarks.bench_billing --chains 100000
+import argparse
+import time
+
+import numpy as np
+
+from backend.models.billing import bulk_charges
+from backend.models.parking import ParkingLog, ParkingSystem, Size
+
+from .common import emit, environment
+
+
+def generate_chains(chains: int, seed: int):
+    rng = np.random.default_rng(seed)
+    chain_lengths = rng.integers(1, 6, size=chains)
+    chain_ids = np.repeat(np.arange(chains), chain_lengths)
+    logs_len = len(chain_ids)
+
+    # Continuous rate chains: gaps below an hour between logs of a chain
+    durations = rng.exponential(8, size=logs_len) * ParkingSystem.HOURS_IN_SEC
+    gaps = rng.uniform(0, 0.99, size=logs_len) * ParkingSystem.HOURS_IN_SEC
+    time_unparked = np.cumsum(durations + gaps)
+    time_parked = time_unparked - durations
+    sizes = rng.integers(0, len(Size), size=logs_len)
+    return time_parked, time_unparked, sizes, chain_ids
+
+
+def scalar_charges(time_parked, time_unparked, sizes, chain_ids):
+    # One slot per size, addressed by the size itself
+    parking_system = ParkingSystem(1, [(size,) for size in Size], list(Size))
+    charges = []
+    logs = []
+    for i in range(len(chain_ids)):
+        if i and chain_ids[i] != chain_ids[i - 1]:
+            logs = []
+        logs.append(
+            ParkingLog(
+                slot_location=(sizes[i],),
+                time_parked=time_parked[i],
+                time_unparked=time_unparked[i],
+            )
+        )
+        logs[-1].charge = parking_system._get_charge(logs)
+        charges.append(logs[-1].charge)
+    return charges
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chains", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    columns = generate_chains(args.chains, args.seed)
+    # Plain Python values for the scalar path, as stored in ParkingLog
+    scalar_columns = [column.tolist() for column in columns]
+
+    start = time.perf_counter()
+    expected = scalar_charges(*scalar_columns)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    charges = bulk_charges(*columns)
+    bulk_time = time.perf_counter() - start
+
+    assert charges.tolist() == expected
+
+    result = dict(
+        benchmark="billing",
+        chains=args.chains,
+        logs=len(expected),
+        scalar_seconds=scalar_time,
+        scalar_chains_per_sec=args.chains / scalar_time,
+        bulk_seconds=bulk_time,
+        bulk_chains_per_sec=args.chains / bulk_time,
+    )
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
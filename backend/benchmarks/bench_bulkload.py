@@ -0,0 +1,108 @@
+# Startup time of a lot: the ParkingSystem constructor over lists, with the
+# dict and the array slot stores, against load_parking_system over NumPy
+# arrays and load_layout over a layout file, and /parking/init with a JSON
+# body against an .npz body.
+#
+#   python -m benchmarks.bench_bulkload --slots 100000,1000000 --entry-points 10
+import argparse
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from backend import create_app
+from backend.models.bulkload import load_parking_system
+from backend.models.layout import load_layout, write_layout
+from backend.models.parking import ParkingSystem
+from backend.models.slotstore import ArraySlotStore
+
+from .common import emit, environment, generate_lot
+
+parking_controller = importlib.import_module("backend.controllers.parking")
+
+
+def _ints(value: str):
+    return [int(item) for item in value.split(",")]
+
+
+def _elapsed(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _init(client, **kwargs) -> float:
+    # Seconds for /parking/init on a fresh parking system
+    parking_controller.parking_system = None
+    start = time.perf_counter()
+    response = client.post("/parking/init", **kwargs)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 201, response.data
+    parking_controller.parking_system = None
+    return elapsed
+
+
+def run(slots: int, entry_points: int, seed: int = 0):
+    lot = generate_lot(slots, entry_points, seed)
+    distances = np.array(lot.slots, dtype=np.int64)
+    sizes = np.array(lot.sizes, dtype=np.uint8)
+
+    json_body = json.dumps(
+        dict(entry_points=entry_points, slots=lot.slots, sizes=lot.sizes)
+    ).encode()
+    npz_body = io.BytesIO()
+    np.savez(npz_body, distances=distances, sizes=sizes)
+    npz_body = npz_body.getvalue()
+
+    with tempfile.TemporaryDirectory() as directory:
+        layout_path = os.path.join(directory, "lot.layout")
+        layout_write_sec = _elapsed(write_layout, layout_path, *lot)
+        layout_load_sec = _elapsed(load_layout, layout_path)
+
+    client = create_app().test_client()
+    return dict(
+        benchmark="bulkload",
+        slots=slots,
+        entry_points=entry_points,
+        json_bytes=len(json_body),
+        npz_bytes=len(npz_body),
+        constructor_sec=_elapsed(ParkingSystem, entry_points, lot.slots, lot.sizes),
+        constructor_array_sec=_elapsed(
+            ParkingSystem,
+            entry_points,
+            lot.slots,
+            lot.sizes,
+            slot_store=ArraySlotStore,
+        ),
+        bulk_load_sec=_elapsed(load_parking_system, distances, sizes),
+        layout_write_sec=layout_write_sec,
+        layout_load_sec=layout_load_sec,
+        init_json_sec=_init(client, data=json_body, content_type="application/json"),
+        init_npz_sec=_init(
+            client, data=npz_body, content_type="application/octet-stream"
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=_ints, default=[100_000, 1_000_000])
+    parser.add_argument("--entry-points", type=_ints, default=[10])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = [
+        run(slots, entry_points, args.seed)
+        for slots in args.slots
+        for entry_points in args.entry_points
+    ]
+    emit(dict(environment=environment(), results=results), args.output)
+
+
+if __name__ == "__main__":
+    main()
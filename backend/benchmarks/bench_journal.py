@@ -0,0 +1,59 @@
+# Park throughput with the write-ahead log under each fsync policy, and
+# without a journal.
+#
+#   python -m benchmarks.bench_journal --vehicles 20000
+import argparse
+import random
+import tempfile
+import time
+
+from backend.models.journal import FsyncPolicy, Journal
+from backend.models.parking import ParkingSystem, Size, Vehicle
+
+from .common import emit, environment
+
+
+def park_throughput(vehicles: int, seed: int, fsync_policy=None) -> float:
+    rng = random.Random(seed)
+    entry_points = 3
+    slots = [
+        tuple(rng.randint(0, 1000) for _ in range(entry_points))
+        for _ in range(vehicles)
+    ]
+    sizes = [rng.randrange(len(Size)) for _ in slots]
+    parking_system = ParkingSystem(entry_points, slots, sizes)
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = None
+        if fsync_policy is not None:
+            journal = Journal(directory, fsync_policy)
+            journal.attach(parking_system)
+
+        start = time.perf_counter()
+        for i in range(vehicles):
+            parking_system.park(Vehicle(f"PLT-{i}", Size.SMALL), i % entry_points, 0)
+        elapsed = time.perf_counter() - start
+
+        if journal is not None:
+            journal.close()
+    return vehicles / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = dict(benchmark="journal", vehicles=args.vehicles)
+    result["none_parks_per_sec"] = park_throughput(args.vehicles, args.seed)
+    for fsync_policy in FsyncPolicy:
+        result[f"{fsync_policy.value}_parks_per_sec"] = park_throughput(
+            args.vehicles, args.seed, fsync_policy
+        )
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Latency of ParkingSystem operations while replaying a synthetic gate trace
+#
+#   python -m benchmarks.bench_model --slots 10000 --entry-points 10
+import argparse
+import random
+import time
+
+from backend.models.parking import ParkingSystem, Size, Vehicle
+from backend.models.parkingerrs import ParkingError
+
+from .common import emit, environment, generate_lot, generate_trace, summarize, timed
+
+
+def run(slots: int, entry_points: int, arrivals: int, seed: int = 0, **options):
+    lot = generate_lot(slots, entry_points, seed)
+
+    start = time.perf_counter()
+    parking_system = ParkingSystem(*lot, **options)
+    build_seconds = time.perf_counter() - start
+
+    park_latencies = []
+    unpark_latencies = []
+    rejected = 0
+    parked = set()
+    for event in generate_trace(lot, arrivals, seed):
+        if event.operation == "park":
+            vehicle = Vehicle(event.plate_number, event.size)
+            result, latency = timed(
+                parking_system.park, vehicle, event.entry_point, event.time
+            )
+            park_latencies.append(latency)
+            if isinstance(result, ParkingError):
+                rejected += 1
+            else:
+                parked.add(event.plate_number)
+        elif event.plate_number in parked:
+            parked.remove(event.plate_number)
+            _, latency = timed(parking_system.unpark, event.plate_number, event.time)
+            unpark_latencies.append(latency)
+
+    # Lookups against the final state, which leaves the lot as it is
+    rng = random.Random(seed)
+    nearest_latencies = []
+    for _ in range(min(arrivals, 10_000)):
+        _, latency = timed(
+            parking_system.get_nearest_slot,
+            rng.randrange(len(Size)),
+            rng.randrange(entry_points),
+        )
+        nearest_latencies.append(latency)
+
+    # Recomputing the charge of every continuous rate chain from its logs
+    charge_latencies = []
+    chain_lengths = []
+    for vehicle in parking_system.iter_vehicles():
+        if vehicle.is_parked:
+            continue
+        _, latency = timed(parking_system._get_charge, vehicle.parking_logs)
+        charge_latencies.append(latency)
+        chain_lengths.append(len(vehicle.parking_logs))
+
+    return dict(
+        benchmark="model",
+        slots=slots,
+        entry_points=entry_points,
+        arrivals=arrivals,
+        build_seconds=build_seconds,
+        rejected=rejected,
+        park=summarize(park_latencies),
+        unpark=summarize(unpark_latencies),
+        get_nearest_slot=summarize(nearest_latencies),
+        get_charge=dict(
+            summarize(charge_latencies),
+            max_chain_length=max(chain_lengths, default=0),
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--arrivals", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = run(args.slots, args.entry_points, args.arrivals, args.seed)
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
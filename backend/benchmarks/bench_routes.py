@@ -0,0 +1,129 @@
+# Latency of the parking routes through the Flask test client, replaying a
+# synthetic gate trace
+#
+#   python -m benchmarks.bench_routes --slots 10000 --entry-points 10
+import argparse
+import datetime
+import importlib
+import time
+
+from backend import create_app
+
+from .common import emit, environment, generate_lot, generate_trace, summarize
+
+# The controllers package exports the blueprint under the module's name
+parking_controller = importlib.import_module("backend.controllers.parking")
+
+
+def _time_args(timestamp: float) -> list:
+    # The routes take times as datetime arguments
+    value = datetime.datetime.fromtimestamp(timestamp)
+    return [
+        value.year,
+        value.month,
+        value.day,
+        value.hour,
+        value.minute,
+        value.second,
+        value.microsecond,
+    ]
+
+
+def _request(latencies: list, method, *args, **kwargs):
+    start = time.perf_counter()
+    response = method(*args, **kwargs)
+    latencies.append(time.perf_counter() - start)
+    return response
+
+
+def run(slots: int, entry_points: int, arrivals: int, seed: int = 0):
+    lot = generate_lot(slots, entry_points, seed)
+
+    # Routes serve the process-wide parking system, start from a fresh one
+    parking_controller.parking_system = None
+    client = create_app().test_client()
+
+    init_latencies = []
+    response = _request(
+        init_latencies,
+        client.post,
+        "/parking/init",
+        json=dict(entry_points=entry_points, slots=lot.slots, sizes=lot.sizes),
+    )
+    assert response.status_code == 201, response.data
+
+    park_latencies = []
+    unpark_latencies = []
+    availability_latencies = []
+    parked = set()
+    for i, event in enumerate(generate_trace(lot, arrivals, seed)):
+        if event.operation == "park":
+            response = _request(
+                park_latencies,
+                client.post,
+                "/parking/park",
+                json=dict(
+                    plate_number=event.plate_number,
+                    size=event.size,
+                    entry_point=event.entry_point,
+                    time_parked=_time_args(event.time),
+                ),
+            )
+            if response.status_code == 200:
+                parked.add(event.plate_number)
+        elif event.plate_number in parked:
+            parked.remove(event.plate_number)
+            _request(
+                unpark_latencies,
+                client.post,
+                "/parking/unpark",
+                json=dict(
+                    plate_number=event.plate_number,
+                    time_unparked=_time_args(event.time),
+                ),
+            )
+
+        if i % 10 == 0:
+            _request(
+                availability_latencies,
+                client.get,
+                f"/parking/availability?size={event.size}"
+                f"&entry_point={event.entry_point}",
+            )
+
+    slots_latencies = []
+    vehicles_latencies = []
+    for _ in range(20):
+        _request(slots_latencies, client.get, "/parking/slots")
+        _request(vehicles_latencies, client.get, "/parking/vehicles")
+
+    parking_controller.parking_system = None
+    return dict(
+        benchmark="routes",
+        slots=slots,
+        entry_points=entry_points,
+        arrivals=arrivals,
+        init=summarize(init_latencies),
+        park=summarize(park_latencies),
+        unpark=summarize(unpark_latencies),
+        availability=summarize(availability_latencies),
+        get_slots=summarize(slots_latencies),
+        get_vehicles=summarize(vehicles_latencies),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--arrivals", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = run(args.slots, args.entry_points, args.arrivals, args.seed)
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
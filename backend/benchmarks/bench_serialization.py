@@ -0,0 +1,184 @@
+# Per-route micro-benchmarks of request decoding and response encoding:
+# latency of each route through the Flask test client with the stdlib JSON
+# backend, orjson and msgpack (the last two when installed), and the time to
+# encode the route's response alone, against dataclasses.asdict encoding.
+#
+#   python -m benchmarks.bench_serialization --slots 10000 --repeat 2000
+import argparse
+import dataclasses
+import importlib
+import json
+import time
+
+from backend import create_app
+from backend.controllers import encoding
+from backend.models.parking import Vehicle
+
+from .common import emit, environment, generate_lot, summarize
+
+parking_controller = importlib.import_module("backend.controllers.parking")
+
+# Items of the listing pages
+PAGE_LIMIT = 100
+ROUTES = ("park", "unpark", "availability", "slots", "vehicles")
+
+
+class _AsdictEncoder(json.JSONEncoder):
+    # Encoder of the routes before the compiled encoders, as a baseline
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        return o.asdict()
+
+
+def _modes():
+    # (name, orjson module or None, Accept header)
+    modes = [("json", None, None)]
+    if encoding.orjson is not None:
+        modes.append(("orjson", encoding.orjson, None))
+    if encoding.msgpack is not None:
+        modes.append(("msgpack", encoding.orjson, encoding.MSGPACK_TYPE))
+    return modes
+
+
+def _payloads(parking_system) -> dict:
+    # Responses of the routes, as the routes build them
+    def page(items, fields):
+        return [{field: getattr(item, field) for field in fields} for item in items]
+
+    return dict(
+        park=dict(location=parking_system.get_slots()[0].location),
+        unpark=dict(charge=40),
+        availability=dict(
+            size=0,
+            entry_point=0,
+            vacant=parking_system.count_vacant(0, 0),
+            vacant_by_size=parking_system.get_vacant_counts(0),
+        ),
+        slots=dict(
+            slots=page(
+                parking_system.iter_slots(0, PAGE_LIMIT), parking_controller.SLOT_FIELDS
+            ),
+            next_cursor=PAGE_LIMIT,
+        ),
+        vehicles=dict(
+            vehicles=page(
+                parking_system.iter_vehicles(0, PAGE_LIMIT),
+                parking_controller.VEHICLE_FIELDS,
+            ),
+            next_cursor=PAGE_LIMIT,
+        ),
+    )
+
+
+def _time_encode(function, payload, repeat: int) -> list:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(payload)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _time_routes(client, entry_points: int, repeat: int, accept) -> dict:
+    headers = {} if accept is None else {"Accept": accept}
+    routes = {name: [] for name in ROUTES}
+
+    def request(name, method, *args, **kwargs):
+        start = time.perf_counter()
+        response = method(*args, headers=headers, **kwargs)
+        # Listings are streamed, read them to encode them
+        response.get_data()
+        routes[name].append(time.perf_counter() - start)
+        return response
+
+    for i in range(repeat):
+        plate_number = f"BENCH-{i}"
+        request(
+            "park",
+            client.post,
+            "/parking/park",
+            json=dict(plate_number=plate_number, size=0, entry_point=i % entry_points),
+        )
+        request(
+            "unpark",
+            client.post,
+            "/parking/unpark",
+            json=dict(plate_number=plate_number),
+        )
+        request("availability", client.get, "/parking/availability?size=0")
+        request("slots", client.get, f"/parking/slots?limit={PAGE_LIMIT}")
+        request("vehicles", client.get, f"/parking/vehicles?limit={PAGE_LIMIT}")
+    return {name: summarize(latencies) for name, latencies in routes.items()}
+
+
+def run(slots: int, entry_points: int, repeat: int, seed: int = 0) -> dict:
+    lot = generate_lot(slots, entry_points, seed)
+
+    parking_controller.parking_system = None
+    client = create_app().test_client()
+    response = client.post(
+        "/parking/init",
+        json=dict(entry_points=entry_points, slots=lot.slots, sizes=lot.sizes),
+    )
+    assert response.status_code == 201, response.data
+    parking_system = parking_controller.parking_system
+    # Vehicles with a few logs each for the vehicle listing
+    for i in range(PAGE_LIMIT):
+        for hour in range(3):
+            parking_system.park(Vehicle(f"LOG-{i}", 0), 0, hour * 7200)
+            parking_system.unpark(f"LOG-{i}", hour * 7200 + 600)
+
+    payloads = _payloads(parking_system)
+    baseline = _AsdictEncoder()
+    encode = {
+        name: dict(
+            asdict=summarize(_time_encode(baseline.encode, payload, repeat)),
+        )
+        for name, payload in payloads.items()
+    }
+
+    routes = {}
+    orjson = encoding.orjson
+    try:
+        for mode, mode_orjson, accept in _modes():
+            encoding.orjson = mode_orjson
+            content_type = accept or encoding.JSON_TYPE
+            for name, payload in payloads.items():
+                encode[name][mode] = summarize(
+                    _time_encode(
+                        lambda data: encoding.encode(data, content_type),
+                        payload,
+                        repeat,
+                    )
+                )
+            routes[mode] = _time_routes(client, entry_points, repeat, accept)
+    finally:
+        encoding.orjson = orjson
+        parking_controller.parking_system = None
+
+    return dict(
+        benchmark="serialization",
+        slots=slots,
+        entry_points=entry_points,
+        repeat=repeat,
+        encode=encode,
+        routes=routes,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = run(args.slots, args.entry_points, args.repeat, args.seed)
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Trace replay throughput of the capacity planning simulator, over traces of
+# growing length, from CSV and from columnar traces. Events per second should
+# stay flat as traces grow.
+#
+#   python -m benchmarks.bench_simulation --slots 10000 --arrivals 50000,200000
+import argparse
+import csv
+import json
+import os
+import tempfile
+
+from backend.models.simulation import TRACE_COLUMNS, run, write_columns
+
+from .common import emit, environment, generate_lot, generate_trace
+
+
+def _ints(value: str):
+    return [int(item) for item in value.split(",")]
+
+
+def run_benchmark(slots: int, entry_points: int, arrivals: int, seed: int = 0):
+    lot = generate_lot(slots, entry_points, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        lot_path = os.path.join(directory, "lot.json")
+        with open(lot_path, "w") as lot_file:
+            json.dump(lot._asdict(), lot_file)
+
+        trace_path = os.path.join(directory, "trace.csv")
+        with open(trace_path, "w", newline="") as trace_file:
+            writer = csv.writer(trace_file)
+            writer.writerow(TRACE_COLUMNS)
+            writer.writerows(generate_trace(lot, arrivals, seed))
+        columns_path = os.path.join(directory, "trace")
+        write_columns(columns_path, generate_trace(lot, arrivals, seed))
+
+        csv_report = run(trace_path, lot_path)
+        columns_report = run(columns_path, lot_path)
+
+    return dict(
+        benchmark="simulation",
+        slots=slots,
+        entry_points=entry_points,
+        events=csv_report.events,
+        rejection_rate=csv_report.rejection_rate,
+        csv_sec=csv_report.elapsed_sec,
+        csv_events_per_sec=csv_report.events / csv_report.elapsed_sec,
+        columns_sec=columns_report.elapsed_sec,
+        columns_events_per_sec=columns_report.events / columns_report.elapsed_sec,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=10_000)
+    parser.add_argument("--entry-points", type=int, default=10)
+    parser.add_argument("--arrivals", type=_ints, default=[25_000, 50_000, 100_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = [
+        run_benchmark(args.slots, args.entry_points, arrivals, args.seed)
+        for arrivals in args.arrivals
+    ]
+    emit(dict(environment=environment(), results=results), args.output)
+
+
+if __name__ == "__main__":
+    main()
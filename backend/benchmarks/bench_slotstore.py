@@ -0,0 +1,63 @@
+# Memory per slot of a ParkingSystem (slot storage and nearest slot index)
+# with the default dict of Slot and with ArraySlotStore.
+#
+#   python -m benchmarks.bench_slotstore --slots 100000 --entry-points 3
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from backend.models.parking import ParkingSystem, Size
+from backend.models.slotstore import ArraySlotStore
+
+from .common import emit, environment
+
+
+def system_memory(entry_points: int, slots, sizes, slot_store=None):
+    start = time.perf_counter()
+    ParkingSystem(entry_points, slots, sizes, slot_store=slot_store)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    parking_system = ParkingSystem(entry_points, slots, sizes, slot_store=slot_store)
+    store_size, _ = tracemalloc.get_traced_memory()
+
+    # Memory of the slot storage alone, without the index
+    del parking_system._index
+    gc.collect()
+    index_free_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(
+        bytes_per_slot=store_size / len(slots),
+        store_bytes_per_slot=index_free_size / len(slots),
+        build_seconds=elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slots", type=int, default=100_000)
+    parser.add_argument("--entry-points", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Location tuples belong to the caller and are not counted
+    slots = [
+        tuple(rng.randint(0, 10_000) for _ in range(args.entry_points))
+        for _ in range(args.slots)
+    ]
+    sizes = [rng.randrange(len(Size)) for _ in slots]
+
+    result = dict(benchmark="slotstore", slots=args.slots)
+    result["dict"] = system_memory(args.entry_points, slots, sizes)
+    result["array"] = system_memory(args.entry_points, slots, sizes, ArraySlotStore)
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Unpark latency with compiled tariff tables, compared with the previous
+# implementation that branched on hard-coded rates.
+#
+#   python -m benchmarks.bench_tariff --vehicles 20000
+import argparse
+import math
+import random
+import time
+
+from backend.models.parking import ParkingSystem, Size, Vehicle
+
+from .common import emit, environment, summarize
+
+
+class LegacyParkingSystem(ParkingSystem):
+    # _accrue_charge as it was before tariffs were pluggable
+    def _accrue_charge(self, billing, current_log):
+        current_start_time = billing.current_start_time
+        if current_start_time is None:
+            current_start_time = current_log.time_parked
+        prev_total_hours_consumed = billing.total_hours_consumed
+        hours_consumed = (current_log.time_unparked - current_start_time) / (
+            self.HOURS_IN_SEC
+        )
+        hours_consumed_ceiled = math.ceil(hours_consumed)
+        total_hours_consumed = prev_total_hours_consumed + hours_consumed_ceiled
+        current_slot = self._log_slot(current_log)
+        hour_rate = self.HOUR_RATES[current_slot.size]
+
+        if total_hours_consumed <= 3:
+            total_charge = 40
+        elif 3 < total_hours_consumed < 24 and prev_total_hours_consumed < 3:
+            total_charge = 40 + ((total_hours_consumed - 3) * hour_rate)
+        elif (
+            total_hours_consumed >= 24 and prev_total_hours_consumed < 24
+        ) or hours_consumed > 24 - (prev_total_hours_consumed % 24):
+            total_charge = (5000 * (total_hours_consumed // 24)) + (
+                hour_rate * (total_hours_consumed % 24)
+            )
+        else:
+            total_charge = billing.total_charge + hours_consumed_ceiled * hour_rate
+
+        remaining_time = (hours_consumed_ceiled - hours_consumed) * self.HOURS_IN_SEC
+        billing.total_hours_consumed = total_hours_consumed
+        billing.total_charge = total_charge
+        billing.current_start_time = current_log.time_unparked + remaining_time
+        return total_charge
+
+
+def unpark_latencies(system_class, vehicles: int, rounds: int, seed: int):
+    rng = random.Random(seed)
+    entry_points = 3
+    slots = [
+        tuple(rng.randint(0, 1000) for _ in range(entry_points))
+        for _ in range(vehicles)
+    ]
+    sizes = [rng.randrange(len(Size)) for _ in slots]
+    parking_system = system_class(entry_points, slots, sizes)
+
+    latencies = []
+    now = 0
+    for _ in range(rounds):
+        for i in range(vehicles):
+            parking_system.park(Vehicle(f"PLT-{i}", Size.SMALL), i % entry_points, now)
+        # Mix of flat, hourly and daily stays, some continuous
+        now += rng.uniform(0, 40) * ParkingSystem.HOURS_IN_SEC
+        for i in range(vehicles):
+            start = time.perf_counter()
+            parking_system.unpark(f"PLT-{i}", now)
+            latencies.append(time.perf_counter() - start)
+        now += rng.uniform(0, 2) * ParkingSystem.HOURS_IN_SEC
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    result = dict(benchmark="tariff", vehicles=args.vehicles, rounds=args.rounds)
+    for name, system_class in (
+        ("legacy", LegacyParkingSystem),
+        ("tariff", ParkingSystem),
+    ):
+        latencies = unpark_latencies(
+            system_class, args.vehicles, args.rounds, args.seed
+        )
+        result[name] = summarize(latencies)
+    emit(dict(environment=environment(), results=[result]), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Synthetic lots, gate traces and latency statistics shared by the benchmarks
+import heapq
+import itertools
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from backend.models.parking import ParkingSystem, Size
+from backend.models.parkingerrs import ParkingError
+
+# Share of slots per size: small, medium, large
+SIZE_WEIGHTS = (0.5, 0.35, 0.15)
+# Start of every trace, 2022-05-29 00:00 UTC
+TRACE_START = 1653782400.0
+
+
+class Lot(NamedTuple):
+    entry_points: int
+    slots: List[tuple]
+    sizes: List[int]
+
+
+class Event(NamedTuple):
+    time: float
+    # "park" or "unpark"
+    operation: str
+    plate_number: str
+    size: int
+    entry_point: int
+
+
+def _perimeter_point(position: int, side: int) -> Tuple[int, int]:
+    # Point at the given distance along the perimeter of a side x side grid
+    edge, offset = divmod(position, side)
+    return [
+        (offset, -1),
+        (side, offset),
+        (side - 1 - offset, side),
+        (-1, side - 1 - offset),
+    ][edge]
+
+
+def generate_lot(slots: int, entry_points: int, seed: int = 0) -> Lot:
+    # Slots on a square grid, entry points spread along its perimeter, and
+    # distances measured along the aisles (Manhattan distance). Slots are
+    # keyed by location, so distances are scaled and offset by the slot
+    # number to keep slots at the same distances apart.
+    rng = random.Random(seed)
+    side = math.ceil(math.sqrt(slots))
+    gates = [
+        _perimeter_point(4 * side * i // entry_points, side)
+        for i in range(entry_points)
+    ]
+
+    locations = []
+    for i in range(slots):
+        x, y = divmod(i, side)
+        locations.append(
+            tuple((abs(x - gx) + abs(y - gy)) * slots + i for gx, gy in gates)
+        )
+    sizes = rng.choices(list(Size), weights=SIZE_WEIGHTS, k=slots)
+    return Lot(entry_points, locations, [int(size) for size in sizes])
+
+
+def generate_trace(
+    lot: Lot,
+    arrivals: int,
+    seed: int = 0,
+    occupancy: float = 0.85,
+    mean_stay_hours: float = 3.0,
+    return_rate: float = 0.1,
+) -> Iterator[Event]:
+    # Events in time order. Arrivals are Poisson, with the rate scaled so that
+    # the lot averages the given occupancy, and stays are lognormal. A share
+    # of vehicles leave and come back within the hour, which bills them at the
+    # continuous rate.
+    rng = random.Random(seed)
+    hours_in_sec = ParkingSystem.HOURS_IN_SEC
+    arrival_rate = occupancy * len(lot.slots) / (mean_stay_hours * hours_in_sec)
+    sigma = 0.8
+    mu = math.log(mean_stay_hours * hours_in_sec) - sigma**2 / 2
+
+    def stay():
+        return rng.lognormvariate(mu, sigma)
+
+    # Departures and returns to come, as (time, sequence, event)
+    pending: List[Tuple[float, int, Event]] = []
+    sequence = itertools.count()
+
+    def schedule(event: Event):
+        heapq.heappush(pending, (event.time, next(sequence), event))
+
+    def due(until: float) -> Iterator[Event]:
+        while pending and pending[0][0] <= until:
+            event = heapq.heappop(pending)[2]
+            yield event
+            if event.operation == "park":
+                schedule(event._replace(time=event.time + stay(), operation="unpark"))
+            elif rng.random() < return_rate:
+                return_time = event.time + rng.uniform(0, hours_in_sec)
+                entry_point = rng.randrange(lot.entry_points)
+                schedule(
+                    event._replace(
+                        time=return_time, operation="park", entry_point=entry_point
+                    )
+                )
+
+    now = TRACE_START
+    for plate_count in range(arrivals):
+        now += rng.expovariate(arrival_rate)
+        yield from due(now)
+
+        size = rng.choices(list(Size), weights=SIZE_WEIGHTS)[0]
+        event = Event(
+            now, "park", f"PLT-{plate_count:07d}", size, rng.randrange(lot.entry_points)
+        )
+        yield event
+        schedule(event._replace(time=now + stay(), operation="unpark"))
+
+    yield from due(math.inf)
+
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None) -> dict:
+    # Latencies in seconds; throughput is over the summed latencies unless
+    # the wall clock time of the run is given
+    if not latencies:
+        return dict(count=0)
+    latencies = sorted(latencies)
+    count = len(latencies)
+    total = sum(latencies) if elapsed is None else elapsed
+    return dict(
+        count=count,
+        p50_us=latencies[count // 2] * 1e6,
+        p99_us=latencies[min(count - 1, int(count * 0.99))] * 1e6,
+        mean_us=sum(latencies) / count * 1e6,
+        ops_per_sec=count / total if total else None,
+    )
+
+
+def timed(function, *args):
+    # (result or raised ParkingError, seconds)
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+    except ParkingError as err:
+        result = err
+    return result, time.perf_counter() - start
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        python=sys.version.split()[0],
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        created=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    )
+
+
+def emit(result: dict, output: Optional[str] = None) -> None:
+    data = json.dumps(result, indent=2 if output else None)
+    if output:
+        with open(output, "w") as output_file:
+            output_file.write(data + "\n")
+    else:
+        print(data)
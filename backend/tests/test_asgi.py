@@ -0,0 +1,312 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from backend import create_app
+from backend.asgi import create_asgi_app
+
+
+async def call(app, method, path, body=None, query=b""):
+    # Minimal ASGI client, returns (status, content type, body)
+    request_body = b"" if body is None else json.dumps(body).encode()
+    received = []
+    messages = []
+
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": request_body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query}
+    await app(scope, receive, send)
+
+    start = messages[0]
+    headers = dict(start["headers"])
+    data = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], headers[b"content-type"].decode(), data
+
+
+def run(app, *requests):
+    async def run_all():
+        try:
+            return await asyncio.gather(*(call(app, *request) for request in requests))
+        finally:
+            await app.close()
+
+    return asyncio.run(run_all())
+
+
+@pytest.fixture()
+def app():
+    return create_asgi_app({"PARKING_METRICS": True})
+
+
+init_body = {
+    "entry_points": 3,
+    "slots": [[1, 2, 3], [2, 3, 5], [0, 1, 4]],
+    "sizes": [0, 2, 1],
+}
+
+
+def test_not_initialized(app):
+    [(status, _, data)] = run(app, ("GET", "/parking/slots"))
+    assert status == 405
+    assert data == b"System not initialized"
+
+
+def test_not_found(app):
+    [(not_found, _, _), (not_allowed, _, _)] = run(
+        app, ("GET", "/parking/nowhere"), ("GET", "/parking/park")
+    )
+    assert not_found == 404
+    assert not_allowed == 405
+
+
+def test_init_park_unpark(app):
+    [(status, _, data)] = run(app, ("POST", "/parking/init", init_body))
+    assert status == 201
+    assert data == b"System initialized"
+
+    [(status, content_type, data)] = run(
+        app,
+        (
+            "POST",
+            "/parking/park",
+            {
+                "plate_number": "ABC-123",
+                "size": 0,
+                "entry_point": 0,
+                "time_parked": [2022, 5, 29, 8, 0, 0],
+            },
+        ),
+    )
+    assert status == 200
+    assert content_type == "application/json"
+    assert json.loads(data) == {"location": [0, 1, 4]}
+
+    # Reads do not wait for the writer, so availability sees the lot before
+    # or after the unpark
+    [already, unpark, availability] = run(
+        app,
+        ("POST", "/parking/init", init_body),
+        (
+            "POST",
+            "/parking/unpark",
+            {"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 9, 30, 0]},
+        ),
+        ("GET", "/parking/availability", None, b"size=1&entry_point=0"),
+    )
+    assert already[0] == 400
+    assert json.loads(unpark[2]) == {"charge": 40}
+    assert json.loads(availability[2])["vacant"] in (1, 2)
+
+    [(_, _, data)] = run(app, ("GET", "/parking/availability", None, b"size=1"))
+    assert json.loads(data)["vacant"] == 2
+
+
+def test_concurrent_parks_are_serialized(app):
+    slots = [[i, 100 - i] for i in range(50)]
+    run(
+        app,
+        (
+            "POST",
+            "/parking/init",
+            {"entry_points": 2, "slots": slots, "sizes": [0] * 50},
+        ),
+    )
+
+    responses = run(
+        app,
+        *[
+            (
+                "POST",
+                "/parking/park",
+                {"plate_number": f"ABC-{i}", "size": 0, "entry_point": i % 2},
+            )
+            for i in range(60)
+        ],
+    )
+    statuses = [status for status, _, _ in responses]
+    assert statuses.count(200) == 50
+    assert statuses.count(503) == 10
+    locations = {
+        tuple(json.loads(data)["location"])
+        for status, _, data in responses
+        if status == 200
+    }
+    assert len(locations) == 50
+
+
+def test_stream_slots(app):
+    run(app, ("POST", "/parking/init", init_body))
+    [(status, _, data), (invalid, _, _)] = run(
+        app,
+        ("GET", "/parking/slots", None, b"limit=2&fields=location"),
+        ("GET", "/parking/slots", None, b"fields=plate_number"),
+    )
+    assert status == 200
+    assert json.loads(data) == {
+        "slots": [{"location": [1, 2, 3]}, {"location": [2, 3, 5]}],
+        "next_cursor": 2,
+    }
+    assert invalid == 400
+
+
+def test_batch(app):
+    run(app, ("POST", "/parking/init", init_body))
+    [(status, _, data)] = run(
+        app,
+        (
+            "POST",
+            "/parking/park/batch",
+            {
+                "vehicles": [
+                    {"plate_number": "A", "size": 0, "entry_point": 0},
+                    {"plate_number": "B", "size": 5, "entry_point": 0},
+                    {"plate_number": "A", "size": 0, "entry_point": 0},
+                ]
+            },
+        ),
+    )
+    assert status == 200
+    results = json.loads(data)["results"]
+    assert results[0] == {"location": [0, 1, 4]}
+    assert results[1]["status"] == 400
+    assert results[2] == {"error": "Vehicle already parked.", "status": 400}
+
+
+def test_metrics(app):
+    run(app, ("POST", "/parking/init", init_body))
+    [(status, _, data)] = run(app, ("GET", "/parking/metrics"))
+    assert status == 200
+    assert (
+        'parking_request_seconds_count{route="parking.init_parking"} 1' in data.decode()
+    )
+
+
+def test_hold(app):
+    run(app, ("POST", "/parking/init", init_body))
+    [(status, _, data)] = run(
+        app, ("POST", "/parking/hold", {"size": 0, "entry_point": 0, "minutes": 15})
+    )
+    assert status == 200
+    hold = json.loads(data)
+    assert hold["location"] == [0, 1, 4]
+
+    [park, cancel] = run(
+        app,
+        (
+            "POST",
+            "/parking/park",
+            {"plate_number": "ABC-123", "size": 0, "hold_id": hold["hold_id"]},
+        ),
+        ("POST", "/parking/hold/cancel", {"hold_id": hold["hold_id"]}),
+    )
+    assert json.loads(park[2]) == {"location": [0, 1, 4]}
+    assert cancel[0] == 400
+    assert cancel[2] == b"Hold does not exist."
+
+
+def test_hold_expires(app):
+    run(app, ("POST", "/parking/init", init_body))
+    hold = {"size": 0, "entry_point": 0, "minutes": 15, "time_held": [2022, 5, 29]}
+    [_, (status, _, data)] = run(
+        app, ("POST", "/parking/hold", hold), ("GET", "/parking/availability")
+    )
+    assert status == 200
+    assert json.loads(data)["vacant"] == 3
+
+
+def test_events():
+    app = create_asgi_app({"PARKING_EVENTS_CAPACITY": 16})
+    run(app, ("POST", "/parking/init", init_body))
+
+    # The long poll returns once the park is done
+    [(status, _, data), _] = run(
+        app,
+        ("GET", "/parking/events", None, b"since=0&wait=5"),
+        (
+            "POST",
+            "/parking/park",
+            {"plate_number": "ABC-123", "size": 0, "entry_point": 0},
+        ),
+    )
+    assert status == 200
+    page = json.loads(data)
+    assert page["seq"] == 1
+    assert [event["type"] for event in page["events"]] == ["park"]
+
+
+def test_archive(tmp_path):
+    app = create_asgi_app({"PARKING_ARCHIVE_DIR": str(tmp_path)})
+    run(app, ("POST", "/parking/init", init_body))
+    run(
+        app,
+        (
+            "POST",
+            "/parking/park",
+            {"plate_number": "ABC-123", "size": 0, "entry_point": 0},
+        ),
+    )
+    run(app, ("POST", "/parking/unpark", {"plate_number": "ABC-123"}))
+
+    [(status, _, data)] = run(
+        app, ("GET", "/parking/revenue", None, b"start=0&end=1e12")
+    )
+    assert status == 200
+    assert json.loads(data)["revenue"] == 40
+    [(status, _, data)] = run(
+        app, ("GET", "/parking/history", None, b"plate_number=ABC-123")
+    )
+    assert [log["charge"] for log in json.loads(data)["parking_logs"]] == [40]
+    # Flushed on close
+    assert os.listdir(tmp_path) != []
+
+
+def test_same_as_flask(monkeypatch):
+    # Both frontends answer through backend.controllers.routes
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    client = create_app().test_client()
+    app = create_asgi_app()
+
+    time = [2022, 5, 29, 8, 0, 0]
+    park = {"plate_number": "ABC-123", "size": 0, "entry_point": 0, "time_parked": time}
+    hold = {"size": 0, "entry_point": 0, "minutes": 5, "time_held": time}
+    requests = [
+        ("POST", "/parking/init", init_body),
+        ("POST", "/parking/park", dict(park, size=3)),
+        ("POST", "/parking/park", {"plate_number": "ABC-123"}),
+        ("POST", "/parking/unpark", {"plate_number": "ABC-123", "time_unparked": 5}),
+        ("POST", "/parking/park", park),
+        ("POST", "/parking/park", park),
+        ("GET", "/parking/availability", None, b"entry_point=7"),
+        ("GET", "/parking/availability", None, b"size=x"),
+        ("GET", "/parking/availability", None, b"size=1&entry_point="),
+        ("POST", "/parking/hold", dict(hold, minutes="x")),
+        ("POST", "/parking/hold", hold),
+        ("POST", "/parking/hold/cancel", {"hold_id": 9}),
+        ("POST", "/parking/slots/update", {"updates": {"x": [0, 0, 0]}}),
+        ("POST", "/parking/slots/update", {"updates": {"2": [0, 0, 9]}}),
+        ("POST", "/parking/unpark", {"plate_number": "XYZ-123"}),
+        ("POST", "/parking/park/batch", {"vehicles": [dict(park, size=5), park]}),
+        ("POST", "/parking/unpark/batch", {"vehicles": [{"plate_number": "ABC-123"}]}),
+    ]
+    for method, path, body, *query in requests:
+        response = client.open(
+            path,
+            method=method,
+            json=body,
+            query_string=query[0].decode() if query else None,
+        )
+        [(status, content_type, data)] = run(app, (method, path, body, *query))
+        assert (status, content_type) == (response.status_code, response.content_type)
+        if content_type == "application/json":
+            assert json.loads(data) == response.json
+        else:
+            assert data == response.data
@@ -1,8 +1,13 @@
+import datetime
 import json
+import sys
 
 import pytest
 
 from backend import create_app
+from backend.models.archive import LogArchive
+from backend.models.events import EventLog
+from backend.models.metrics import Metrics
 
 
 @pytest.fixture()
@@ -30,6 +35,30 @@ def test_init_invalid_size_error(client):
     assert response.data.decode() == "Invalid slot size"
 
 
+def test_init_invalid_tariff_error(client):
+    response = client.post(
+        "/parking/init",
+        json={
+            "entry_points": 3,
+            "slots": [[1, 2, 3]],
+            "sizes": [0],
+            "tariff": {"flat_rate": 50, "hour_rates": [10, 20]},
+        },
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid tariff hour_rates"
+
+
+@pytest.mark.parametrize("tariff", [[50, 3], "cheap", {"daily_rate": True}])
+def test_init_malformed_tariff_error(client, tariff):
+    response = client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3]], "sizes": [0], "tariff": tariff},
+    )
+    assert response.status_code == 400
+    assert response.data.decode().startswith("Invalid tariff")
+
+
 def test_init(client):
     response = client.post(
         "/parking/init", json={"entry_points": 3, "slots": [[1, 2, 3]], "sizes": [0]}
@@ -90,6 +119,66 @@ def test_get_vehicles(client):
     assert len(data["vehicles"]) == 1
 
 
+def test_get_slots_page(client):
+    response = client.get("/parking/slots?limit=0")
+    data = json.loads(response.data.decode())
+    assert data == {"slots": [], "next_cursor": 0}
+
+    response = client.get("/parking/slots?cursor=0&limit=1&fields=location")
+    data = json.loads(response.data.decode())
+    assert data == {"slots": [{"location": [1, 2, 3]}], "next_cursor": None}
+
+
+def test_get_vehicles_fields(client):
+    response = client.get("/parking/vehicles?fields=plate_number,is_parked")
+
+    data = json.loads(response.data.decode())
+    assert data["vehicles"] == [{"plate_number": "ABC-123", "is_parked": True}]
+
+
+def test_get_vehicles_invalid_fields(client):
+    response = client.get("/parking/vehicles?fields=plate_number,password")
+
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid cursor, limit or fields"
+
+
+def test_availability(client):
+    response = client.get("/parking/availability?size=0&entry_point=0")
+
+    data = json.loads(response.data.decode())
+    assert data == {
+        "size": 0,
+        "entry_point": 0,
+        "vacant": 0,
+        "vacant_by_size": [0, 0, 0],
+    }
+
+
+def test_availability_invalid_entry_point(client):
+    response = client.get("/parking/availability?entry_point=3")
+
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid entry point."
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ("size=x", "Invalid vehicle size"),
+        ("size=", "Invalid vehicle size"),
+        ("entry_point=x", "Invalid entry point."),
+        ("size=1&entry_point=", "Invalid entry point."),
+    ],
+)
+def test_availability_malformed_args(client, query, message):
+    # Rejected rather than answered for the default size or every zone
+    response = client.get(f"/parking/availability?{query}")
+
+    assert response.status_code == 400
+    assert response.data.decode() == message
+
+
 def test_alread_parked_error(client):
     response = client.post(
         "parking/park", json={"plate_number": "ABC-123", "size": 0, "entry_point": 0}
@@ -132,3 +221,330 @@ def test_unpark_error(client):
 
     assert response.status_code == 400
     assert response.data.decode() == "Vehicle not parked."
+
+
+def test_park_batch(client):
+    response = client.post(
+        "parking/park/batch",
+        json={
+            "vehicles": [
+                {
+                    "plate_number": "ABC-123",
+                    "size": 0,
+                    "entry_point": 0,
+                    "time_parked": [2022, 5, 29, 21, 0],
+                },
+                {"plate_number": "BCD-234", "size": 0, "entry_point": 0},
+                {"plate_number": "CDE-345", "size": 3, "entry_point": 0},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    data = json.loads(response.data.decode())
+    assert data["results"] == [
+        {"location": [1, 2, 3]},
+        {"error": "No slots available.", "status": 503},
+        {"error": "Invalid vehicle size", "status": 400},
+    ]
+
+
+def test_unpark_batch(client):
+    response = client.post(
+        "parking/unpark/batch",
+        json={
+            "vehicles": [
+                {"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 22, 0]},
+                {"plate_number": "BCD-234"},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    data = json.loads(response.data.decode())
+    assert data["results"] == [
+        {"charge": 20},
+        {"error": "Vehicle not parked.", "status": 400},
+    ]
+
+
+def test_batch_errors(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+    client.post(
+        "/parking/park",
+        json={
+            "plate_number": "ABC-123",
+            "size": 0,
+            "entry_point": 0,
+            "time_parked": [2022, 5, 29, 21, 0],
+        },
+    )
+
+    response = client.post(
+        "parking/unpark/batch",
+        json={
+            "vehicles": [
+                {"plate_number": 123},
+                {"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 20, 0]},
+                {"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 22, 0]},
+            ]
+        },
+    )
+    assert response.json["results"] == [
+        {"error": "Invalid plate number.", "status": 400},
+        {"error": "Unparked before the last park.", "status": 400},
+        {"charge": 40},
+    ]
+
+    response = client.post(
+        "parking/park/batch",
+        json={
+            "vehicles": [
+                {"plate_number": ["ABC-123"], "size": 0, "entry_point": 0},
+                {"plate_number": "ABC-123", "size": [0], "entry_point": 0},
+                {
+                    "plate_number": "ABC-123",
+                    "size": 0,
+                    "entry_point": 0,
+                    "time_parked": [2022, 5, 29, 21, 0],
+                },
+            ]
+        },
+    )
+    assert response.json["results"] == [
+        {"error": "Invalid plate number.", "status": 400},
+        {"error": "Invalid vehicle size", "status": 400},
+        {"error": "Parked before the last unpark.", "status": 400},
+    ]
+
+
+def test_metrics_not_enabled(client):
+    response = client.get("/parking/metrics")
+    assert response.status_code == 404
+
+
+def test_metrics(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "metrics", Metrics())
+
+    client.get("/parking/availability")
+    response = client.get("/parking/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    lines = response.data.decode().splitlines()
+    assert 'parking_request_seconds_count{route="parking.get_availability"} 1' in lines
+    assert 'parking_encode_seconds_count{route="parking.get_availability"} 1' in lines
+
+
+def test_update_slots(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+
+    response = client.post(
+        "/parking/slots/update",
+        json={"entry_points": 4, "updates": {"0": [1, 2, 3, 9], "1": [2, 3, 5, 0]}},
+    )
+    assert response.status_code == 200
+    response = client.post(
+        "parking/park", json={"plate_number": "ABC-123", "size": 0, "entry_point": 3}
+    )
+    assert response.json == {"location": [2, 3, 5, 0]}
+
+    response = client.post(
+        "/parking/slots/update", json={"updates": {"2": [0, 0, 0, 0]}}
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Slot does not exist."
+
+    response = client.post(
+        "/parking/slots/update", json={"updates": {"0": [2, 3, 5, 0]}}
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Duplicate slot location"
+
+
+def test_hold(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+
+    response = client.post(
+        "/parking/hold",
+        json={
+            "size": 0,
+            "entry_point": 0,
+            "minutes": 15,
+            "time_held": [2022, 5, 29, 0, 0],
+        },
+    )
+    assert response.status_code == 200
+    hold = response.json
+    assert hold["location"] == [1, 2, 3]
+    assert hold["expires_at"] == datetime.datetime(2022, 5, 29, 0, 15).timestamp()
+
+    response = client.post(
+        "/parking/hold", json={"size": 0, "entry_point": 0, "minutes": "15"}
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid hold duration"
+
+    response = client.post(
+        "/parking/park",
+        json={
+            "plate_number": "ABC-123",
+            "size": 0,
+            "hold_id": hold["hold_id"],
+            "time_parked": [2022, 5, 29, 0, 10],
+        },
+    )
+    assert response.json == {"location": [1, 2, 3]}
+
+    response = client.post("/parking/hold/cancel", json={"hold_id": hold["hold_id"]})
+    assert response.status_code == 400
+    assert response.data.decode() == "Hold does not exist."
+
+
+def test_hold_expires(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+    client.post(
+        "/parking/hold",
+        json={
+            "size": 0,
+            "entry_point": 0,
+            "minutes": 15,
+            "time_held": [2022, 5, 29, 0, 0],
+        },
+    )
+
+    # Long expired, without any park or hold since
+    response = client.get("/parking/availability")
+    assert response.json["vacant"] == 2
+    response = client.get("/parking/slots?fields=is_vacant")
+    assert response.json["slots"] == [{"is_vacant": True}, {"is_vacant": True}]
+
+
+def test_events_not_enabled(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "events", None)
+    response = client.get("/parking/events")
+    assert response.status_code == 404
+
+
+def test_events(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    monkeypatch.setattr(controller, "events", EventLog(capacity=2))
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+
+    response = client.get("/parking/events")
+    assert response.json == {"events": [], "seq": 0}
+
+    client.post(
+        "/parking/park", json={"plate_number": "ABC-123", "size": 0, "entry_point": 0}
+    )
+    response = client.get("/parking/events?since=0&wait=1")
+    assert response.status_code == 200
+    assert response.json["seq"] == 1
+    [event] = response.json["events"]
+    assert event["type"] == "park"
+    assert event["location"] == [1, 2, 3]
+    assert event["plate_number"] == "ABC-123"
+
+    response = client.get("/parking/events?since=1")
+    assert response.json == {"events": [], "seq": 1}
+
+    client.post("/parking/unpark", json={"plate_number": "ABC-123"})
+    client.post(
+        "/parking/park", json={"plate_number": "ABC-123", "size": 0, "entry_point": 0}
+    )
+    response = client.get("/parking/events?since=0")
+    assert response.status_code == 410
+    assert response.json["seq"] == 3
+
+    response = client.get("/parking/events?since=-1")
+    assert response.status_code == 400
+
+
+def test_archive(client, monkeypatch, tmp_path):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    monkeypatch.setattr(controller, "archive", LogArchive(str(tmp_path)))
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+    client.post(
+        "/parking/park",
+        json={
+            "plate_number": "ABC-123",
+            "size": 0,
+            "entry_point": 0,
+            "time_parked": [2022, 5, 29, 0, 0],
+        },
+    )
+    client.post(
+        "/parking/unpark",
+        json={"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 1, 0]},
+    )
+
+    start = datetime.datetime(2022, 5, 29).timestamp()
+    response = client.get(f"/parking/revenue?start={start}&end={start + 86400}")
+    assert response.status_code == 200
+    assert response.json["revenue"] == 40
+    response = client.get(f"/parking/revenue?start={start}&end={start}&size=0")
+    assert response.json["revenue"] == 0
+    response = client.get(f"/parking/revenue?start={start}&end=x")
+    assert response.status_code == 400
+
+    response = client.get("/parking/history?plate_number=ABC-123")
+    [log] = response.json["parking_logs"]
+    assert log["charge"] == 40
+    assert log["time_parked"] == start
+
+
+def test_archive_not_enabled(client, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "archive", None)
+    assert client.get("/parking/revenue?start=0&end=1").status_code == 404
+    assert client.get("/parking/history?plate_number=ABC-123").status_code == 404
+
+
+def test_shared_memory_unsupported(app, monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    app.config.update(
+        {
+            "PARKING_SHARED_MEMORY": "parking-test-unsupported",
+            "PARKING_EVICT_IDLE": True,
+            "PARKING_ALLOCATION_STRATEGY": "zone_balance",
+        }
+    )
+    # Rejected when the app starts, before any segment is attached
+    with pytest.raises(ValueError) as exc_info:
+        controller.restore_parking_system(app.config)
+    assert str(exc_info.value) == (
+        "Not supported with PARKING_SHARED_MEMORY: "
+        "PARKING_EVICT_IDLE, PARKING_ALLOCATION_STRATEGY"
+    )
+    assert controller.parking_system is None
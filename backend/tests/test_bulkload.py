@@ -0,0 +1,99 @@
+import io
+import json
+import sys
+
+import pytest
+
+from backend import create_app
+
+np = pytest.importorskip("numpy")
+
+distances = np.array([[1, 2, 3], [2, 3, 5], [0, 1, 4]])
+sizes = np.array([0, 2, 1])
+tariff = {"flat_rate": 50, "flat_hours": 2, "hour_rates": [30, 70, 120]}
+
+
+@pytest.fixture()
+def app(monkeypatch, tmp_path):
+    # Each test initializes a fresh system
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    app = create_app()
+    app.config.update({"TESTING": True, "PARKING_BULK_LOAD_DIR": str(tmp_path)})
+    yield app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+def _npz(**arrays) -> bytes:
+    data = io.BytesIO()
+    np.savez(data, **arrays)
+    return data.getvalue()
+
+
+def _npy(array) -> io.BytesIO:
+    data = io.BytesIO()
+    np.save(data, array)
+    data.seek(0)
+    return data
+
+
+def test_init_npz_body(client):
+    response = client.post(
+        "/parking/init",
+        data=_npz(distances=distances, sizes=sizes),
+        content_type="application/octet-stream",
+    )
+    assert response.status_code == 201
+
+    response = client.get("/parking/slots")
+    assert [slot["location"] for slot in response.json["slots"]] == distances.tolist()
+
+
+def test_init_npy_files(client):
+    response = client.post(
+        "/parking/init",
+        data={
+            "distances": (_npy(distances), "distances.npy"),
+            "sizes": (_npy(sizes), "sizes.npy"),
+            "tariff": json.dumps(tariff),
+        },
+    )
+    assert response.status_code == 201
+
+    response = client.post(
+        "/parking/park",
+        json={"plate_number": "ABC", "size": 1, "entry_point": 0},
+    )
+    assert response.status_code == 200
+    assert response.json["location"] == [0, 1, 4]
+
+
+def test_init_file(client, tmp_path):
+    np.savez(tmp_path / "lot.npz", distances=distances, sizes=sizes)
+    response = client.post("/parking/init", json={"file": "lot.npz"})
+    assert response.status_code == 201
+
+
+def test_init_file_outside_dir(client):
+    response = client.post("/parking/init", json={"file": "../lot.npz"})
+    assert response.status_code == 403
+
+
+def test_init_invalid_file(client):
+    response = client.post(
+        "/parking/init", data=b"not a lot", content_type="application/octet-stream"
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid lot file"
+
+    response = client.post(
+        "/parking/init",
+        data=_npz(distances=distances, sizes=np.array([0, 3, 1])),
+        content_type="application/octet-stream",
+    )
+    assert response.status_code == 400
+    assert response.data.decode() == "Invalid slot size"
@@ -0,0 +1,147 @@
+import dataclasses
+import json
+import sys
+
+import pytest
+
+from backend import create_app
+from backend.controllers import encoding
+from backend.models.parking import ParkingLog, Size, Vehicle
+from backend.models.slotstore import ArraySlotStore
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    app = create_app()
+    app.config.update({"TESTING": True})
+    client = app.test_client()
+    client.post(
+        "/parking/init",
+        json={"entry_points": 3, "slots": [[1, 2, 3], [2, 3, 5]], "sizes": [0, 2]},
+    )
+    return client
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    # Both JSON backends, whether or not orjson is installed
+    if request.param == "json":
+        monkeypatch.setattr(encoding, "orjson", None)
+    elif encoding.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+
+def _vehicle() -> Vehicle:
+    vehicle = Vehicle("ABC-123", Size.MEDIUM)
+    vehicle.add_log(ParkingLog(time_parked=0.5, slot_location=(1, 2), slot_id=0))
+    vehicle.add_log(
+        ParkingLog(
+            time_parked=2.0,
+            slot_location=(2, 3),
+            slot_id=1,
+            time_unparked=3.0,
+            charge=40,
+        )
+    )
+    return vehicle
+
+
+def test_encode_dataclasses(backend):
+    vehicle = _vehicle()
+    data = dict(vehicles=[vehicle], count=1)
+    assert json.loads(encoding.dumps(data)) == json.loads(
+        json.dumps(dict(vehicles=[dataclasses.asdict(vehicle)], count=1))
+    )
+
+    store = ArraySlotStore(2, [(1, 2), (2, 3)], [0, 1])
+    assert json.loads(encoding.dumps(store[1])) == dict(
+        location=[2, 3], size=1, is_vacant=True, id=1
+    )
+    with pytest.raises(TypeError):
+        encoding.dumps(object())
+
+
+def test_compile_encoder():
+    encode = encoding.compile_encoder(ParkingLog)
+    log = _vehicle().parking_logs[-1]
+    # Fields as they are, nested values are not copied
+    assert encode(log) == vars(log)
+    assert encode(log)["slot_location"] is log.slot_location
+
+
+@pytest.mark.parametrize(
+    "accept, content_type",
+    [
+        (None, encoding.JSON_TYPE),
+        ("application/json", encoding.JSON_TYPE),
+        ("application/msgpack", encoding.MSGPACK_TYPE),
+        ("application/x-msgpack, application/json;q=0.5", encoding.MSGPACK_TYPE),
+        ("application/msgpack;q=0.5, */*", encoding.JSON_TYPE),
+        ("application/msgpack;q=0", encoding.JSON_TYPE),
+    ],
+)
+def test_negotiate(monkeypatch, accept, content_type):
+    monkeypatch.setattr(encoding, "msgpack", object())
+    assert encoding.negotiate(accept) == content_type
+
+
+def test_negotiate_without_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack", None)
+    assert encoding.negotiate("application/msgpack") == encoding.JSON_TYPE
+
+
+def test_routes(client, backend):
+    response = client.post(
+        "/parking/park", json={"plate_number": "ABC-123", "size": 0, "entry_point": 0}
+    )
+    assert response.json == {"location": [1, 2, 3]}
+    client.post(
+        "/parking/park", json={"plate_number": "XYZ-789", "size": 0, "entry_point": 0}
+    )
+
+    response = client.get("/parking/vehicles?limit=1")
+    assert response.json["next_cursor"] == 1
+    [vehicle] = response.json["vehicles"]
+    assert vehicle["plate_number"] == "ABC-123"
+    assert vehicle["parking_logs"][0]["slot_location"] == [1, 2, 3]
+    response = client.get("/parking/vehicles?cursor=1")
+    assert response.json["next_cursor"] is None
+    assert len(response.json["vehicles"]) == 1
+
+    response = client.post(
+        "/parking/unpark", data=b"{", content_type=encoding.JSON_TYPE
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "route", ["/parking/init", "/parking/park", "/parking/north/init"]
+)
+def test_unsupported_body(client, route):
+    response = client.post(route, data="size=0", content_type="text/plain")
+    assert 400 <= response.status_code < 500
+
+
+def test_msgpack_routes(client):
+    msgpack = pytest.importorskip("msgpack")
+    headers = {"Accept": encoding.MSGPACK_TYPE}
+    response = client.post(
+        "/parking/park",
+        data=msgpack.packb({"plate_number": "ABC-123", "size": 0, "entry_point": 0}),
+        content_type=encoding.MSGPACK_TYPE,
+        headers=headers,
+    )
+    assert response.mimetype == encoding.MSGPACK_TYPE
+    assert msgpack.unpackb(response.data) == {"location": [1, 2, 3]}
+
+    # Pages are streamed as a map per chunk of rows
+    response = client.get("/parking/slots?limit=1", headers=headers)
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(response.data)
+    [chunk, last] = unpacker
+    assert chunk["slots"][0]["id"] == 0
+    assert chunk["slots"][0]["location"] == [1, 2, 3]
+    assert last == {"slots": [], "next_cursor": 1}
@@ -0,0 +1,67 @@
+import sys
+
+import pytest
+
+from backend import create_app
+from backend.controllers import restore_parking_system
+from backend.models.layout import _MappedSlotIndex, write_layout
+
+
+@pytest.fixture()
+def client(monkeypatch, tmp_path):
+    # Serve the lot of a layout file instead of /parking/init
+    path = str(tmp_path / "lot.layout")
+    write_layout(path, 3, [(1, 2, 3), (2, 3, 5), (0, 1, 4)], [0, 2, 1])
+
+    controller = sys.modules["backend.controllers.parking"]
+    monkeypatch.setattr(controller, "parking_system", None)
+    app = create_app()
+    app.config.update({"TESTING": True, "PARKING_LAYOUT_FILE": path})
+    restore_parking_system(app.config)
+    return app.test_client()
+
+
+def test_layout_file(client):
+    response = client.get("/parking/slots")
+    assert [slot["location"] for slot in response.json["slots"]] == [
+        [1, 2, 3],
+        [2, 3, 5],
+        [0, 1, 4],
+    ]
+
+    response = client.post(
+        "/parking/park", json={"plate_number": "ABC", "size": 1, "entry_point": 0}
+    )
+    assert response.status_code == 200
+    assert response.json["location"] == [0, 1, 4]
+
+    response = client.post(
+        "/parking/init", json={"entry_points": 1, "slots": [[1]], "sizes": [0]}
+    )
+    assert response.status_code == 400
+
+
+def test_layout_restart(monkeypatch, tmp_path):
+    # Restarts with a journal keep serving the mapped layout
+    path = str(tmp_path / "lot.layout")
+    write_layout(path, 3, [(1, 2, 3), (2, 3, 5), (0, 1, 4)], [0, 2, 1])
+    controller = sys.modules["backend.controllers.parking"]
+    app = create_app()
+    app.config.update(
+        {
+            "TESTING": True,
+            "PARKING_LAYOUT_FILE": path,
+            "PARKING_DATA_DIR": str(tmp_path / "data"),
+        }
+    )
+
+    for plate_number, location in [("ABC", [0, 1, 4]), ("DEF", [1, 2, 3])]:
+        monkeypatch.setattr(controller, "parking_system", None)
+        restore_parking_system(app.config)
+        assert isinstance(controller.parking_system._index, _MappedSlotIndex)
+        response = app.test_client().post(
+            "/parking/park",
+            json={"plate_number": plate_number, "size": 0, "entry_point": 0},
+        )
+        assert response.json["location"] == location
+        controller.parking_system._journal.close()
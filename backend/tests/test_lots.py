@@ -0,0 +1,179 @@
+import json
+
+import pytest
+
+from backend import create_app
+from backend.controllers.lots import _lot_options
+from backend.models.journal import FsyncPolicy
+from backend.models.slotstore import ArraySlotStore
+
+lot_body = {
+    "entry_points": 3,
+    "slots": [[1, 2, 3], [2, 3, 5], [0, 1, 4]],
+    "sizes": [0, 2, 1],
+}
+
+
+@pytest.fixture()
+def client():
+    app = create_app()
+    app.config.update({"TESTING": True, "PARKING_LOT_WORKERS": 2})
+    return app.test_client()
+
+
+def test_init_lots(client):
+    for lot_id in ("north", "south"):
+        response = client.post(f"/parking/{lot_id}/init", json=lot_body)
+        assert response.status_code == 201
+        assert response.data.decode() == "Lot initialized"
+
+    response = client.post("/parking/north/init", json=lot_body)
+    assert response.status_code == 400
+    assert response.data.decode() == "Lot already initialized"
+
+
+def test_invalid_lot_id(client):
+    for lot_id in ("park", "bad.id"):
+        response = client.post(f"/parking/{lot_id}/init", json=lot_body)
+        assert response.status_code == 404
+
+
+def test_lot_not_initialized(client):
+    response = client.post(
+        "/parking/east/park",
+        json={"plate_number": "ABC-123", "size": 0, "entry_point": 0},
+    )
+    assert response.status_code == 405
+    assert response.data.decode() == "Lot not initialized."
+
+    response = client.get("/parking/east/slots")
+    assert response.status_code == 405
+
+
+def test_lots_are_separate(client):
+    for lot_id in ("north", "south"):
+        response = client.post(
+            f"/parking/{lot_id}/park",
+            json={
+                "plate_number": "ABC-123",
+                "size": 0,
+                "entry_point": 0,
+                "time_parked": [2022, 5, 29, 8, 0, 0],
+            },
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"location": [0, 1, 4]}
+
+    response = client.post(
+        "/parking/north/unpark",
+        json={"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 9, 0, 0]},
+    )
+    assert json.loads(response.data) == {"charge": 40}
+
+    response = client.get("/parking/north/availability?size=1")
+    assert json.loads(response.data)["vacant"] == 2
+    response = client.get("/parking/south/availability?size=1")
+    assert json.loads(response.data)["vacant"] == 1
+
+
+def test_lot_listing(client):
+    response = client.get("/parking/south/slots?limit=2&fields=location,is_vacant")
+    assert response.status_code == 200
+    assert json.loads(response.data) == {
+        "slots": [
+            {"location": [1, 2, 3], "is_vacant": True},
+            {"location": [2, 3, 5], "is_vacant": True},
+        ],
+        "next_cursor": 2,
+    }
+
+    response = client.get("/parking/south/vehicles?fields=plate_number,is_parked")
+    assert json.loads(response.data) == {
+        "vehicles": [{"plate_number": "ABC-123", "is_parked": True}],
+        "next_cursor": None,
+    }
+
+
+def test_lot_batch(client):
+    response = client.post(
+        "/parking/south/unpark/batch",
+        json={
+            "vehicles": [
+                {"plate_number": "ABC-123", "time_unparked": [2022, 5, 29, 9, 0, 0]},
+                {"plate_number": "XYZ-123"},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    results = json.loads(response.data)["results"]
+    assert results[0]["charge"] == 40
+    assert results[1] == {"error": "Vehicle not parked.", "status": 400}
+
+    response = client.post(
+        "/parking/south/park/batch",
+        json={
+            "vehicles": [
+                {"plate_number": "A", "size": 2, "entry_point": 0},
+                {"plate_number": "B", "size": 2, "entry_point": 0},
+            ]
+        },
+    )
+    results = json.loads(response.data)["results"]
+    assert results == [
+        {"location": [2, 3, 5]},
+        {"error": "No slots available.", "status": 503},
+    ]
+
+
+def test_lot_hold(client):
+    client.post("/parking/west/init", json=lot_body)
+    response = client.post(
+        "/parking/west/hold", json={"size": 0, "entry_point": 0, "minutes": 15}
+    )
+    assert response.status_code == 200
+    hold_id = response.json["hold_id"]
+    assert response.json["location"] == [0, 1, 4]
+
+    response = client.post(
+        "/parking/west/park",
+        json={"plate_number": "ABC-123", "size": 0, "hold_id": hold_id},
+    )
+    assert response.json == {"location": [0, 1, 4]}
+
+    response = client.post("/parking/west/hold/cancel", json={"hold_id": hold_id})
+    assert response.status_code == 400
+    assert response.data.decode() == "Hold does not exist."
+
+
+def test_lot_hold_expires(client):
+    client.post("/parking/harbor/init", json=lot_body)
+    client.post(
+        "/parking/harbor/hold",
+        json={"size": 0, "entry_point": 0, "minutes": 15, "time_held": [2022, 5, 29]},
+    )
+    response = client.get("/parking/harbor/availability")
+    assert response.json["vacant"] == 3
+
+
+def test_lot_options():
+    app = create_app()
+    app.config.update(
+        {
+            "PARKING_DATA_DIR": "data",
+            "PARKING_FSYNC_POLICY": "always",
+            "PARKING_COMPACT_SLOTS": True,
+            "PARKING_EVICT_IDLE": True,
+            "PARKING_ALLOCATION_STRATEGY": "best_fit",
+            "PARKING_METRICS": True,
+        }
+    )
+    # Everything the default lot is configured with, but for what stays in
+    # the app process
+    assert _lot_options(app.config) == dict(
+        slot_store=ArraySlotStore,
+        evict_idle=True,
+        strategy="best_fit",
+        data_dir="data/lots",
+        fsync_policy=FsyncPolicy.ALWAYS,
+        snapshot_every=app.config["PARKING_SNAPSHOT_EVERY"],
+    )